@@ -1,39 +1,122 @@
+from __future__ import annotations
 from algosdk import transaction, account
 import algosdk
-from algosdk.v2client import *
-from pyteal import *
-from beaker import *
-from beaker import sandbox
-from beaker.client import ApplicationClient
-from algosdk.transaction import *
-from base64 import b64decode
-from algosdk.logic import *
+from algosdk.transaction import ApplicationCallTxn, ApplicationCreateTxn, AssetOptInTxn, OnComplete, StateSchema, wait_for_confirmation
+from base64 import b64decode, b64encode
+from algosdk.logic import get_application_address
 from algosdk import constants
+from algosdk.error import AlgodHTTPError
+from typing import TYPE_CHECKING
 import unittest
-from algosdk.kmd import KMDClient
+import tempfile
+import shutil
+import random
+import math
+import functools
+import json
+from concurrent.futures import Future
 import time
+import os
+from ArenaSubmitter import PipelinedSubmitter, TxnRejectedError, sendToNode
+from ArenaSigner import SigningPool
+from ArenaCodec import decodeMonsterDirectory, decodeMonsterShards, monsterShardName, packMonsterPositions, encodePath, compressMoves, pathTo, MonsterTable, PlayerTable, decodeLocalState, PLAYER_FIELDS, MONSTER_DIR_NAME, MONSTER_DIR_SIZE, MONSTER_BOX_SIZE, MAX_MONSTERS, MAX_MONSTER_SHARDS, PLAYER_RECORD_SIZE, MAX_MONSTERS_PER_CALL, MAX_PATH_SEGMENTS
+from ArenaCrawler import PlayerBoxCrawler, LocalStateCrawler
+from ArenaFollower import WorldFollower, WorldSnapshot
+from ArenaLeaderboard import Leaderboard
+from ArenaAudit import AssetAuditor, AssetAudit, MANAGER, FREEZE, CLAWBACK
+from ArenaArchive import MappedWorld, WorldRecorder
+from ArenaScheduler import Action, TickScheduler, TickReport, packActions, MAX_TXN_REFERENCES
+from ArenaClients import CompileCache, ReadCache, SuggestedParamsCache, PooledAlgodClient, getAlgodClient, getIndexerClient, getAccounts, getSuggestedParams, getParamsCache, recordConfirmed, waitForIndexer, newPipelinedSubmitter, useNode
+from ArenaTrace import traced, span, confirmed, confirmedLater
+from ArenaEngine import ArenaEngine, ArenaReject, LOCAL_KEYS, STEAL_RANGE_SQ, checkDistInRange, inSafeZone
+from ArenaSpatial import PlayerGrid, GRID_CELL
+from TealEvaluator import TealProgram, TealReject, AppCall, AppState
+from TealProfiler import profile, APP_CALL_BUDGET, MAX_GROUP_SIZE
+import sys
+
+# beaker (and pyteal with it) takes longer to import than everything else here;
+# its SandboxAccount is only named in annotations
+if TYPE_CHECKING:
+    from beaker import sandbox
 
 
 APPROVAL_SRC = os.path.join('contracts', "ApprovalProgram.teal")
 CLEARSTATE_SRC = os.path.join('contracts', "ClearStateProgram.teal")
+TEAL_CACHE_DIR = os.path.join('contracts', ".compiled")
+ARENA_FUNDING = 100000000000
 
+compileCache = CompileCache(TEAL_CACHE_DIR)
 
+
+# compiled once per network and source, then read back from TEAL_CACHE_DIR
 def compileTEAL(client, code):
-    compile_response = client.compile(code)
-    return b64decode(compile_response['result'])
+    return compileCache.compile(client, code, getSuggestedParams().gh)
+
+
+# Every helper below can run blocking (default: waits for confirmation and returns
+# the confirmed info of its last txn) or pipelined (pass a PipelinedSubmitter: the
+# signed txns are queued and a Future resolving to that same info is returned).
+# Under ArenaTrace the submit and each confirmation wait are spans, and the
+# rounds the confirmation took, the fees and inner txns go to the action.
+def sendSigned(client, signedTxns, submitter:PipelinedSubmitter=None):
+    if not isinstance(signedTxns, list):
+        signedTxns = [signedTxns]
+    submittedRound = getParamsCache().knownRound()
+    if submitter is not None:
+        with span("submit"):
+            future = submitter.submit(signedTxns)
+        confirmedLater(future, signedTxns, submittedRound)
+        return future
+
+    with span("submit"):
+        sendToNode(client, signedTxns)
+    for t in signedTxns:
+        with span("confirm"):
+            txnOut = wait_for_confirmation(client, t.get_txid())
+    recordConfirmed(txnOut, signedTxns)
+    confirmed(txnOut, signedTxns, submittedRound)
+    return txnOut
+
+
+# a txn or a list of them, signed with one key
+def signTxns(txns, privateKey):
+    with span("sign"):
+        if isinstance(txns, list):
+            return [t.sign(privateKey) for t in txns]
+        return txns.sign(privateKey)
+
 
+# identical calls (e.g. two "UP" moves) in flight at once would share a txid
+def pipelineNote(submitter:PipelinedSubmitter=None):
+    return os.urandom(8) if submitter is not None else None
 
-def fundApp(client, sender: sandbox.SandboxAccount, AppAddr: str, Ammount):
-    txn = transaction.PaymentTxn(sender.address, sp=client.suggested_params(), receiver=AppAddr, amt=Ammount)
+
+# the same for the calls of one walk: two chunks of the same moves in its
+# group would share a txid too, submitter or not
+def walkNote(submitter:PipelinedSubmitter, calls):
+    return os.urandom(8) if calls > 1 else pipelineNote(submitter)
+
+
+def fundApp(client, sender: sandbox.SandboxAccount, AppAddr: str, Ammount, submitter:PipelinedSubmitter=None):
+    txn = transaction.PaymentTxn(sender.address, sp=getSuggestedParams(), receiver=AppAddr, amt=Ammount, note=pipelineNote(submitter))
     signedTxn = txn.sign(sender.private_key)
-    txid = client.send_transaction(signedTxn)
-    wait_for_confirmation(client, signedTxn.get_txid())
+    return sendSigned(client, signedTxn, submitter)
+
 
+def DeployAndFundApp(monsterShards=1):
+    return deployArenas(1, monsterShards=monsterShards)[0]
 
-def DeployAndFundApp():
+
+# Deploys count fresh arenas in two rounds, however many there are: the app
+# creates go TX_GROUP_LIMIT to a group, then every new app's funding payment and
+# setup call as one atomic group each, all in flight together. (The payment
+# needs the app's address, which comes from an id only known once the create
+# confirms, so create and fund can't share a group.) Arenas of more than one
+# monster shard take one more round to open the rest.
+def deployArenas(count, funding=ARENA_FUNDING, monsterShards=1):
     # account sender
-    client = sandbox.get_algod_client()
-    accounts = sandbox.get_accounts()
+    client = getAlgodClient()
+    accounts = getAccounts()
 
     sender = accounts[0]
 
@@ -45,83 +128,287 @@ def DeployAndFundApp():
     global_schema = StateSchema(num_uints=2, num_byte_slices=1)
     local_schema = StateSchema(num_uints=4, num_byte_slices=0)
 
-    txn = ApplicationCreateTxn(
-        sender=sender.address,
-        sp=client.suggested_params(),
-        on_complete=OnComplete.NoOpOC.real,
-        approval_program=compileTEAL(client, approval_program),
-        clear_program=compileTEAL(client, clear_program),
-        app_args=[],
-        global_schema=global_schema,
-        local_schema=local_schema)
+    approval = compileTEAL(client, approval_program)
+    clear = compileTEAL(client, clear_program)
+
+    with newPipelinedSubmitter() as submitter:
+        futures = []
+        for g in range(0, count, constants.TX_GROUP_LIMIT):
+            txn_list = [ApplicationCreateTxn(
+                sender=sender.address,
+                sp=getSuggestedParams(),
+                on_complete=OnComplete.NoOpOC.real,
+                approval_program=approval,
+                clear_program=clear,
+                app_args=[],
+                global_schema=global_schema,
+                local_schema=local_schema,
+                note=pipelineNote(submitter)
+            ) for _ in range(min(constants.TX_GROUP_LIMIT, count - g))]
+
+            if len(txn_list) > 1:
+                gid = transaction.calculate_group_id(txn_list)
+                for t in txn_list:
+                    t.group = gid
+            futures.append(submitter.submit([t.sign(sender.private_key) for t in txn_list]))
+
+        CreatedAppIDs = []
+        for f in futures:
+            f.result()
+            CreatedAppIDs.extend(client.pending_transaction_info(txid)["application-index"] for txid in f.txids)
+
+        # created, now fund and setup
+        futures = []
+        for AppID in CreatedAppIDs:
+            txn1 = transaction.PaymentTxn(sender.address, sp=getSuggestedParams(), receiver=get_application_address(AppID),
+                                          amt=funding, note=pipelineNote(submitter))
+            txn2 = ApplicationCallTxn(
+                sender=sender.address,
+                index = AppID,
+                sp=getSuggestedParams(),
+                on_complete=OnComplete.NoOpOC.real,
+                app_args=["setup"],
+                boxes=[(0,0), (0,0), (0,0), (0,0), (0,0), (0, MONSTER_DIR_NAME), (0, monsterShardName(0)), (0, 0)])
+
+            txn_list = [txn1, txn2]
+            gid = transaction.calculate_group_id(txn_list)
+            for t in txn_list:
+                t.group = gid
+            futures.append(submitter.submit([t.sign(sender.private_key) for t in txn_list]))
+        for f in futures:
+            f.result()
+
+        if monsterShards > 1:
+            openMonsterShards(submitter, sender, CreatedAppIDs, 1, monsterShards)
+
+    return CreatedAppIDs
+
+
+# Opens shards first..last-1 of every app with addMonsterShard calls,
+# TX_GROUP_LIMIT to a group. Each call opens the app's next shard, so an app's
+# groups must land in order: they go out one wave at a time, every app's group
+# of the wave in flight together.
+def openMonsterShards(submitter, sender, AppIDs, first, last):
+    for g in range(first, last, constants.TX_GROUP_LIMIT):
+        futures = []
+        for AppID in AppIDs:
+            txn_list = [ApplicationCallTxn(
+                sender=sender.address,
+                index=AppID,
+                sp=getSuggestedParams(),
+                on_complete=OnComplete.NoOpOC.real,
+                app_args=["addMonsterShard"],
+                boxes=[(0,0), (0,0), (0,0), (0, MONSTER_DIR_NAME), (0, monsterShardName(shard))],
+                note=pipelineNote(submitter)
+            ) for shard in range(g, min(g + constants.TX_GROUP_LIMIT, last))]
+
+            if len(txn_list) > 1:
+                gid = transaction.calculate_group_id(txn_list)
+                for t in txn_list:
+                    t.group = gid
+            futures.append(submitter.submit([t.sign(sender.private_key) for t in txn_list]))
+        for f in futures:
+            f.result()
+
+
+# Opens count more monster shards (MAX_MONSTERS monsters each, MAX_MONSTER_SHARDS
+# at most). Returns the new shard count.
+def addMonsterShards(AppID, count):
+    sender = getAccounts()[0]
+    first = len(getMonsterDirectory(AppID))
+    last = first + count
+    if last > MAX_MONSTER_SHARDS:
+        raise ValueError("an arena has at most {} monster shards".format(MAX_MONSTER_SHARDS))
+    with newPipelinedSubmitter() as submitter:
+        openMonsterShards(submitter, sender, [AppID], first, last)
+    return last
+
+
+def getLocalState(AppID, address):
+    with span("read"):
+        keyValues = getAlgodClient().account_application_info(address, AppID)["app-local-state"]["key-value"]
+    return dict(zip(PLAYER_FIELDS, decodeLocalState(keyValues)))
+
+
+# every opted-in player's local state in a few indexer pages, e.g. before a steal sweep
+def getLocalStates(AppID) -> PlayerTable:
+    waitForIndexer()
+    return LocalStateCrawler(getIndexerClient(), AppID).crawl()
+
+
+# live monsters of each shard
+def getMonsterDirectory(AppID, client=None):
+    client = client or getAlgodClient()
+    with span("read"):
+        return decodeMonsterDirectory(b64decode(client.application_box_by_name(AppID, MONSTER_DIR_NAME)["value"]))
+
+
+# every shard's monsters merged into one table (client: algod, or the indexer)
+def getMonsterTable(AppID, client=None) -> MonsterTable:
+    client = client or getAlgodClient()
+    shards = range(len(getMonsterDirectory(AppID, client)))
+    with span("read"):
+        return decodeMonsterShards([b64decode(client.application_box_by_name(AppID, monsterShardName(s))["value"])
+                                    for s in shards])
+
+
+# shards new monsters go to, one per batch: each to the least-full shard with
+# room for it, counting the batches placed before it
+def pickShards(shardCounts, batchSizes):
+    counts = list(shardCounts)
+    shards = []
+    for size in batchSizes:
+        shard = min(range(len(counts)), key=lambda s: counts[s])
+        if counts[shard] + size > MAX_MONSTERS:
+            raise ValueError("no monster shard has room for {} more monsters, see addMonsterShards".format(size))
+        counts[shard] += size
+        shards.append(shard)
+    return shards
+
+
+# playerKillMonster's args and monster boxes: the slot hint and shard of the
+# monster in monsters. The contract fails a call whose hint is stale, so a kill
+# is only as good as the table it was planned from.
+def killMonsterArgs(monsters:MonsterTable, monsterASAID):
+    found = monsters.locate(monsterASAID)
+    if found is None:
+        raise ValueError("monster {} is not in the monster table".format(monsterASAID))
+    shard, slot = found
+    return ["playerKillMonster", slot, shard], shard
+
+
+# monsters if it has the monster, else a fresh read of the app's shards
+def monstersWith(AppID, monsters:MonsterTable, monsterASAID) -> MonsterTable:
+    if monsters is not None and monsters.locate(monsterASAID) is not None:
+        return monsters
+    return getMonsterTable(AppID)
+
+
+# "budget" calls a kill without a slot hint needs beside it: the scan of a shard
+# of n monsters, as TealProfiler prices it, over the pooled budget of the group
+@functools.lru_cache(maxsize=None)
+def killScanBudgetCalls(n):
+    with open(APPROVAL_SRC, "r", encoding="utf-8") as f:
+        entries = profile(f.read(), [n])["entries"]
+    scan, budget = entries["playerKillMonster:scan"]["worst"][str(n)], entries["budget"]["worst"][str(n)]
+    return max(0, math.ceil((scan - APP_CALL_BUDGET) / (APP_CALL_BUDGET - budget)))
 
-    signedTxn = txn.sign(sender.private_key)
-    txid = client.send_transaction(signedTxn)
-    response = wait_for_confirmation(client, txid)
-    CreatedAppID = response["application-index"]
 
-    fundApp(client, sender, get_application_address(CreatedAppID), 100000000000)
+# A running WorldFollower of the app on the shared algod client. startRound must
+# be at or before the app's creation, unless checkpointPath holds a checkpoint.
+def followWorld(AppID, startRound=1, checkpointPath=None) -> WorldFollower:
+    return WorldFollower(getAlgodClient(), AppID, startRound, checkpointPath).start()
 
-    # already funded, now setup
-    txn = ApplicationCallTxn(
-        sender=sender.address,
-        index = CreatedAppID,
-        sp=client.suggested_params(),
-        on_complete=OnComplete.NoOpOC.real,
-        app_args=["setup"],
-        boxes=[(0,0), (0,0), (0,0), (0,0), (0,0), (0,0), (0, str.encode("MONSTERS")), (0, 0)])
 
-    signedTxn = txn.sign(sender.private_key)
-    txid = client.send_transaction(signedTxn)
-    wait_for_confirmation(client, txid)
+# The app's Leaderboard. With a follower it is kept current block by block;
+# without one it is filled from the crawled local states and save boxes, as of
+# then. A checkpointPath makes a restart resume from the saved scores.
+def getLeaderboard(AppID, follower:WorldFollower=None, checkpointPath=None) -> Leaderboard:
+    board = Leaderboard(AppID, checkpointPath)
+    if follower is not None:
+        return board.attach(follower)
+    waitForIndexer()
+    localCrawler = LocalStateCrawler(getIndexerClient(), AppID)
+    boxCrawler = PlayerBoxCrawler(getIndexerClient(), AppID)
+    board.syncTables(localCrawler.crawl(), boxCrawler.crawl(), max(localCrawler.lastRound, boxCrawler.lastRound))
+    return board
 
-    return CreatedAppID
 
+# Every NFT the app has minted, checked in one indexer sweep against the live
+# monsters and the players' UNSECURED_ASSETs (see AssetAuditor).
+def auditAssets(AppID) -> AssetAudit:
+    waitForIndexer()
+    indexer = getIndexerClient()
+    players = [LocalStateCrawler(indexer, AppID).crawl(), PlayerBoxCrawler(indexer, AppID).crawl()]
+    return AssetAuditor(indexer, AppID).audit(getMonsterTable(AppID, indexer), players)
+
+
+# Writes the app's world to snapshotPath as of the follower's current round, then
+# logs every later block's calls to logPath until the recorder is stopped. Without
+# a follower one is started (from round 1, so it sees the app created).
+def recordWorld(AppID, snapshotPath, logPath, follower:WorldFollower=None) -> WorldRecorder:
+    if follower is None:
+        follower = followWorld(AppID)
+        follower.waitFor(getAlgodClient().status()["last-round"])
+    return WorldRecorder(follower, snapshotPath, logPath).start()
 
-def getActiveMonstersList(AppID):
-    client = sandbox.get_algod_client()
-    boxData = b64decode(client.application_box_by_name(AppID, str.encode("MONSTERS"))["value"])
 
-    len = int.from_bytes(boxData[0:8])
+# A world snapshot file, mapped; replay(logPath, round) rolls it forward.
+def loadWorld(path) -> MappedWorld:
+    return MappedWorld(path)
 
-    outList = []
-    for i in range(8,len*32+8,32):
-        outList.append((int.from_bytes(boxData[i:i+8]), int.from_bytes(boxData[i+8:i+16]), int.from_bytes(boxData[i+16:i+24])))
 
-    return outList
+def getActiveMonstersList(AppID):
+    return getMonsterTable(AppID).toTuples()
 
 
-def addMonster(AppID, pos_x, pos_y):
-    client = sandbox.get_algod_client()
-    accounts = sandbox.get_accounts()
+@traced("addMonster")
+def addMonster(AppID, pos_x, pos_y, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
+    accounts = getAccounts()
     sender = accounts[0]
 
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
+    shard = pickShards(getMonsterDirectory(AppID), [1])[0]
 
     txn = ApplicationCallTxn(
         sender=sender.address,
         index=AppID,
         sp=sp,
         on_complete=OnComplete.NoOpOC.real,
-        app_args=["addMonster", pos_x, pos_y],
-        boxes=[(0,0), (0,0), (0,0), (0, str.encode("MONSTERS"))]
+        app_args=["addMonster", pos_x, pos_y, shard],
+        boxes=[(0,0), (0,0), (0,0), (0, MONSTER_DIR_NAME), (0, monsterShardName(shard))],
+        note=pipelineNote(submitter)
     )
 
-    signed_txn = txn.sign(sender.private_key)
-    client.send_transaction(signed_txn)
-
-    txnOut = wait_for_confirmation(client, txn.get_txid())
-    return txnOut
-
-
-def playerOptIn(AppID, playerAccount:sandbox.SandboxAccount):
-    client = sandbox.get_algod_client()
+    signed_txn = signTxns(txn, sender.private_key)
+    return sendSigned(client, signed_txn, submitter)
+
+
+# Seeds many monsters at once: up to MAX_MONSTERS_PER_CALL positions packed into
+# each addMonsters call, up to TX_GROUP_LIMIT calls per atomic group, and every
+# group in flight together. Each call pays for itself plus one inner mint per
+# monster, and goes to the least-full shard. Returns the minted ASA ids, in the
+# order of positions.
+def addMonsters(AppID, positions):
+    client = getAlgodClient()
+    sender = getAccounts()[0]
+    positions = list(positions)
+
+    batches = [positions[i:i + MAX_MONSTERS_PER_CALL] for i in range(0, len(positions), MAX_MONSTERS_PER_CALL)]
+    shards = pickShards(getMonsterDirectory(AppID), [len(batch) for batch in batches])
+    with newPipelinedSubmitter() as submitter:
+        futures = []
+        for g in range(0, len(batches), constants.TX_GROUP_LIMIT):
+            txn_list = [ApplicationCallTxn(
+                sender=sender.address,
+                index=AppID,
+                sp=getSuggestedParams(fee=constants.MIN_TXN_FEE * (1 + len(batch))),
+                on_complete=OnComplete.NoOpOC.real,
+                app_args=["addMonsters", packMonsterPositions(batch), shard],
+                boxes=[(0,0), (0,0), (0,0), (0, MONSTER_DIR_NAME), (0, monsterShardName(shard))],
+                note=pipelineNote(submitter)
+            ) for batch, shard in zip(batches[g:g + constants.TX_GROUP_LIMIT], shards[g:g + constants.TX_GROUP_LIMIT])]
+
+            if len(txn_list) > 1:
+                gid = transaction.calculate_group_id(txn_list)
+                for t in txn_list:
+                    t.group = gid
+            futures.append(submitter.submit([t.sign(sender.private_key) for t in txn_list]))
+
+    asaIDs = []
+    for f in futures:
+        f.result()
+        for txid in f.txids:
+            asaIDs.extend(t["asset-index"] for t in client.pending_transaction_info(txid)["inner-txns"])
+    return asaIDs
+
+
+@traced("playerOptIn")
+def playerOptIn(AppID, playerAccount:sandbox.SandboxAccount, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
     
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
 
     senderAddr = algosdk.encoding.decode_address(playerAccount.address)
 
@@ -133,18 +420,15 @@ def playerOptIn(AppID, playerAccount:sandbox.SandboxAccount):
         app_args=[]
     )
     
-    signed_txn = txn.sign(playerAccount.private_key)
-    client.send_transaction(signed_txn)
-
-    wait_for_confirmation(client, txn.get_txid())
+    signed_txn = signTxns(txn, playerAccount.private_key)
+    return sendSigned(client, signed_txn, submitter)
 
 
-def enterPlayer(AppID, playerAccount:sandbox.SandboxAccount):
-    client = sandbox.get_algod_client()
+@traced("enterPlayer")
+def enterPlayer(AppID, playerAccount:sandbox.SandboxAccount, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
     
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
 
     senderAddr = algosdk.encoding.decode_address(playerAccount.address)
 
@@ -154,21 +438,19 @@ def enterPlayer(AppID, playerAccount:sandbox.SandboxAccount):
         sp=sp,
         on_complete=OnComplete.NoOpOC.real,
         app_args=["enterPlayer"],
-        boxes=[(0, senderAddr)]
+        boxes=[(0, senderAddr)],
+        note=pipelineNote(submitter)
     )
     
-    signed_txn = txn.sign(playerAccount.private_key)
-    client.send_transaction(signed_txn)
+    signed_txn = signTxns(txn, playerAccount.private_key)
+    return sendSigned(client, signed_txn, submitter)
 
-    wait_for_confirmation(client, txn.get_txid())
 
-
-def exitAndSavePlayer(AppID, playerAccount:sandbox.SandboxAccount):
-    client = sandbox.get_algod_client()
+@traced("exitAndSavePlayer")
+def exitAndSavePlayer(AppID, playerAccount:sandbox.SandboxAccount, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
     
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
 
     senderAddr = algosdk.encoding.decode_address(playerAccount.address)
     
@@ -178,75 +460,125 @@ def exitAndSavePlayer(AppID, playerAccount:sandbox.SandboxAccount):
         sp=sp,
         on_complete=OnComplete.NoOpOC.real,
         app_args=["exitAndSavePlayer"],
-        boxes=[(0, senderAddr)]
+        boxes=[(0, senderAddr)],
+        note=pipelineNote(submitter)
     )
 
-    signed_txn = txn.sign(playerAccount.private_key)
-    client.send_transaction(signed_txn)
-
-    wait_for_confirmation(client, txn.get_txid())
+    signed_txn = signTxns(txn, playerAccount.private_key)
+    return sendSigned(client, signed_txn, submitter)
 
 
-def playerMove(AppID, playerAccount:sandbox.SandboxAccount, dir:str):
-    client = sandbox.get_algod_client()
+@traced("playerMove")
+def playerMove(AppID, playerAccount:sandbox.SandboxAccount, dir:str, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
     
     txn = ApplicationCallTxn(
         sender=playerAccount.address,
         index=AppID,
-        sp=client.suggested_params(),
+        sp=getSuggestedParams(),
         on_complete=OnComplete.NoOpOC.real,
-        app_args=["playerMove", dir])
+        app_args=["playerMove", dir],
+        note=pipelineNote(submitter))
     
-    signed_txn = txn.sign(playerAccount.private_key)
-    client.send_transaction(signed_txn)
+    signed_txn = signTxns(txn, playerAccount.private_key)
+    return sendSigned(client, signed_txn, submitter)
 
-    wait_for_confirmation(client, txn.get_txid())
 
+# Walks a whole path in one transaction: path is a string of moves ("UUURRL"),
+# a list of directions, or (direction, steps) segments such as pathTo() gives.
+# Paths longer than one call's MAX_PATH_SEGMENTS go as one atomic group.
+@traced("playerWalk")
+def playerWalk(AppID, playerAccount:sandbox.SandboxAccount, path, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
 
-def playerKillMonster(AppID, playerAccount:sandbox.SandboxAccount, monsterASAID):
-    client = sandbox.get_algod_client()
+    segments = compressMoves(path) if all(isinstance(m, str) for m in path) else list(path)
+    if not segments:
+        return
+    chunks = range(0, len(segments), MAX_PATH_SEGMENTS)
+    txn_list = [ApplicationCallTxn(
+        sender=playerAccount.address,
+        index=AppID,
+        sp=getSuggestedParams(),
+        on_complete=OnComplete.NoOpOC.real,
+        app_args=["playerMove", encodePath(segments[i:i + MAX_PATH_SEGMENTS])],
+        note=walkNote(submitter, len(chunks))
+    ) for i in chunks]
+
+    if len(txn_list) > 1:
+        gid = transaction.calculate_group_id(txn_list)
+        for t in txn_list:
+            t.group = gid
+
+    signedTxnList = signTxns(txn_list, playerAccount.private_key)
+    return sendSigned(client, signedTxnList, submitter)
+
+
+# monsters: a decoded monster table to take the shard and slot hint from (read
+# fresh if not given or without the monster). The contract rejects a stale hint
+# instead of scanning, so a blocking kill planned from the given table that
+# fails is sent again from a fresh read if the monster has moved since; a
+# pipelined one is not retried. hint=False leaves the hint out: the contract
+# scans shard 0 for the monster, on budget pooled from "budget" calls.
+@traced("playerKillMonster")
+def playerKillMonster(AppID, playerAccount:sandbox.SandboxAccount, monsterASAID, submitter:PipelinedSubmitter=None, monsters:MonsterTable=None, hint=True):
+    client = getAlgodClient()
     
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
-
-    txn1 = AssetOptInTxn(playerAccount.address, sp=client.suggested_params(), index=monsterASAID)
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
+
+    given = monsters
+    budgetCalls = []
+    if hint:
+        monsters = monstersWith(AppID, monsters, monsterASAID)
+        appArgs, shard = killMonsterArgs(monsters, monsterASAID)
+    else:
+        appArgs, shard = ["playerKillMonster"], 0
+        budgetCalls = [ApplicationCallTxn(
+            sender=playerAccount.address,
+            index=AppID,
+            sp=getSuggestedParams(),
+            on_complete=OnComplete.NoOpOC.real,
+            app_args=["budget"],
+            note=os.urandom(8)
+        ) for _ in range(killScanBudgetCalls(getMonsterDirectory(AppID)[0]))]
+
+    txn1 = AssetOptInTxn(playerAccount.address, sp=getSuggestedParams(), index=monsterASAID)
     txn2 = ApplicationCallTxn(
         sender=playerAccount.address,
         index=AppID,
         sp=sp,
         on_complete=OnComplete.NoOpOC.real,
-        app_args=["playerKillMonster"],
-        boxes=[(0,0), (0,0), (0,0), (0, algosdk.encoding.decode_address(playerAccount.address)), (0, "MONSTERS")],
-        foreign_assets=[monsterASAID]
+        app_args=appArgs,
+        boxes=[(0,0), (0,0), (0,0), (0, algosdk.encoding.decode_address(playerAccount.address)), (0, MONSTER_DIR_NAME),
+               (0, monsterShardName(shard))],
+        foreign_assets=[monsterASAID],
+        note=pipelineNote(submitter)
     )
 
-    txn_list = [txn1, txn2]
+    txn_list = [txn1, txn2] + budgetCalls
     gid = transaction.calculate_group_id(txn_list)
     for t in txn_list:
         t.group = gid
 
-    signedTxnList = [t.sign(playerAccount.private_key) for t in txn_list]
-    client.send_transactions(signedTxnList)
-
-    for t in signedTxnList:
-        wait_for_confirmation(client, t.get_txid())
-
-
-def secureAsset(AppID, playerAccount:sandbox.SandboxAccount):
-    client = sandbox.clients.get_algod_client()
-    p = sandbox.get_algod_client().account_application_info(playerAccount.address, AppID)["app-local-state"]['key-value']
-    for v in p:
-        if (v["key"] == 'VU5TRUNVUkVEX0FTU0VU'):
-            ASA = v["value"]["uint"]
-    
-    monsterASAID = ASA
+    signedTxnList = signTxns(txn_list, playerAccount.private_key)
+    try:
+        return sendSigned(client, signedTxnList, submitter)
+    except AlgodHTTPError:
+        if not hint or given is not monsters or submitter is not None:
+            raise
+        fresh = getMonsterTable(AppID)
+        if fresh.locate(monsterASAID) in (None, monsters.locate(monsterASAID)):
+            raise
+        return playerKillMonster(AppID, playerAccount, monsterASAID, monsters=fresh)
+
+
+@traced("secureAsset")
+def secureAsset(AppID, playerAccount:sandbox.SandboxAccount, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
+    monsterASAID = getLocalState(AppID, playerAccount.address)["UNSECURED_ASSET"]
     if (monsterASAID == 0):
         return
     
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
     
     txn = ApplicationCallTxn(
         sender=playerAccount.address,
@@ -256,27 +588,21 @@ def secureAsset(AppID, playerAccount:sandbox.SandboxAccount):
         app_args=["secureAsset"],
         foreign_assets=[monsterASAID],
         boxes=[(0,0), (0,0), (0,0), (0, algosdk.encoding.decode_address(playerAccount.address))],
+        note=pipelineNote(submitter)
     )
 
-    signedTxnList = txn.sign(playerAccount.private_key)
-    client.send_transaction(signedTxnList)
+    signedTxnList = signTxns(txn, playerAccount.private_key)
+    return sendSigned(client, signedTxnList, submitter)
 
-    wait_for_confirmation(client, txn.get_txid())
 
+@traced("playerSteal")
+def playerSteal(AppID, thiefAccount:sandbox.SandboxAccount, victimAddress:str, submitter:PipelinedSubmitter=None):
+    client = getAlgodClient()
+    ASAToSteal = getLocalState(AppID, victimAddress)["UNSECURED_ASSET"]
 
-def playerSteal(AppID, thiefAccount:sandbox.SandboxAccount, victimAddress:str):
-    client = sandbox.clients.get_algod_client()
-    p = sandbox.get_algod_client().account_application_info(victimAddress, AppID)["app-local-state"]['key-value']
-    for v in p:
-        if (v["key"] == 'VU5TRUNVUkVEX0FTU0VU'):
-            ASA = v["value"]["uint"]
-    ASAToSteal = ASA
+    sp = getSuggestedParams(fee=constants.MIN_TXN_FEE * 2)
 
-    sp = client.suggested_params()
-    sp.fee = constants.MIN_TXN_FEE * 2
-    sp.flat_fee = True
-
-    txn1 = AssetOptInTxn(thiefAccount.address, sp=client.suggested_params(), index=ASAToSteal)
+    txn1 = AssetOptInTxn(thiefAccount.address, sp=getSuggestedParams(), index=ASAToSteal)
     txn2 = ApplicationCallTxn(
         sender=thiefAccount.address,
         index=AppID,
@@ -284,7 +610,8 @@ def playerSteal(AppID, thiefAccount:sandbox.SandboxAccount, victimAddress:str):
         on_complete=OnComplete.NoOpOC.real,
         app_args=["pvpSteal"],
         accounts = [victimAddress],
-        foreign_assets=[ASAToSteal]
+        foreign_assets=[ASAToSteal],
+        note=pipelineNote(submitter)
     )
 
     txn_list = [txn1, txn2]
@@ -292,12 +619,72 @@ def playerSteal(AppID, thiefAccount:sandbox.SandboxAccount, victimAddress:str):
     for t in txn_list:
         t.group = gid
 
-    signedTxnList = [t.sign(thiefAccount.private_key) for t in txn_list]
-    client.send_transactions(signedTxnList)
-    
-    for t in signedTxnList:
-        wait_for_confirmation(client, t.get_txid())
-    return wait_for_confirmation(client, txn2.get_txid())
+    signedTxnList = signTxns(txn_list, thiefAccount.private_key)
+    return sendSigned(client, signedTxnList, submitter)
+
+
+# Turn actions for ArenaScheduler: the same calls as the helpers above, left
+# unsigned and ungrouped for the packer to group, fund and sign.
+def enterPlayerAction(AppID, playerAccount:sandbox.SandboxAccount) -> Action:
+    senderAddr = algosdk.encoding.decode_address(playerAccount.address)
+    txn = ApplicationCallTxn(playerAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                             app_args=["enterPlayer"])
+    return Action(playerAccount, [txn], boxes=[(AppID, senderAddr, PLAYER_RECORD_SIZE)], label="enterPlayer")
+
+
+def exitAndSavePlayerAction(AppID, playerAccount:sandbox.SandboxAccount) -> Action:
+    senderAddr = algosdk.encoding.decode_address(playerAccount.address)
+    txn = ApplicationCallTxn(playerAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                             app_args=["exitAndSavePlayer"])
+    return Action(playerAccount, [txn], boxes=[(AppID, senderAddr, PLAYER_RECORD_SIZE)], label="exitAndSavePlayer")
+
+
+def playerWalkAction(AppID, playerAccount:sandbox.SandboxAccount, path) -> Action:
+    segments = compressMoves(path) if all(isinstance(m, str) for m in path) else list(path)
+    chunks = range(0, len(segments), MAX_PATH_SEGMENTS)
+    txns = [ApplicationCallTxn(playerAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                               app_args=["playerMove", encodePath(segments[i:i + MAX_PATH_SEGMENTS])],
+                               note=walkNote(None, len(chunks)))
+            for i in chunks]
+    return Action(playerAccount, txns, label="playerMove")
+
+
+# A kill swaps the shard's last monster into the freed slot, so kills planned
+# from one table keep their hints only if they land in the order planned, each
+# taking its shard's last monster (ArenaBench pops them off the table's end).
+# The shard is touched like an account, which keeps the kills on it in queue
+# order.
+def playerKillMonsterAction(AppID, playerAccount:sandbox.SandboxAccount, monsterASAID, monsters:MonsterTable=None) -> Action:
+    monsters = monstersWith(AppID, monsters, monsterASAID)
+    appArgs, shard = killMonsterArgs(monsters, monsterASAID)
+
+    txn1 = AssetOptInTxn(playerAccount.address, sp=getSuggestedParams(), index=monsterASAID)
+    txn2 = ApplicationCallTxn(playerAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                              app_args=appArgs, foreign_assets=[monsterASAID])
+    return Action(playerAccount, [txn1, txn2], innerTxns=1,
+                  boxes=[(AppID, MONSTER_DIR_NAME, MONSTER_DIR_SIZE), (AppID, monsterShardName(shard), MONSTER_BOX_SIZE)],
+                  touches=[(AppID, monsterShardName(shard))], conflicts=[("monster", monsterASAID)],
+                  label="playerKillMonster")
+
+
+def playerStealAction(AppID, thiefAccount:sandbox.SandboxAccount, victimAddress:str, ASAToSteal) -> Action:
+    txn1 = AssetOptInTxn(thiefAccount.address, sp=getSuggestedParams(), index=ASAToSteal)
+    txn2 = ApplicationCallTxn(thiefAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                              app_args=["pvpSteal"], accounts=[victimAddress], foreign_assets=[ASAToSteal])
+    return Action(thiefAccount, [txn1, txn2], innerTxns=1, touches=[victimAddress],
+                  conflicts=[("asset", ASAToSteal)], label="pvpSteal")
+
+
+def secureAssetAction(AppID, playerAccount:sandbox.SandboxAccount, ASA) -> Action:
+    txn = ApplicationCallTxn(playerAccount.address, getSuggestedParams(), AppID, OnComplete.NoOpOC.real,
+                             app_args=["secureAsset"], foreign_assets=[ASA])
+    return Action(playerAccount, [txn], conflicts=[("asset", ASA)], label="secureAsset")
+
+
+# submits one tick of actions in as few groups and rounds as the packer manages
+def runTick(actions, feePayer:sandbox.SandboxAccount=None, signer:SigningPool=None) -> TickReport:
+    with newPipelinedSubmitter() as submitter:
+        return TickScheduler(submitter, feePayer=feePayer, signer=signer).run(actions)
 
 
 
@@ -310,19 +697,8 @@ class MonsterArenaTestCommon(unittest.TestCase):
 
     @classmethod
     def getMonsterBoxContents(self):
-        idxClient = sandbox.get_indexer_client()
-        monsterBox = idxClient.application_box_by_name(self.AppID, bytes("MONSTERS", encoding="utf-8"))
-        monsterBox = b64decode(monsterBox['value'])
-        
-        liveMonsters = []
-        monsterLen = int.from_bytes(monsterBox[:8], byteorder='big')
-        for i in range (0,monsterLen):
-            pos_x = int.from_bytes(monsterBox[8+i*24:8+i*24+8], byteorder='big')
-            pos_y = int.from_bytes(monsterBox[8+i*24+8:8+i*24+16], byteorder='big')
-            ASAID = int.from_bytes(monsterBox[8+i*24+16:8+i*24+24], byteorder='big')
-            
-            liveMonsters.append({"POS_X":pos_x, "POS_Y":pos_y, "ASA_ID":ASAID})
-        return liveMonsters
+        waitForIndexer()
+        return getMonsterTable(self.AppID, getIndexerClient()).toDicts()
     
     
     @classmethod
@@ -338,41 +714,41 @@ class MonsterArenaTestCommon(unittest.TestCase):
 
     @classmethod
     def getPlayerBox(self, account:sandbox.SandboxAccount):
-        idxClient = sandbox.get_indexer_client()
+        waitForIndexer()
+        idxClient = getIndexerClient()
         boxName = algosdk.encoding.decode_address(account.address)
         boxContent = idxClient.application_box_by_name(self.AppID, boxName)
         return self.playerBoxToDict(boxContent, boxName)
     
 
     @classmethod
-    def getPlayerBoxesContents(self):
-        idxClient = sandbox.get_indexer_client()
-        playerBoxes = idxClient.application_boxes(self.AppID)["boxes"]
-        #if there were a considerable number of accounts, we'd have to crawl the pages here
-        playerBoxes = [b64decode(k["name"]) for k in playerBoxes if b64decode(k["name"]) != bytes("MONSTERS", encoding="utf-8")]
-
-        livePlayers=[]
-        for boxName in playerBoxes:
-            boxContent = idxClient.application_box_by_name(self.AppID, boxName)
-            livePlayers.append(self.playerBoxToDict(boxContent, boxName))
-        return livePlayers
+    def getPlayerBoxesContents(self, sinceRound=None):
+        waitForIndexer()
+        crawler = PlayerBoxCrawler(getIndexerClient(), self.AppID)
+        return crawler.crawl(sinceRound).toDicts()
     
         
     @classmethod
     def getPlayerLocalState(self, account:sandbox.SandboxAccount):
-        p = sandbox.get_algod_client().account_application_info(account.address, self.AppID)["app-local-state"]['key-value']
-        for v in p:
-            if (v["key"] == 'UE9TX1k='):
-                POS_Y = v["value"]["uint"]
-            elif (v["key"] == 'UE9TX1g='):
-                POS_X = v["value"]["uint"]
-            elif (v["key"] == 'VU5TRUNVUkVEX0FTU0VU'):
-                ASA = v["value"]["uint"]
-            elif (v["key"] == "U0NPUkU="):
-                Score = v["value"]["uint"]
-        
-        val = {"POS_X":POS_X, "POS_Y":POS_Y, "SCORE": Score, "UNSECURED_ASSET": ASA}
-        return val
+        return getLocalState(self.AppID, account.address)
+
+
+    # address -> score as the leaderboard should have it: the local SCORE of an
+    # active player, else the one saved in their box
+    @classmethod
+    def getCrawledScores(self):
+        scores = {}
+        for player in self.getPlayerBoxesContents():
+            scores[algosdk.encoding.encode_address(player["ADDRESS"])] = player["SCORE"]
+        for player in getLocalStates(self.AppID).toDicts():
+            if player["SCORE"]:
+                scores[player["ADDRESS"]] = player["SCORE"]
+        return {address: score for address, score in scores.items() if score}
+
+
+    @classmethod
+    def getCrawledLocalStates(self):
+        return sorted(getLocalStates(self.AppID).toDicts(), key=lambda p: p["ADDRESS"])
 
 
 class AllTests(MonsterArenaTestCommon):
@@ -380,17 +756,16 @@ class AllTests(MonsterArenaTestCommon):
     @classmethod
     def test_AddMonsters(self, n=6):
         pos = [(x,y) for x,y in enumerate(range(0,n))]
-        for x,y in pos:
-            try:
-                txnOut = addMonster(self.AppID, x, y)
-            except:
-                assert False, "Unable to add one of the monsters"
-            
-            ASA_ID = txnOut["inner-txns"][0]["asset-index"]
+        #the first one through addMonster, the rest as one batch
+        try:
+            txnOut = addMonster(self.AppID, *pos[0])
+            ASA_IDs = [txnOut["inner-txns"][0]["asset-index"]] + addMonsters(self.AppID, pos[1:])
+        except:
+            assert False, "Unable to add one of the monsters"
+
+        for (x,y), ASA_ID in zip(pos, ASA_IDs):
             self.ActiveMonsters.append({"POS_X":x, "POS_Y":y, "ASA_ID":ASA_ID})
         
-        time.sleep(10)
-        
         liveMonsters = self.getMonsterBoxContents()
         diff = [i for i in liveMonsters + self.ActiveMonsters if i not in liveMonsters or i not in self.ActiveMonsters]
         assert len(diff) == 0, "Monsters in blockchain =/= monsters supposedly added"
@@ -398,7 +773,7 @@ class AllTests(MonsterArenaTestCommon):
         
     @classmethod
     def test_AddPlayers(self):
-        for acc in sandbox.get_accounts():
+        for acc in getAccounts():
             try:
                 txnOut = enterPlayer(self.AppID, acc)
             except:
@@ -410,29 +785,46 @@ class AllTests(MonsterArenaTestCommon):
                                        "POS_X": 0, "POS_Y": 0, 
                                        "SCORE": 1, "UNSECURED_ASSET": 0}})
         
-        time.sleep(10)
         livePlayers = self.getPlayerBoxesContents()
         
         diff = [i for i in livePlayers + self.ActivePlayers if i not in livePlayers or i not in self.ActivePlayers]
         assert len(diff) == 0, "Players actually in blockchain =/= players supposedly added"
         
     
+    @classmethod
+    def test_RecordWorld(self):
+        self.worldDir = tempfile.mkdtemp()
+        self.worldFollower = followWorld(self.AppID)
+        self.worldFollower.waitFor(getAlgodClient().status()["last-round"])
+        try:
+            self.worldRecorder = recordWorld(self.AppID, os.path.join(self.worldDir, "world.snap"),
+                                             os.path.join(self.worldDir, "world.log"), self.worldFollower)
+        except:
+            assert False, "Unable to snapshot the world"
+
+        with loadWorld(os.path.join(self.worldDir, "world.snap")) as world:
+            assert world.monsters().toDicts() == self.getMonsterBoxContents(), "Snapshot monsters =/= monsters in blockchain"
+            snapshotPlayers = sorted(world.localStates().toDicts(), key=lambda p: p["ADDRESS"])
+        assert snapshotPlayers == self.getCrawledLocalStates(), "Snapshot local states =/= local states in blockchain"
+
+
     @classmethod
     def test_MonsterASAs(self):
-        AppAddress = get_application_address(self.AppID)
+        audit = auditAssets(self.AppID)
         for m in self.ActiveMonsters:
             try:
-                assetInfo = sandbox.get_algod_client().asset_info(m["ASA_ID"])
-                assert assetInfo["params"]["clawback"] == AppAddress, "Clawback address incorrect"
-                assert assetInfo["params"]["freeze"] == AppAddress, "Freeze address incorrect"
-                assert assetInfo["params"]["manager"] == AppAddress, "Manager address incorrect"
+                flags = audit.flagsOf(m["ASA_ID"])
+                assert flags is not None, "Asset not created by the app"
+                assert not flags & CLAWBACK, "Clawback address incorrect"
+                assert not flags & FREEZE, "Freeze address incorrect"
+                assert not flags & MANAGER, "Manager address incorrect"
             except:
                 assert False, "Asset not minted correctly"
 
 
     @classmethod
     def test_SecureAssetWithoutLocalSpace(self):
-        acc = sandbox.get_accounts()[0]
+        acc = getAccounts()[0]
         try:
             out = secureAsset(self.AppID, acc)
             assert False, "player should not be able to secure asset without an asset"
@@ -443,7 +835,7 @@ class AllTests(MonsterArenaTestCommon):
     @classmethod
     def test_playerKillMonster(self):
         monsterIdx = 0
-        for acc in sandbox.get_accounts():
+        for acc in getAccounts():
             try:
                 cachedLocalVal = self.getPlayerLocalState(acc)
                 monsterToErase = self.ActiveMonsters[monsterIdx]
@@ -454,9 +846,6 @@ class AllTests(MonsterArenaTestCommon):
             self.ActiveMonsters[monsterIdx] = self.ActiveMonsters[-1]
             self.ActiveMonsters.pop()
             
-            #indexer not up to date bug
-            time.sleep(10)
-            
             liveMonsters = self.getMonsterBoxContents()
             diff = [i for i in liveMonsters + self.ActiveMonsters if i not in liveMonsters or i not in self.ActiveMonsters]
             assert len(diff) == 0, "monsters in blockchain =/= monsters off chain"
@@ -468,7 +857,7 @@ class AllTests(MonsterArenaTestCommon):
             assert localVal["UNSECURED_ASSET"] == monsterToErase["ASA_ID"], "ASA not appropriated correctly"
 
             #check asset is owned by account
-            balances = sandbox.get_indexer_client().asset_balances(monsterToErase["ASA_ID"])
+            balances = getIndexerClient().asset_balances(monsterToErase["ASA_ID"])
             for b in balances["balances"]:
                 if (b["address"] == get_application_address(self.AppID)):
                     assert b["amount"] == 0, "contract should not have the asset"
@@ -478,7 +867,7 @@ class AllTests(MonsterArenaTestCommon):
 
     @classmethod
     def test_playerExitAndSave(self):
-        acc = sandbox.get_accounts()[0]
+        acc = getAccounts()[0]
         cachedLocalVal = self.getPlayerLocalState(acc)
         
         try:
@@ -491,7 +880,6 @@ class AllTests(MonsterArenaTestCommon):
 
         assert localVal == zeroVal, "local state was not zeroed out"
 
-        time.sleep(10)
         boxVal = self.getPlayerBox(acc)
         
         boxValNoAddr = boxVal.copy()
@@ -502,7 +890,7 @@ class AllTests(MonsterArenaTestCommon):
 
     @classmethod
     def test_playerRestoreSave(self):
-        acc = sandbox.get_accounts()[0]
+        acc = getAccounts()[0]
         cachedBox = self.getPlayerBox(acc)
         cachedLS = self.getPlayerLocalState(acc)
         try:
@@ -510,8 +898,6 @@ class AllTests(MonsterArenaTestCommon):
         except:
             assert False, "player restore save failed"
             
-        time.sleep(10)
-            
         currentBox = self.getPlayerBox(acc)
         currentLS = self.getPlayerLocalState(acc)
         zeroVal = {"POS_X":0, "POS_Y":0, "SCORE": 0, "UNSECURED_ASSET": 0}
@@ -527,10 +913,9 @@ class AllTests(MonsterArenaTestCommon):
     
     @classmethod
     def test_SecureAssetOutsideSafeZone(self):
-        acc = sandbox.get_accounts()[1]
+        acc = getAccounts()[1]
         try:
-            for _ in range(0,12):
-                playerMove(acc, "UP")
+            playerWalk(self.AppID, acc, "U" * 12)
             out = secureAsset(self.AppID, acc)
             assert False, "player should not be able to secure asset outside base"
         except:
@@ -539,7 +924,7 @@ class AllTests(MonsterArenaTestCommon):
             
     @classmethod
     def test_PlayerMove(self):
-        acc = sandbox.get_accounts()[1]
+        acc = getAccounts()[1]
         prevLocalState = self.getPlayerLocalState(acc)
         try:
             out = playerMove(self.AppID, acc, "UP")
@@ -548,6 +933,8 @@ class AllTests(MonsterArenaTestCommon):
             out = playerMove(self.AppID, acc, "RIGHT")
             out = playerMove(self.AppID, acc, "RIGHT")
             out = playerMove(self.AppID, acc, "LEFT")
+            # two calls of the very same moves, in one group
+            out = playerWalk(self.AppID, acc, [("U", 1), ("D", 1)] * MAX_PATH_SEGMENTS)
         except:
             assert False, "Asset not secured correctly"
 
@@ -561,7 +948,7 @@ class AllTests(MonsterArenaTestCommon):
         
     @classmethod
     def test_SecureAsset(self):
-        acc = sandbox.get_accounts()[2]
+        acc = getAccounts()[2]
         prevLocalState = self.getPlayerLocalState(acc)
         try:
             out = secureAsset(self.AppID, acc)
@@ -576,10 +963,27 @@ class AllTests(MonsterArenaTestCommon):
         assert newLocalState == correctLocalState, "Wrong local state after securing asset"
         
         
+    @classmethod
+    def test_Leaderboard(self):
+        scores = self.getCrawledScores()
+        with followWorld(self.AppID) as follower:
+            follower.waitFor(getAlgodClient().status()["last-round"])
+            boards = [getLeaderboard(self.AppID), getLeaderboard(self.AppID, follower)]
+
+        for board in boards:
+            top = board.top(len(scores) + 1)
+            assert {address: score for _, address, score in top} == scores, "Leaderboard =/= crawled scores"
+            assert [score for _, _, score in top] == sorted(scores.values(), reverse=True), "Leaderboard out of order"
+            for rank, address, score in top:
+                correctRank = 1 + sum(1 for s in scores.values() if s > score)
+                assert rank == correctRank and board.rank(address) == correctRank, "Wrong rank for " + address
+            assert board.top(1) == top[:1], "Top 1 =/= first of the full board"
+
+
     @classmethod
     def test_StealFromPlayer(self):
-        acc = sandbox.get_accounts()[2]
-        victim = sandbox.get_accounts()[0]
+        acc = getAccounts()[2]
+        victim = getAccounts()[0]
         
         cachedVictimLS = self.getPlayerLocalState(victim)
         cachedAccLS = self.getPlayerLocalState(acc)
@@ -601,7 +1005,8 @@ class AllTests(MonsterArenaTestCommon):
         assert newVictimLS == desiredVictimLS, "Asset not cleared from victim's local space"
         assert newAccLS == desiredAccLS, "Asset not in thief's local space"
         
-        balances = sandbox.get_indexer_client().asset_balances(cachedVictimLS["UNSECURED_ASSET"])
+        waitForIndexer()
+        balances = getIndexerClient().asset_balances(cachedVictimLS["UNSECURED_ASSET"])
         for b in balances["balances"]:
             if b["address"] == acc.address:
                 assert b["amount"] == 1, "account should hold the asset now"
@@ -611,11 +1016,10 @@ class AllTests(MonsterArenaTestCommon):
                 
     @classmethod
     def test_StealFromFarAwayPlayer(self):
-        victim = sandbox.get_accounts()[1]
-        acc = sandbox.get_accounts()[0]
+        victim = getAccounts()[1]
+        acc = getAccounts()[0]
 
-        for _ in range(0,12):
-            playerMove(self.AppID, victim, "RIGHT")
+        playerWalk(self.AppID, victim, [("RIGHT", 12)])
             
         try:
             playerSteal(self.AppID, acc, victim.address)
@@ -626,8 +1030,8 @@ class AllTests(MonsterArenaTestCommon):
 
     @classmethod
     def test_StealFromOfflinePlayer(self):
-        acc = sandbox.get_accounts()[1]
-        victim = sandbox.get_accounts()[0]
+        acc = getAccounts()[1]
+        victim = getAccounts()[0]
         exitAndSavePlayer(self.AppID, victim)
         
         try:
@@ -637,12 +1041,524 @@ class AllTests(MonsterArenaTestCommon):
             assert True
 
 
+    @classmethod
+    def test_WorldReplay(self):
+        snapshotPath = os.path.join(self.worldDir, "world.snap")
+        logPath = os.path.join(self.worldDir, "world.log")
+        try:
+            self.worldFollower.waitFor(getAlgodClient().status()["last-round"])
+            self.worldRecorder.stop()
+            self.worldFollower.stop()
+            with loadWorld(snapshotPath) as world:
+                replayed = world.replay(logPath)
+        except:
+            assert False, "Unable to replay the world from its snapshot"
+        finally:
+            shutil.rmtree(self.worldDir, ignore_errors=True)
+
+        assert replayed.round == self.worldRecorder.round, "Replay stopped short of the recorded rounds"
+        assert replayed.monsters().toDicts() == self.getMonsterBoxContents(), "Replayed monsters =/= monsters in blockchain"
+        replayedPlayers = sorted(replayed.localStates().toDicts(), key=lambda p: p["ADDRESS"])
+        assert replayedPlayers == self.getCrawledLocalStates(), "Replayed local states =/= local states in blockchain"
 
 
-if __name__ == "__main__":
+    # the node, not the contract, turns down a call whose box isn't in its box
+    # references (--local included: LocalNode checks the refs and quota too)
+    @classmethod
+    def test_UnreferencedBox(self):
+        acc = getAccounts()[0]
+        cachedLocalVal = self.getPlayerLocalState(acc)
+        txn = ApplicationCallTxn(
+            sender=acc.address,
+            index=self.AppID,
+            sp=getSuggestedParams(fee=constants.MIN_TXN_FEE * 2),
+            on_complete=OnComplete.NoOpOC.real,
+            app_args=["enterPlayer"])
+        try:
+            sendSigned(getAlgodClient(), signTxns(txn, acc.private_key))
+            rejected = False
+        except:
+            rejected = True
+        assert rejected, "enterPlayer should be rejected without the player's box reference"
+        assert self.getPlayerLocalState(acc) == cachedLocalVal, "a rejected call changed the player's local state"
+
+
+    # On an arena of its own: a kill planned from a table gone stale is rejected
+    # and sent again from a fresh read, and a kill without a slot hint scans the
+    # shard on budget pooled from "budget" calls
+    @classmethod
+    def test_KillMonsterHints(self, n=40):
+        AppID = DeployAndFundApp()
+        accounts = getAccounts()
+        for acc in accounts:
+            playerOptIn(AppID, acc)
+            enterPlayer(AppID, acc)
+        asaIDs = addMonsters(AppID, [(i % 10, i // 10) for i in range(n)])
+        planned = getMonsterTable(AppID)
+
+        # the first kill frees slot 0 and the shard's last monster moves into it
+        moved = int(planned.asa[len(planned) - 1])
+        playerKillMonster(AppID, accounts[0], asaIDs[0], monsters=planned)
+        assert getMonsterTable(AppID).locate(moved) == (0, 0), "the last monster should fill the freed slot"
+        try:
+            playerKillMonster(AppID, accounts[1], moved, monsters=planned)
+        except:
+            assert False, "a kill from a stale table should be retried from a fresh one"
+        assert getLocalState(AppID, accounts[1].address)["UNSECURED_ASSET"] == moved, "stale kill took the wrong monster"
+
+        monsters = getMonsterTable(AppID)
+        last = int(monsters.asa[len(monsters) - 1])
+        assert killScanBudgetCalls(len(monsters)) > 0, "a scan of {} monsters should need pooled budget".format(len(monsters))
+        try:
+            playerKillMonster(AppID, accounts[2], last, hint=False)
+        except:
+            assert False, "a kill without a hint should scan on pooled budget"
+        assert getLocalState(AppID, accounts[2].address)["UNSECURED_ASSET"] == last, "scan took the wrong monster"
+        assert getMonsterTable(AppID).locate(last) is None, "killed monster still on the map"
+
+
+    # ArenaEngine against the contract's own TEAL (run by TealEvaluator) on one
+    # random call sequence: the two must accept and reject the same calls, and
+    # leave the same boxes, local states and NFT holders behind every time
+    @classmethod
+    def test_EngineMatchesContract(self, calls=2000, seed=7):
+        rng = random.Random(seed)
+        with open(APPROVAL_SRC, "r", encoding="utf-8") as f:
+            program = TealProgram(f.read())
+        admin, *players = [bytes([i]) * 32 for i in range(1, 8)]
+        state = AppState(0, b"\xaa" * 32)
+        state.apply(program.evaluate(AppCall(admin, 0), state))
+        state.appID = 1
+        engine = ArenaEngine(admin)
+        holders = {}
+
+        # mostly calls that can go through: active players, inactive ones entering,
+        # walks that stay near the safe zone
+        def randomCall():
+            active = [p for p in players if engine.localState.get(p, [0] * len(LOCAL_KEYS))[3]]
+            sender = rng.choice(active) if active and rng.random() < 0.8 else rng.choice(players)
+            local = engine.localState.get(sender, [0] * len(LOCAL_KEYS))
+            kind = rng.choice(["setup", "addMonsterShard", "addMonster", "addMonsters", "addMonsters", "optIn",
+                               "enterPlayer", "enterPlayer", "exitAndSavePlayer", "playerMove", "playerMove",
+                               "playerMove", "playerKillMonster", "playerKillMonster", "pvpSteal", "pvpSteal",
+                               "secureAsset", "secureAsset", "budget", "dance"])
+            if kind in ("setup", "addMonsterShard", "addMonster", "addMonsters") and rng.random() < 0.9:
+                sender = admin
+            inactive = [p for p in players if p not in active]
+            # (entering while active zeroes SCORE for good: the save box is all zeros)
+            if kind == "enterPlayer" and inactive and rng.random() < 0.95:
+                sender = rng.choice(inactive)
+            shardArg = [rng.randrange(len(engine.shardCounts()) + 1)] if rng.random() < 0.8 else []
+            # opting in twice is the ledger's to reject, not the program's
+            newPlayers = [p for p in players if p not in engine.localState]
+            if kind == "optIn" and newPlayers:
+                return rng.choice(newPlayers), [], [], [], OnComplete.OptInOC.real
+            if kind == "addMonster":
+                return sender, ["addMonster", rng.randrange(30), rng.randrange(30)] + shardArg, [], [], 0
+            if kind == "addMonsters":
+                positions = [(rng.randrange(30), rng.randrange(30)) for _ in range(rng.randint(1, MAX_MONSTERS_PER_CALL + 1))]
+                return sender, ["addMonsters", packMonsterPositions(positions)] + shardArg, [], [], 0
+            if kind == "playerMove":
+                if rng.random() < 0.5:
+                    return sender, ["playerMove", rng.choice(["UP", "DOWN", "LEFT", "RIGHT", "NORTH"])], [], [], 0
+                path = pathTo(local[0], local[1], rng.randrange(16), rng.randrange(16))
+                if not path or rng.random() < 0.2:
+                    path = [(rng.choice("UDLR"), rng.randrange(8)) for _ in range(rng.randint(1, 4))]
+                return sender, ["playerMove", encodePath(path)], [], [], 0
+            if kind == "playerKillMonster":
+                live = [a for a, holder in holders.items() if holder is None]
+                asaID = rng.choice(live) if live and rng.random() < 0.8 else rng.randrange(1, engine.nextAssetID + 2)
+                shard, slot = engine._monsterSlot.get(asaID, (rng.randrange(3), rng.randrange(5)))
+                args = ["playerKillMonster"]
+                if rng.random() < 0.8:
+                    args += [slot if rng.random() < 0.8 else rng.randrange(MAX_MONSTERS), shard]
+                return sender, args, [], [asaID], 0
+            if kind == "pvpSteal":
+                victim = rng.choice(players)
+                asaID = engine.localState.get(victim, [0] * len(LOCAL_KEYS))[2]
+                return sender, ["pvpSteal"], [victim], [asaID] if asaID else [], 0
+            return sender, [kind], [], [local[2]] if local[2] else [], 0
+
+        for n in range(calls):
+            sender, args, accounts, assets, onComplete = randomCall()
+            call = AppCall(sender, 1, args, accounts, assets, onComplete, firstAssetID=engine.nextAssetID)
+            try:
+                evaluation = program.evaluate(call, state, budget=APP_CALL_BUDGET * MAX_GROUP_SIZE)
+                contractError = None
+            except TealReject as e:
+                evaluation, contractError = None, e
+            try:
+                if onComplete == OnComplete.OptInOC.real:
+                    engine.optIn(sender)
+                else:
+                    engine.call(sender, call.args, accounts, assets)
+                engineError = None
+            except ArenaReject as e:
+                engineError = e
+            what = "call {} {}".format(n, [a if isinstance(a, str) else a.hex() if isinstance(a, bytes) else a for a in args[:1]])
+            assert (contractError is None) == (engineError is None), \
+                "{}: contract {}, engine {}".format(what, contractError or "approves", engineError or "approves")
+            if evaluation is None:
+                continue
+
+            state.apply(evaluation)
+            for t in evaluation.innerTxns:
+                if "CreatedAssetID" in t:
+                    holders[t["CreatedAssetID"]] = None
+                else:
+                    holders[t["XferAsset"]] = None if t["AssetReceiver"] == state.appAddress else t["AssetReceiver"]
+            assert state.boxes == {name: bytes(box) for name, box in engine.boxes.items()}, what + ": boxes differ"
+            contractLocal = {a: [local.get(k.encode(), 0) for k in LOCAL_KEYS] for a, local in state.local.items()}
+            assert contractLocal == engine.localState, what + ": local states differ"
+            assert holders == engine.assetHolder, what + ": NFT holders differ"
+
+
+    # ArenaScheduler's packer: a group closes at 16 txns (the fee payer's
+    # included), an app call holds 8 references (box refs, and the foreign
+    # app a box of another app needs), and the fees cover every txn and inner
+    # txn of the group
+    @classmethod
+    def test_PackActions(self):
+        acc, payer = getAccounts()[:2]
+        sp = getSuggestedParams()
+        def move(**refs):
+            return ApplicationCallTxn(acc.address, sp, self.AppID, OnComplete.NoOpOC.real, app_args=["playerMove", "UP"], **refs)
+
+        groups = packActions([Action(acc, [move()]) for _ in range(20)])
+        assert [len(g.txns) for g in groups] == [16, 4], "groups of {} txns".format([len(g.txns) for g in groups])
+        groups = packActions([Action(acc, [move()]) for _ in range(20)], feePayer=payer)
+        assert [len(g.txns) for g in groups] == [16, 6], "groups of {} txns with a fee payer".format([len(g.txns) for g in groups])
+
+        boxes = [(self.AppID, bytes([i]) * 32, PLAYER_RECORD_SIZE) for i in range(MAX_TXN_REFERENCES + 1)]
+        try:
+            packActions([Action(acc, [move()], boxes=boxes)])
+            fits = True
+        except ValueError:
+            fits = False
+        assert not fits, "9 box refs should not fit on one app call"
+        groups = packActions([Action(acc, [move()], boxes=boxes[:-1]), Action(acc, [move()], boxes=boxes[-1:])])
+        assert len(groups) == 1, "the last box ref should go on the second call of the group"
+        assert [len(t.boxes) for t in groups[0].txns] == [MAX_TXN_REFERENCES, 1], "box refs spread wrong"
+
+        otherApp = self.AppID + 1
+        action = Action(acc, [move(foreign_assets=list(range(1, MAX_TXN_REFERENCES - 1)))], boxes=[(otherApp, b"box", 8)])
+        for _ in range(2):
+            (group,) = packActions([action])
+            t = group.txns[0]
+            assert t.foreign_apps == [otherApp] and t.boxes[0].app_index == 1, "box of another app not referenced through it"
+        try:
+            packActions([Action(acc, [move(foreign_assets=list(range(1, MAX_TXN_REFERENCES)))], boxes=[(otherApp, b"box", 8)])])
+            fits = True
+        except ValueError:
+            fits = False
+        assert not fits, "a box of another app needs a slot for the app too"
+
+        kills = [Action(acc, [move(), move()], innerTxns=1) for _ in range(3)]
+        (group,) = packActions(kills)
+        assert sum(t.fee for t in group.txns) == group.fee == constants.MIN_TXN_FEE * (6 + 3), "fees {}".format(group.fee)
+        (group,) = packActions(kills, feePayer=payer)
+        assert group.txns[0].sender == payer.address and group.txns[0].fee == group.fee == constants.MIN_TXN_FEE * (1 + 6 + 3), \
+            "fee payer's fee {}".format(group.txns[0].fee)
+        assert all(t.fee == 0 for t in group.txns[1:]), "only the fee payer should pay"
+
+
+    # TickScheduler splits a rejected group until the failing action is alone,
+    # and lands the others (the submitter is a stand-in refusing the bad move)
+    @classmethod
+    def test_TickSchedulerSplits(self):
+        acc = getAccounts()[0]
+        sp = getSuggestedParams()
+        actions = [Action(acc, [ApplicationCallTxn(acc.address, sp, self.AppID, OnComplete.NoOpOC.real,
+                                                   app_args=["playerMove", "NORTH" if i == 5 else "UP"])],
+                          label="bad" if i == 5 else "move")
+                   for i in range(8)]
+
+        class RefusingSubmitter:
+            def submit(self, stxns):
+                future = Future()
+                if any(s.transaction.app_args[1] == b"NORTH" for s in stxns):
+                    future.set_exception(TxnRejectedError(stxns[0].get_txid(), "bad direction"))
+                else:
+                    future.set_result({"confirmed-round": 1})
+                return future
+
+        report = TickScheduler(RefusingSubmitter()).run(actions)
+        summary = report.summary()
+        assert summary["confirmedActions"] == 7 and summary["rejectedActions"] == 1, "tick summary {}".format(summary)
+        assert [g["labels"] for g in report.groups if g["rejected"]] == [["bad"]], "the bad move should be rejected alone"
+        assert summary["splits"] == 3, "8 actions need 3 splits to isolate one, not {}".format(summary["splits"])
+
+
+    # TealProfiler on a snippet costed by hand: two methods behind a create
+    # branch, a loop bounded by n and a subroutine. Dispatch is the create check
+    # (4) plus 4 per method compared; count runs 7 per iteration plus 6 around
+    # it. Running the snippet must cost what the profiler gives as the worst case.
+    @classmethod
+    def test_ProfilerCosts(self):
+        source = "\n".join([
+            "#pragma version 8",
+            "txn ApplicationID", "pushint 0", "==", "bz main",
+            "int 1", "return",
+            "main:",
+            'pushbytes "check"', "txna ApplicationArgs 0", "==", "bnz check",
+            'pushbytes "count"', "txna ApplicationArgs 0", "==", "bnz count",
+            "err",
+            "check:",
+            "txna ApplicationArgs 1", "btoi", "int 3", "<", "return",
+            "count:",
+            "int 0",
+            "countLoop:",
+            "int 1", "+", "dup", "txna ApplicationArgs 1", "btoi", "<", "bnz countLoop",
+            "callsub double",
+            "return",
+            "double:",
+            "int 2", "*", "retsub"])
+        counts = (1, 2, 10, 50)
+        report = profile(source, counts, {"countLoop": ("n - 1", "(n - 1) / 2")})
+        assert not report["warnings"], "unexpected profiler warnings: {}".format(report["warnings"])
+        assert sorted(report["entries"]) == ["check", "count"], "profiler found methods {}".format(sorted(report["entries"]))
+
+        check = report["entries"]["check"]
+        assert check["dispatch"] == 8 and all(c == 8 + 5 for c in check["worst"].values()), "check costs {}".format(check)
+        count = report["entries"]["count"]
+        assert count["dispatch"] == 12, "count dispatch {}".format(count["dispatch"])
+        for n in counts:
+            assert count["worst"][str(n)] == 12 + 6 + 7 * n, "count worst at n={}: {}".format(n, count["worst"][str(n)])
+            assert count["typical"][str(n)] == 12 + 6 + 7 * (1 + math.ceil((n - 1) / 2)), \
+                "count typical at n={}: {}".format(n, count["typical"][str(n)])
+        assert report["subroutines"]["double"]["worst"]["1"] == 3, "double() {}".format(report["subroutines"]["double"])
+
+        program = TealProgram(source)
+        state = AppState(1, b"\xaa" * 32)
+        for n in counts:
+            evaluation = program.evaluate(AppCall(b"\x01" * 32, 1, ["count", n]), state)
+            assert evaluation.cost == count["worst"][str(n)], \
+                "count({}) ran at {}, profiled at {}".format(n, evaluation.cost, count["worst"][str(n)])
+        assert program.evaluate(AppCall(b"\x01" * 32, 1, ["check", 2]), state).cost == 13, "check ran off its profile"
+
+
+    # ReadCache behind a PooledAlgodClient whose pool only counts requests: a
+    # lookup is fetched once until our write to its app drops it, a later round
+    # or maxAge expires it, and uncached paths always go to the node
+    @classmethod
+    def test_ReadCache(self):
+        class CountingPool:
+            def __init__(self):
+                self.requests = []
+                self.round = 10
+
+            def request(self, method, path, headers, data=None):
+                self.requests.append(path)
+                return 200, json.dumps({"round": self.round, "value": len(self.requests)}).encode()
+
+        cache = ReadCache(maxAge=60)
+        client = PooledAlgodClient("a" * 64, "http://localhost:1", cache=cache)
+        client.pool = pool = CountingPool()
+        box = lambda app: client.algod_request("GET", "/applications/{}/box".format(app), params={"name": "b64:AA=="})
+
+        first = box(5)
+        assert box(5) == first and len(pool.requests) == 1, "a repeated box read should be served from the cache"
+        box(6)
+        assert len(pool.requests) == 2, "another app's box is another entry"
+        client.algod_request("GET", "/status")
+        client.algod_request("GET", "/status")
+        assert len(pool.requests) == 4, "/status should never be cached"
+
+        acc = getAccounts()[0]
+        cache.invalidateWrites([ApplicationCallTxn(acc.address, getSuggestedParams(), 5, OnComplete.NoOpOC.real, app_args=["budget"])])
+        assert box(5) != first and len(pool.requests) == 5, "a write to app 5 should drop its boxes"
+        box(6)
+        assert len(pool.requests) == 5, "a write to app 5 should not drop app 6's boxes"
+
+        cache.observeRound(11)
+        box(6)
+        assert len(pool.requests) == 6, "a box read at round 10 should be stale at round 11"
+        lagging = ReadCache(maxLag=2, maxAge=60)
+        client.cache = lagging
+        box(5)
+        lagging.observeRound(12)
+        box(5)
+        assert len(pool.requests) == 7, "maxLag=2 should serve round 10 at round 12"
+        lagging.observeRound(13)
+        box(5)
+        assert len(pool.requests) == 8, "maxLag=2 should not serve round 10 at round 13"
+
+        client.cache = ReadCache(maxAge=0.05)
+        box(5)
+        box(5)
+        time.sleep(0.1)
+        box(5)
+        assert len(pool.requests) == 10, "an entry older than maxAge should be fetched again"
+        assert client.cache.stats()["hits"] == 1 and cache.stats()["invalidations"] == 1, "cache counters off"
+
+
+    # SuggestedParamsCache over a client counting suggested_params() calls: one
+    # fetch serves until a later round is seen, the validity window runs short,
+    # maxAge passes or it is invalidated, and fee overrides never leak into it
+    @classmethod
+    def test_SuggestedParamsCache(self):
+        class CountingClient:
+            def __init__(self, window):
+                self.calls = 0
+                self.round = 100
+                self.window = window
+
+            def suggested_params(self):
+                self.calls += 1
+                return transaction.SuggestedParams(0, self.round, self.round + self.window, "gh", flat_fee=False)
+
+        client = CountingClient(1000)
+        params = SuggestedParamsCache(client)
+        sp = params.get(fee=3000)
+        assert sp.fee == 3000 and sp.flat_fee, "fee override not applied"
+        sp = params.get()
+        assert client.calls == 1 and params.hits == 1, "second get should not fetch"
+        assert sp.fee == 0 and not sp.flat_fee, "a fee override leaked into the cached params"
+        assert params.knownRound() == 100, "the fetch should tell us round 100"
+
+        params.observeRound(99)
+        params.get()
+        assert client.calls == 1, "an older round should not make the params stale"
+        client.round = 101
+        params.observeRound(101)
+        assert params.get().first == 101 and client.calls == 2, "a newer round should make the params stale"
+        params.invalidate()
+        params.get()
+        assert client.calls == 3, "invalidate() should force a fetch"
+
+        short = CountingClient(5)
+        params = SuggestedParamsCache(short, minValidityLeft=10)
+        params.get()
+        params.get()
+        assert short.calls == 2, "params valid for fewer than minValidityLeft rounds should not be reused"
+
+        params = SuggestedParamsCache(client, maxAge=0.05)
+        params.get()
+        params.get()
+        time.sleep(0.1)
+        params.get()
+        assert client.calls == 5, "params older than maxAge should be fetched again"
+
+
+    # CompileCache over a client counting compile() calls: a program is compiled
+    # once per genesis hash, pragma and source, and a fresh cache on the same
+    # directory reuses what the last one wrote
+    @classmethod
+    def test_CompileCache(self):
+        class CountingClient:
+            def __init__(self):
+                self.calls = 0
+
+            def compile(self, source):
+                self.calls += 1
+                return {"result": b64encode(source.encode()).decode()}
+
+        directory = tempfile.mkdtemp()
+        try:
+            client = CountingClient()
+            cache = CompileCache(directory)
+            source = "#pragma version 8\nint 1\nreturn"
+            program = cache.compile(client, source, "genesisA")
+            assert program == source.encode() and client.calls == 1, "first compile should go to algod"
+            assert cache.compile(client, source, "genesisA") == program and client.calls == 1, "second compile should be cached"
+
+            cache.compile(client, source.replace("int 1", "int 2"), "genesisA")
+            assert client.calls == 2, "a changed source should miss the cache"
+            cache.compile(client, source.replace("version 8", "version 9"), "genesisA")
+            assert client.calls == 3, "a changed pragma should miss the cache"
+            cache.compile(client, source, "genesisB")
+            assert client.calls == 4, "another network should miss the cache"
+            assert cache.hits == 1 and cache.misses == 4, "cache counted {} hits, {} misses".format(cache.hits, cache.misses)
+
+            fresh = CompileCache(directory)
+            assert fresh.compile(client, source, "genesisB") == program and client.calls == 4, "the on-disk program should be reused"
+            assert fresh.hits == 1 and len(os.listdir(directory)) == 4, "expected 4 cached programs on disk"
+        finally:
+            shutil.rmtree(directory)
+
+
+    # PlayerGrid against a brute force checkDistInRange scan over random players,
+    # with players and queries put on cell edges, the safe zone's edges, just
+    # inside and outside non-square radii and far enough out to overflow the
+    # check; then kept in sync with a snapshot whose players move and leave
+    @classmethod
+    def test_PlayerGrid(self, players=300, queries=200, seed=11):
+        rng = random.Random(seed)
+        edges = [0, 1, GRID_CELL - 1, GRID_CELL, GRID_CELL + 1, 2 * GRID_CELL, 3 * GRID_CELL - 1]
+        coord = lambda: rng.choice(edges) if rng.random() < 0.3 else rng.randrange(80)
+        local = {}
+        for _ in range(players):
+            local[os.urandom(32)] = (coord(), coord(), rng.choice([0, 0, 12]), rng.choice([0, 1, 5]))
+        for x, y in [(0, 0), (10, 10), (10, 11), (11, 10), (6, 8), (2**31, 5), (2**32, 2**32)]:
+            local[os.urandom(32)] = (x, y, 12, 1)
+        world = {algosdk.encoding.encode_address(k): v for k, v in local.items()}
+
+        def bruteWithin(x, y, rSq, holdingOnly=False, exclude=None):
+            found = []
+            for addr, (px, py, asset, score) in world.items():
+                if score == 0 or addr == exclude or (holdingOnly and not asset):
+                    continue
+                try:
+                    if checkDistInRange(x, y, px, py, rSq):
+                        found.append((addr, (px - x) ** 2 + (py - y) ** 2))
+                except ArenaReject:
+                    pass
+            return found
+
+        def check(grid):
+            assert len(grid) == sum(1 for v in world.values() if v[3]), "grid holds {} players".format(len(grid))
+            assert sorted(grid.inSafeZone()) == sorted(a for a, v in world.items() if v[3] and inSafeZone(v[0], v[1])), \
+                "inSafeZone differs from the brute force scan"
+            assert sorted(grid.inSafeZone(holdingOnly=True)) == \
+                sorted(a for a, v in world.items() if v[3] and v[2] and inSafeZone(v[0], v[1])), "inSafeZone(holdingOnly) differs"
+            points = [(x, y) for x in edges for y in edges] + [(coord(), coord()) for _ in range(queries)]
+            for i, (x, y) in enumerate(points):
+                rSq = rng.choice([0, 1, 2, 99, 100, 101, STEAL_RANGE_SQ, 4 * STEAL_RANGE_SQ + 1, 2500])
+                exclude = rng.choice(list(world)) if i % 3 == 0 else None
+                got = grid.within(x, y, rSq, exclude=exclude)
+                assert sorted(got) == sorted(bruteWithin(x, y, rSq, exclude=exclude)), "within({}, {}, {}) differs".format(x, y, rSq)
+                assert [d for _, d in got] == sorted(d for _, d in got), "within({}, {}, {}) not nearest first".format(x, y, rSq)
+                targets = grid.stealTargets(x, y, exclude=exclude)
+                assert sorted(targets) == sorted(a for a, _ in bruteWithin(x, y, STEAL_RANGE_SQ, True, exclude)), \
+                    "stealTargets({}, {}) differs".format(x, y)
+                for k in (1, 3, 50, players + 10):
+                    for holdingOnly in (False, True):
+                        near = grid.nearest(x, y, k, holdingOnly=holdingOnly, exclude=exclude)
+                        expected = sorted((px - x) ** 2 + (py - y) ** 2 for a, (px, py, asset, score) in world.items()
+                                          if score and a != exclude and (asset or not holdingOnly))[:k]
+                        assert [d for _, d in near] == expected, "nearest({}, {}, {}) differs".format(x, y, k)
+
+        grid = PlayerGrid.fromTable(WorldSnapshot(1, {}, dict(local)).localStates())
+        check(grid)
+        # within a radius of exactly 100 (6, 8) is in range, within 99 it is not
+        assert any(d == 100 for _, d in grid.within(0, 0, 100)) and all(d < 100 for _, d in grid.within(0, 0, 99)), "radius edge"
+
+        synced = PlayerGrid()
+        synced.sync(WorldSnapshot(1, {}, dict(local)))
+        check(synced)
+        for _ in range(3):
+            keys = list(local)
+            for key in rng.sample(keys, 40):
+                x, y, asset, score = local[key]
+                local[key] = (coord(), coord(), asset, score)
+            for key in rng.sample(keys, 10):
+                del local[key]
+            for key in rng.sample(list(local), 10):
+                local[key] = local[key][:3] + (0,)
+            for _ in range(10):
+                local[os.urandom(32)] = (coord(), coord(), 12, 1)
+            world = {algosdk.encoding.encode_address(k): v for k, v in local.items()}
+            synced.sync(WorldSnapshot(2, {}, dict(local)))
+            check(synced)
+
+
+
+
+# deploys a fresh arena, opts every account in and runs AllTests against it
+def runAllTests():
     try:
         AppID = DeployAndFundApp()
-        for acc in sandbox.get_accounts():
+        for acc in getAccounts():
             playerOptIn(AppID, acc)
     except:
         assert False, "Failed to deploy and fund contract. Possibly has syntax bugs"
@@ -651,6 +1567,7 @@ if __name__ == "__main__":
     AllTests.AppID = AppID
     AllTests.test_AddMonsters()
     AllTests.test_AddPlayers()
+    AllTests.test_RecordWorld()
     AllTests.test_MonsterASAs()
     AllTests.test_SecureAssetWithoutLocalSpace()
     AllTests.test_playerKillMonster()
@@ -659,6 +1576,38 @@ if __name__ == "__main__":
     AllTests.test_SecureAssetOutsideSafeZone()
     AllTests.test_PlayerMove()
     AllTests.test_SecureAsset()
+    AllTests.test_Leaderboard()
     AllTests.test_StealFromPlayer()
     AllTests.test_StealFromFarAwayPlayer()
-    AllTests.test_StealFromOfflinePlayer()
\ No newline at end of file
+    AllTests.test_StealFromOfflinePlayer()
+    AllTests.test_WorldReplay()
+    AllTests.test_UnreferencedBox()
+    AllTests.test_KillMonsterHints()
+    AllTests.test_EngineMatchesContract()
+    AllTests.test_ProfilerCosts()
+    AllTests.test_PackActions()
+    AllTests.test_TickSchedulerSplits()
+    AllTests.test_ReadCache()
+    AllTests.test_SuggestedParamsCache()
+    AllTests.test_CompileCache()
+    AllTests.test_PlayerGrid()
+    return AppID
+
+
+
+
+if __name__ == "__main__":
+    # --local runs everything against an in-process stand-in instead of the sandbox
+    if "--local" in sys.argv:
+        from ArenaLocalNode import LocalNode
+        localNode = LocalNode().start()
+        useNode(localNode.algodAddress, localNode.indexerAddress, localNode.accounts)
+    # --trace writes every helper call to arena-trace.jsonl, the histograms to arena-metrics.jsonl
+    if "--trace" in sys.argv:
+        import ArenaTrace
+        ArenaTrace.enable("arena-trace.jsonl")
+
+    runAllTests()
+
+    if "--trace" in sys.argv:
+        ArenaTrace.writeMetrics("arena-metrics.jsonl")
@@ -0,0 +1,348 @@
+from algosdk import encoding
+from bisect import bisect_left
+from array import array
+import msgpack
+import struct
+import mmap
+import sys
+import os
+
+from ArenaCodec import decodeMonsterDirectory, decodeMonsterShards, isMonsterBoxName, monsterShardName, \
+    MonsterTable, PlayerTable, MONSTER_DIR_NAME, MONSTER_DIR_SIZE, MONSTER_BOX_SIZE, PLAYER_RECORD_SIZE
+from ArenaEngine import ArenaEngine, addressToKey, LOCAL_KEYS
+from ArenaFollower import AppCall, WorldSnapshot, applyAppCall
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# World snapshot file. Every field is a uint64 (big-endian, like the boxes) in
+# a column of its own at an offset that follows from the header's counts, so a
+# reader maps the file and takes views, with nothing to parse:
+#
+#   header      |magic|appID|round|nextAssetID|players|shards|assets|admin (32 bytes)|
+#   keys        players x 32-byte player key, sorted
+#   columns     one per PLAYER_COLUMNS, players x uint64 each
+#   directory   the MONSTERDIR box as is (absent when shards is 0)
+#   shards      shards x MONSTER boxes as is
+#   assets      ASA_ID column, HOLDER column (row in keys, or APP_HOLDER)
+#
+# LOCAL / BOX are 1 where the player is opted in / has a save box.
+SNAPSHOT_MAGIC = b"ARENASNP"
+PLAYER_COLUMNS = ("LOCAL", "POS_X", "POS_Y", "UNSECURED_ASSET", "SCORE",
+                  "BOX", "BOX_POS_X", "BOX_POS_Y", "BOX_UNSECURED_ASSET", "BOX_SCORE")
+APP_HOLDER = (1 << 64) - 1
+_header = struct.Struct(">8sQQQQQQ32s")
+
+# replay log: a msgpack header map, then one [round, [AppCall, ...]] per block
+LOG_MAGIC = "ARENALOG"
+
+
+def _packColumn(values):
+    words = array("Q", values)
+    if sys.byteorder == "little":
+        words.byteswap()
+    return words.tobytes()
+
+
+def _layout(players, shards, assets):
+    keys = _header.size
+    columns = keys + 32 * players
+    directory = columns + 8 * players * len(PLAYER_COLUMNS)
+    shardBoxes = directory + (MONSTER_DIR_SIZE if shards else 0)
+    assetColumns = shardBoxes + MONSTER_BOX_SIZE * shards
+    return keys, columns, directory, shardBoxes, assetColumns, assetColumns + 16 * assets
+
+
+# Writes an engine's state as of round (e.g. from WorldFollower.withEngine),
+# to a temporary file renamed into place.
+def writeSnapshot(path, AppID, round, engine):
+    keys = sorted(set(engine.localState) | {n for n in engine.boxes if not isMonsterBoxName(n)}
+                  | {h for h in engine.assetHolder.values() if h is not None})
+    row = {k: i for i, k in enumerate(keys)}
+    columns = [[] for _ in PLAYER_COLUMNS]
+    for key in keys:
+        local = engine.localState.get(key)
+        box = engine.boxes.get(key)
+        values = [1] + list(local) if local is not None else [0] * 5
+        if box is not None:
+            if len(box) != PLAYER_RECORD_SIZE:
+                raise ValueError("player box of {} bytes".format(len(box)))
+            values += [1] + [int.from_bytes(box[i:i + 8], "big") for i in range(0, PLAYER_RECORD_SIZE, 8)]
+        else:
+            values += [0] * 5
+        for column, v in zip(columns, values):
+            column.append(v)
+
+    shards = len(engine.shardCounts())
+    assets = sorted(engine.assetHolder.items())
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_header.pack(SNAPSHOT_MAGIC, AppID, round, engine.nextAssetID, len(keys), shards, len(assets),
+                             bytes(engine.admin)))
+        f.write(b"".join(keys))
+        for column in columns:
+            f.write(_packColumn(column))
+        if shards:
+            f.write(bytes(engine.boxes[MONSTER_DIR_NAME]))
+            for shard in range(shards):
+                f.write(bytes(engine.boxes[monsterShardName(shard)]))
+        f.write(_packColumn(a for a, _ in assets))
+        f.write(_packColumn(APP_HOLDER if h is None else row[h] for _, h in assets))
+    os.replace(tmp, path)
+
+
+# A snapshot file, mapped. Columns are views into the map (numpy) or arrays of
+# native uint64 (without numpy, one copy each); a player is looked up by binary
+# search over the sorted keys. Reads like a WorldSnapshot, and replay() rolls
+# it forward through a replay log.
+class MappedWorld:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.AppID, self.round, self.nextAssetID, self.players, self.shards, self.assets, self.admin = \
+            _header.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a world snapshot".format(path))
+        self._keys, self._columns, self._directory, self._shardBoxes, self._assetColumns, size = \
+            _layout(self.players, self.shards, self.assets)
+        if len(self._mm) != size:
+            raise ValueError("{} is {} bytes, its header says {}".format(path, len(self._mm), size))
+        self._view = memoryview(self._mm)
+        self._cache = {}
+
+    def close(self):
+        self._cache.clear()
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # columns handed out still point into the map; it goes with them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.players
+
+    def _uint64s(self, offset, count):
+        if np is not None:
+            return np.frombuffer(self._mm, dtype=">u8", count=count, offset=offset)
+        words = array("Q")
+        words.frombytes(self._view[offset:offset + 8 * count])
+        if sys.byteorder == "little":
+            words.byteswap()
+        return words
+
+    def column(self, name):
+        c = self._cache.get(name)
+        if c is None:
+            i = PLAYER_COLUMNS.index(name)
+            c = self._cache[name] = self._uint64s(self._columns + 8 * self.players * i, self.players)
+        return c
+
+    def key(self, row):
+        return bytes(self._view[self._keys + 32 * row:self._keys + 32 * row + 32])
+
+    def keys(self):
+        return [self.key(i) for i in range(self.players)]
+
+    # row of a player (address or 32-byte key), or -1
+    def rowOf(self, address):
+        key = address if isinstance(address, bytes) else addressToKey(address)
+        i = bisect_left(range(self.players), key, key=self.key)
+        return i if i < self.players and self.key(i) == key else -1
+
+    def _rows(self, flag):
+        column = self.column(flag)
+        if np is not None:
+            return np.flatnonzero(column)
+        return [i for i, v in enumerate(column) if v]
+
+    def _table(self, flag, fields, address):
+        rows = self._rows(flag)
+        if np is not None:
+            columns = [self.column(f)[rows] for f in fields]
+        else:
+            columns = [array("Q", (self.column(f)[i] for i in rows)) for f in fields]
+        return PlayerTable([address(self.key(int(i))) for i in rows], *columns)
+
+
+    # the WorldSnapshot reads
+
+    def monsterDirectory(self):
+        if not self.shards:
+            return []
+        return decodeMonsterDirectory(self._view[self._directory:self._directory + MONSTER_DIR_SIZE])
+
+    def monsterBox(self, shard=0):
+        if shard >= self.shards:
+            return None
+        start = self._shardBoxes + MONSTER_BOX_SIZE * shard
+        return self._view[start:start + MONSTER_BOX_SIZE]
+
+    def monsters(self) -> MonsterTable:
+        return decodeMonsterShards([self.monsterBox(s) for s in range(len(self.monsterDirectory()))])
+
+    def playerBox(self, address):
+        i = self.rowOf(address)
+        if i < 0 or not self.column("BOX")[i]:
+            return None
+        return {k: int(self.column("BOX_" + k)[i]) for k in LOCAL_KEYS}
+
+    def localState(self, address):
+        i = self.rowOf(address)
+        if i < 0 or not self.column("LOCAL")[i]:
+            return None
+        return {k: int(self.column(k)[i]) for k in LOCAL_KEYS}
+
+    # save boxes by raw key, like WorldSnapshot.playerBoxes
+    def playerBoxes(self) -> PlayerTable:
+        return self._table("BOX", ["BOX_" + k for k in LOCAL_KEYS], lambda k: k)
+
+    # opted-in players by address, like WorldSnapshot.localStates
+    def localStates(self) -> PlayerTable:
+        return self._table("LOCAL", LOCAL_KEYS, encoding.encode_address)
+
+    # minted ASA id -> holder's key, or None for the app
+    def assetHolders(self):
+        asa = self._uint64s(self._assetColumns, self.assets).tolist()
+        holder = self._uint64s(self._assetColumns + 8 * self.assets, self.assets).tolist()
+        return {a: None if h == APP_HOLDER else self.key(h) for a, h in zip(asa, holder)}
+
+
+    # rebuilding
+
+    def toEngine(self) -> ArenaEngine:
+        keys = self.keys()
+        columns = [self.column(c).tolist() for c in PLAYER_COLUMNS]
+        localState = {}
+        boxes = {}
+        for i, key in enumerate(keys):
+            if columns[0][i]:
+                localState[key] = [c[i] for c in columns[1:5]]
+            if columns[5][i]:
+                boxes[key] = b"".join(c[i].to_bytes(8, "big") for c in columns[6:10])
+        if self.shards:
+            boxes[MONSTER_DIR_NAME] = bytes(self._view[self._directory:self._directory + MONSTER_DIR_SIZE])
+            for shard in range(self.shards):
+                boxes[monsterShardName(shard)] = bytes(self.monsterBox(shard))
+        return ArenaEngine.restore(self.admin, localState, boxes, self.assetHolders(), self.nextAssetID)
+
+    # (round, engine) after replaying the log's blocks up to toRound (default:
+    # all of them). Replay goes through the follower's applyAppCall, so it ends
+    # where the follower did.
+    def replayEngine(self, logPath, toRound=None):
+        log = ReplayLog.read(logPath)
+        if log.AppID != self.AppID or log.fromRound != self.round:
+            raise ValueError("log {} follows app {} from round {}, not this snapshot (app {} at round {})".format(
+                logPath, log.AppID, log.fromRound, self.AppID, self.round))
+        engine = self.toEngine()
+        round = self.round
+        for blockRound, calls in log:
+            if toRound is not None and blockRound > toRound:
+                break
+            for call in calls:
+                applyAppCall(engine, AppCall(*call))
+            round = blockRound
+        if toRound is not None and round < toRound:
+            raise ValueError("log {} ends at round {}, before round {}".format(logPath, round, toRound))
+        return round, engine
+
+    def replay(self, logPath, toRound=None) -> WorldSnapshot:
+        round, engine = self.replayEngine(logPath, toRound)
+        return WorldSnapshot(round, {k: bytes(v) for k, v in engine.boxes.items()},
+                             {k: tuple(v) for k, v in engine.localState.items()})
+
+
+# Append-only log of the app calls of every block after a snapshot's round.
+# A record cut short (a crash mid-append) ends the log.
+class ReplayLog:
+    def __init__(self, path, AppID, fromRound, f=None):
+        self.path = path
+        self.AppID = AppID
+        self.fromRound = fromRound
+        self._f = f
+
+    # a new log, replacing any at path
+    @classmethod
+    def create(cls, path, AppID, fromRound):
+        f = open(path, "wb")
+        f.write(msgpack.packb({"magic": LOG_MAGIC, "appID": AppID, "fromRound": fromRound}))
+        f.flush()
+        return cls(path, AppID, fromRound, f)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as f:
+            header = next(msgpack.Unpacker(f, raw=False), None)
+        if not isinstance(header, dict) or header.get("magic") != LOG_MAGIC:
+            raise ValueError("{} is not a replay log".format(path))
+        return cls(path, header["appID"], header["fromRound"])
+
+    def append(self, round, calls):
+        self._f.write(msgpack.packb([round, [list(c) for c in calls]], use_bin_type=True))
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    # (round, [call fields, ...]) per block, in order
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            unpacker = msgpack.Unpacker(f, raw=False, strict_map_key=False)
+            next(unpacker)
+            for round, calls in unpacker:
+                yield round, calls
+
+
+# Snapshots a WorldFollower's mirror between two blocks, then logs the calls
+# of every block it applies from there on. The snapshot and the log's start
+# are taken under the follower's apply lock, so no block falls between them.
+class WorldRecorder:
+    def __init__(self, follower, snapshotPath, logPath):
+        self.follower = follower
+        self.snapshotPath = snapshotPath
+        self.logPath = logPath
+        self.log = None
+        self.round = None
+
+    def start(self):
+        def begin(round, engine):
+            if engine is None:
+                raise ValueError("app {} not created as of round {}".format(self.follower.AppID, round))
+            writeSnapshot(self.snapshotPath, self.follower.AppID, round, engine)
+            self.log = ReplayLog.create(self.logPath, self.follower.AppID, round)
+            self.round = round
+            self.follower.subscribeCalls(self._onBlock)
+        self.follower.withEngine(begin)
+        return self
+
+    def _onBlock(self, round, calls):
+        if self.log is not None:
+            self.log.append(round, calls)
+            self.round = round
+
+    def stop(self):
+        # taken between blocks, so the log never ends partway through one
+        log = self.follower.withEngine(lambda round, engine: self._detach())
+        if log is not None:
+            log.close()
+
+    def _detach(self):
+        log, self.log = self.log, None
+        return log
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
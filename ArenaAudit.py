@@ -0,0 +1,234 @@
+from algosdk import encoding
+from algosdk.logic import get_application_address
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from array import array
+
+from ArenaCodec import MonsterTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# What can be wrong with a monster NFT, one bit each
+MANAGER = 1 << 0                    # manager isn't the app
+FREEZE = 1 << 1                     # freeze address isn't the app
+CLAWBACK = 1 << 2                   # clawback isn't the app
+NOT_NFT = 1 << 3                    # total isn't 1, or has decimals
+NOT_FROZEN = 1 << 4                 # not default-frozen, or its holding isn't frozen
+DESTROYED = 1 << 5
+FOREIGN = 1 << 6                    # a monster's or player's asset the app didn't create
+NO_HOLDER = 1 << 7                  # nobody swept holds it
+MANY_HOLDERS = 1 << 8
+MONSTER_NOT_IN_APP = 1 << 9         # live monster whose NFT the app doesn't hold
+UNSECURED_NOT_WITH_PLAYER = 1 << 10 # a player's UNSECURED_ASSET they don't hold
+DEAD_MONSTER_IN_APP = 1 << 11       # the app holds an NFT no live monster carries
+CLAIMED_TWICE = 1 << 12             # carried by more than one monster / player
+
+AUDIT_FLAGS = {"MANAGER": MANAGER, "FREEZE": FREEZE, "CLAWBACK": CLAWBACK, "NOT_NFT": NOT_NFT,
+               "NOT_FROZEN": NOT_FROZEN, "DESTROYED": DESTROYED, "FOREIGN": FOREIGN, "NO_HOLDER": NO_HOLDER,
+               "MANY_HOLDERS": MANY_HOLDERS, "MONSTER_NOT_IN_APP": MONSTER_NOT_IN_APP,
+               "UNSECURED_NOT_WITH_PLAYER": UNSECURED_NOT_WITH_PLAYER, "DEAD_MONSTER_IN_APP": DEAD_MONSTER_IN_APP,
+               "CLAIMED_TWICE": CLAIMED_TWICE}
+
+# expected holder of an NFT no monster or player carries: any player, not the app
+_UNCLAIMED = -1
+_APP = 0
+
+
+def flagNames(flags):
+    return [name for name, bit in AUDIT_FLAGS.items() if flags & bit]
+
+
+def _configFlags(asset, appAddress):
+    params = asset["params"]
+    flags = 0
+    if params.get("manager") != appAddress:
+        flags |= MANAGER
+    if params.get("freeze") != appAddress:
+        flags |= FREEZE
+    if params.get("clawback") != appAddress:
+        flags |= CLAWBACK
+    if params.get("total") != 1 or params.get("decimals", 0) != 0:
+        flags |= NOT_NFT
+    if not params.get("default-frozen"):
+        flags |= NOT_FROZEN
+    if asset.get("deleted"):
+        flags |= DESTROYED
+    return flags
+
+
+# Works elementwise on numpy columns and on plain ints alike.
+def _relationFlags(created, deleted, holders, frozen, appAmount, holder, expected, claims):
+    return ((created == 0) * FOREIGN
+            | ((holders == 0) & (deleted == 0)) * NO_HOLDER
+            | (holders > 1) * MANY_HOLDERS
+            | ((holders > 0) & (frozen == 0)) * NOT_FROZEN
+            | ((expected == _APP) & (appAmount == 0)) * MONSTER_NOT_IN_APP
+            | ((expected > 0) & (holder != expected)) * UNSECURED_NOT_WITH_PLAYER
+            | ((expected == _UNCLAIMED) & (appAmount > 0)) * DEAD_MONSTER_IN_APP
+            | (claims > 1) * CLAIMED_TWICE)
+
+
+# Columnar audit result, one row per NFT (every one the app created, plus any
+# a monster or player carries that it didn't), sorted by ASA id. holder[i] is
+# the address holding it (None if nobody swept does), flags[i] its AUDIT_FLAGS bits.
+class AssetAudit:
+    def __init__(self, asa, holder, flags, round=0):
+        self.asa = asa
+        self.holder = holder
+        self.flags = flags
+        self.round = round
+        self._rows = None
+
+    def __len__(self):
+        return len(self.asa)
+
+    @property
+    def ok(self):
+        return not any(self.flags.tolist())
+
+    # the flags of one NFT, or None if it wasn't audited
+    def flagsOf(self, asaID):
+        if self._rows is None:
+            self._rows = {a: i for i, a in enumerate(self.asa.tolist())}
+        i = self._rows.get(asaID)
+        return None if i is None else int(self.flags[i])
+
+    # ASA ids with any of the bits in mask set
+    def flagged(self, mask):
+        if np is not None and isinstance(self.flags, np.ndarray):
+            return self.asa[(self.flags & mask) != 0].tolist()
+        return [a for a, f in zip(self.asa, self.flags) if f & mask]
+
+    def counts(self):
+        flags = self.flags.tolist()
+        return {name: sum(1 for f in flags if f & bit) for name, bit in AUDIT_FLAGS.items()}
+
+    def problems(self):
+        return [{"ASA_ID": a, "HOLDER": h, "FLAGS": flagNames(f)}
+                for a, h, f in zip(self.asa.tolist(), self.holder, self.flags.tolist()) if f]
+
+
+# Audits every NFT the app has minted in one sweep: the app address's created
+# assets and the holdings of the app and of every player are paged through the
+# indexer, each account's pages on a bounded thread pool alongside the others,
+# instead of an asset_info and an asset_balances call per NFT. The result is
+# checked against the live monsters and the players' UNSECURED_ASSETs.
+class AssetAuditor:
+    def __init__(self, indexer, AppID, maxWorkers=16, pageSize=1000):
+        self.indexer = indexer
+        self.AppID = AppID
+        self.appAddress = get_application_address(AppID)
+        self.maxWorkers = maxWorkers
+        self.pageSize = pageSize
+        self.lastRound = 0          # latest round the indexer answered at, this audit
+
+        self._lock = threading.Lock()
+
+    # pages come back on the pool's threads
+    def _seenRound(self, page):
+        with self._lock:
+            self.lastRound = max(self.lastRound, page.get("current-round", 0))
+
+    # asa id -> asset, destroyed ones included
+    def createdAssets(self):
+        assets = {}
+        nextPage = None
+        while True:
+            page = self.indexer.search_assets(creator=self.appAddress, include_all=True,
+                                              limit=self.pageSize, next_page=nextPage)
+            self._seenRound(page)
+            for asset in page["assets"]:
+                assets[asset["index"]] = asset
+            nextPage = page.get("next-token")
+            if not nextPage or not page["assets"]:
+                return assets
+
+    # asa id -> (amount, frozen) of what address holds (or is opted in to)
+    def holdings(self, address):
+        held = {}
+        nextPage = None
+        while True:
+            page = self.indexer.lookup_account_assets(address, limit=self.pageSize, next_page=nextPage)
+            self._seenRound(page)
+            for h in page["assets"]:
+                if not h.get("deleted"):
+                    held[h["asset-id"]] = (h["amount"], h.get("is-frozen", False))
+            nextPage = page.get("next-token")
+            if not nextPage or not page["assets"]:
+                return held
+
+    # monsters: the live MonsterTable. players: PlayerTables (local states, save
+    # boxes) whose UNSECURED_ASSETs are checked; their addresses, with
+    # extraHolders, are the accounts swept for holdings besides the app's.
+    def audit(self, monsters: MonsterTable, players=(), extraHolders=()) -> AssetAudit:
+        with self._lock:
+            self.lastRound = 0
+        accounts = [self.appAddress]
+        index = {self.appAddress: _APP}
+        claimsOf = {}               # asa -> [expected holder index, claims]
+
+        def claim(asa, who):
+            c = claimsOf.setdefault(asa, [who, 0])
+            c[0] = who
+            c[1] += 1
+
+        for asa in monsters.asa.tolist():
+            claim(asa, _APP)
+        for table in players:
+            for address, asset in zip(table.addresses, table.asset.tolist()):
+                if isinstance(address, bytes):
+                    address = encoding.encode_address(address)
+                if address not in index:
+                    index[address] = len(accounts)
+                    accounts.append(address)
+                if asset:
+                    claim(asset, index[address])
+        for address in extraHolders:
+            if address not in index:
+                index[address] = len(accounts)
+                accounts.append(address)
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            createdFuture = pool.submit(self.createdAssets)
+            heldFutures = [pool.submit(self.holdings, a) for a in accounts]
+            created = createdFuture.result()
+            held = [f.result() for f in heldFutures]
+
+        asa = sorted(set(created) | set(claimsOf))
+        row = {a: i for i, a in enumerate(asa)}
+        n = len(asa)
+        holders = [0] * n
+        holder = [-1] * n
+        frozen = [1] * n
+        appAmount = [0] * n
+        for who, assets in enumerate(held):
+            for a, (amount, isFrozen) in assets.items():
+                i = row.get(a)
+                if i is None or amount == 0:
+                    continue
+                holders[i] += 1
+                holder[i] = who
+                # the creator's own holding is never frozen
+                if who == _APP:
+                    appAmount[i] = amount
+                else:
+                    frozen[i] &= bool(isFrozen)
+
+        config = [_configFlags(created[a], self.appAddress) if a in created else 0 for a in asa]
+        columns = ([int(a in created) for a in asa], [int(bool(created[a].get("deleted"))) if a in created else 0 for a in asa],
+                   holders, frozen, appAmount, holder,
+                   [claimsOf[a][0] if a in claimsOf else _UNCLAIMED for a in asa],
+                   [claimsOf[a][1] if a in claimsOf else 0 for a in asa])
+
+        if np is not None:
+            flags = (np.array(config, dtype=np.int64)
+                     | _relationFlags(*(np.array(c, dtype=np.int64) for c in columns))).astype(np.uint32)
+            asaColumn = np.array(asa, dtype=np.uint64)
+        else:
+            flags = array("L", [c | _relationFlags(*r) for c, r in zip(config, zip(*columns))])
+            asaColumn = array("Q", asa)
+        return AssetAudit(asaColumn, [accounts[h] if h >= 0 else None for h in holder], flags, self.lastRound)
@@ -0,0 +1,379 @@
+from algosdk import account, constants, transaction
+from beaker import sandbox
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from AppTestAndDeploy import DeployAndFundApp, playerOptIn, addMonsters, getMonsterTable, getLocalStates, followWorld, \
+    enterPlayerAction, exitAndSavePlayerAction, playerWalkAction, playerKillMonsterAction, playerStealAction, \
+    secureAssetAction, APPROVAL_SRC
+from ArenaClients import getAlgodClient, getAccounts, getSuggestedParams, getReadCache, newPipelinedSubmitter, useNode
+from ArenaCodec import pathTo
+from ArenaEngine import inSafeZone, SAFE_ZONE
+from ArenaScheduler import TickScheduler
+from ArenaSigner import SigningPool
+from ArenaSpatial import PlayerGrid
+import TealProfiler
+
+
+DEFAULT_MIX = {"move": 4, "kill": 3, "steal": 1, "secure": 2, "exit": 1, "enter": 1}
+DEFAULT_FUNDING = 10000000      # covers the app opt-in, an ASA opt-in per kill/steal, and fees
+ARENA_SIZE = 30                 # bots wander over [0, ARENA_SIZE) x [0, ARENA_SIZE)
+PERCENTILES = (50, 90, 99)
+
+
+# Fresh accounts for the bots, funded from the first node account. Payments go
+# TX_GROUP_LIMIT to a group, every group in flight together.
+def createBots(n, amount=DEFAULT_FUNDING):
+    funder = getAccounts()[0]
+    bots = []
+    for _ in range(n):
+        privateKey, address = account.generate_account()
+        bots.append(sandbox.SandboxAccount(address=address, private_key=privateKey))
+
+    with newPipelinedSubmitter() as submitter:
+        futures = []
+        for g in range(0, n, constants.TX_GROUP_LIMIT):
+            txn_list = [transaction.PaymentTxn(funder.address, getSuggestedParams(), bot.address, amount)
+                        for bot in bots[g:g + constants.TX_GROUP_LIMIT]]
+            if len(txn_list) > 1:
+                gid = transaction.calculate_group_id(txn_list)
+                for t in txn_list:
+                    t.group = gid
+            futures.append(submitter.submit([t.sign(funder.private_key) for t in txn_list]))
+        for f in futures:
+            f.result()
+    return bots
+
+
+def optInBots(AppID, bots):
+    with newPipelinedSubmitter() as submitter:
+        futures = [playerOptIn(AppID, bot, submitter) for bot in bots]
+        for f in futures:
+            f.result()
+
+
+# "move=4,kill=3" -> {"move": 4, "kill": 3}; kinds left out are never picked
+def parseMix(spec):
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in DEFAULT_MIX:
+            raise ValueError("unknown action kind " + kind)
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+# One tick's actions: every bot draws a kind from the mix and gets the nearest
+# action that can succeed from where it stands (an inactive bot enters, a bot
+# with full hands heads for the safe zone, nobody to rob means a walk instead).
+# Kills and steals are spread so no two bots of a tick go for the same asset;
+# what still collides is left to the chain, the way real players would.
+class BotPlanner:
+    def __init__(self, AppID, mix, rng):
+        self.AppID = AppID
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.rng = rng
+        self.grid = PlayerGrid()
+
+    def plan(self, bots, players, monsters):
+        free = list(monsters.asa.tolist())
+        self.rng.shuffle(free)
+        self.grid.syncTable(players)
+        targeted = set()
+
+        actions = []
+        for bot in bots:
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            action = self._action(kind, bot, players.get(bot.address), monsters, free, targeted)
+            actions.append((kind, action))
+        return actions
+
+    def _action(self, kind, bot, p, monsters, free, targeted):
+        if p is None or p["SCORE"] == 0:
+            return enterPlayerAction(self.AppID, bot)
+        x, y, holding = p["POS_X"], p["POS_Y"], p["UNSECURED_ASSET"]
+
+        if kind == "exit":
+            return exitAndSavePlayerAction(self.AppID, bot)
+        if holding:
+            if inSafeZone(x, y):
+                return secureAssetAction(self.AppID, bot, holding)
+            return playerWalkAction(self.AppID, bot, pathTo(x, y, min(x, SAFE_ZONE[2]), min(y, SAFE_ZONE[3])))
+
+        if kind == "steal":
+            for victim in self.grid.stealTargets(x, y, exclude=bot.address):
+                if victim not in targeted:
+                    targeted.add(victim)
+                    return playerStealAction(self.AppID, bot, victim, self.grid.get(victim)[2])
+        if kind == "kill" and free:
+            return playerKillMonsterAction(self.AppID, bot, free.pop(), monsters)
+        return playerWalkAction(self.AppID, bot, self._wander(x, y))
+
+    # a few random steps that stay on the board
+    def _wander(self, x, y):
+        moves = []
+        for _ in range(self.rng.randint(1, 4)):
+            options = [m for m, (dx, dy) in (("U", (0, 1)), ("D", (0, -1)), ("L", (-1, 0)), ("R", (1, 0)))
+                       if 0 <= x + dx < ARENA_SIZE and 0 <= y + dy < ARENA_SIZE]
+            m = self.rng.choice(options)
+            x += {"L": -1, "R": 1}.get(m, 0)
+            y += {"D": -1, "U": 1}.get(m, 0)
+            moves.append(m)
+        return moves
+
+
+# algod reasons carry txids, pcs and amounts; without them rejections group by cause
+def rejectionCause(reason):
+    reason = reason.replace("TransactionPool.Remember: ", "")
+    reason = re.sub(r"\b[A-Z2-7]{52}\b", "<txid>", reason)
+    return re.sub(r"\d+", "N", reason)
+
+
+def _percentile(sortedValues, p):
+    if not sortedValues:
+        return None
+    return sortedValues[min(len(sortedValues) - 1, int(len(sortedValues) * p / 100))]
+
+
+def _latencySummary(values):
+    values = sorted(values)
+    out = {"p{}".format(p): _percentile(values, p) for p in PERCENTILES}
+    out["max"] = values[-1] if values else None
+    out["mean"] = round(sum(values) / len(values), 4) if values else None
+    return out
+
+
+# Static opcode cost of each method (TealProfiler, typical and worst path) at
+# the smallest profiled monster count that covers the live one. The local node
+# applies calls without evaluating TEAL, so this is the cost the real one pays.
+class OpcodeCosts:
+    def __init__(self, source):
+        self.report = TealProfiler.profile(source)
+
+    def of(self, action, monsterCount):
+        calls = [t for t in action.txns if isinstance(t, transaction.ApplicationCallTxn)]
+        row = self.report["entries"].get(action.label)
+        if row is None or not calls:
+            return None
+        counts = sorted(int(n) for n in row["typical"])
+        n = str(next((c for c in counts if c >= monsterCount), counts[-1]))
+        return {mode: row[mode][n] * len(calls) for mode in ("typical", "worst")}
+
+
+class BenchResults:
+    def __init__(self, config):
+        self.config = config
+        self.ticks = []
+        self.requested = {}
+        self.perAction = {}
+        self.causes = {}
+        self.latencies = []
+        self.wall = 0.0
+        self.txns = 0
+
+    def _row(self, label):
+        if label not in self.perAction:
+            self.perAction[label] = {"issued": 0, "confirmed": 0, "rejected": 0, "fees": 0,
+                                     "latencies": [], "opcodes": {"typical": 0, "worst": 0}, "profiled": 0}
+        return self.perAction[label]
+
+    def record(self, planned, report, elapsed, opcodes, monsterCount):
+        self.wall += elapsed
+        for kind, action in planned:
+            self.requested[kind] = self.requested.get(kind, 0) + 1
+            row = self._row(action.label)
+            row["issued"] += 1
+            cost = opcodes.of(action, monsterCount)
+            if cost is not None:
+                row["profiled"] += 1
+                for mode in cost:
+                    row["opcodes"][mode] += cost[mode]
+
+        for g in report.groups:
+            if g["rejected"] is None:
+                self.txns += g["txns"]
+            for label, fee in zip(g["labels"], g["actionFees"]):
+                row = self._row(label)
+                if g["latency"] is not None:
+                    row["latencies"].append(g["latency"])
+                    self.latencies.append(g["latency"])
+                if g["rejected"] is None:
+                    row["confirmed"] += 1
+                    row["fees"] += fee
+                else:
+                    row["rejected"] += 1
+                    cause = rejectionCause(g["rejected"])
+                    self.causes[cause] = self.causes.get(cause, 0) + 1
+
+        tick = report.summary()
+        tick["seconds"] = round(elapsed, 4)
+        tick["monsters"] = monsterCount
+        self.ticks.append(tick)
+
+    def toDict(self):
+        confirmed = sum(r["confirmed"] for r in self.perAction.values())
+        rejected = sum(r["rejected"] for r in self.perAction.values())
+        perAction = {}
+        for label, r in sorted(self.perAction.items()):
+            settled = r["confirmed"] + r["rejected"]
+            perAction[label] = {
+                "issued": r["issued"], "confirmed": r["confirmed"], "rejected": r["rejected"],
+                "rejectionRate": round(r["rejected"] / settled, 4) if settled else 0,
+                "meanFee": round(r["fees"] / r["confirmed"], 1) if r["confirmed"] else None,
+                "opcodes": {mode: round(c / r["profiled"], 1) for mode, c in r["opcodes"].items()} if r["profiled"] else None,
+                "latency": _latencySummary(r["latencies"]),
+            }
+        return {
+            "config": self.config,
+            "seconds": round(self.wall, 4),
+            "throughput": {
+                "actionsPerSec": round(confirmed / self.wall, 2) if self.wall else 0,
+                "txnsPerSec": round(self.txns / self.wall, 2) if self.wall else 0,
+                "confirmedActions": confirmed,
+                "confirmedTxns": self.txns,
+            },
+            "latency": _latencySummary(self.latencies),
+            "rejections": {
+                "total": rejected,
+                "rate": round(rejected / (confirmed + rejected), 4) if confirmed + rejected else 0,
+                "byCause": dict(sorted(self.causes.items(), key=lambda kv: -kv[1])),
+            },
+            "requested": self.requested,
+            "perAction": perAction,
+            "ticks": self.ticks,
+        }
+
+
+# Sets up the swarm (fresh accounts, funded and opted in, monsters seeded) and
+# runs ticks of one action per bot through a TickScheduler, signing on a
+# SigningPool. Setup is not timed; each tick is, from planning to the last
+# group settling. Monsters are topped back up between ticks. Bots see the world
+# through a WorldFollower when the bench deploys the app itself (the follower
+# replays from its creation), through box reads and the crawler otherwise.
+def runBench(AppID=None, bots=64, ticks=10, mix=None, monsters=100, processes=None, seed=None, feePayer=False):
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    config = {"bots": bots, "ticks": ticks, "mix": mix, "monsters": monsters, "processes": processes,
+              "seed": seed, "feePayer": feePayer, "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    follower = None
+    if AppID is None:
+        startRound = getAlgodClient().status()["last-round"] + 1
+        AppID = DeployAndFundApp()
+        follower = followWorld(AppID, startRound)
+    config["appID"] = AppID
+    config["follower"] = follower is not None
+    swarm = createBots(bots)
+    optInBots(AppID, swarm)
+
+    def world():
+        if follower is None:
+            return getMonsterTable(AppID), getLocalStates(AppID)
+        snapshot = follower.waitFor(getAlgodClient().status()["last-round"])
+        return snapshot.monsters(), snapshot.localStates()
+
+    def refill():
+        live = len(world()[0])
+        if live < monsters:
+            addMonsters(AppID, [(rng.randrange(ARENA_SIZE), rng.randrange(ARENA_SIZE)) for _ in range(monsters - live)])
+    refill()
+
+    with open(APPROVAL_SRC, "r", encoding="utf-8") as f:
+        opcodes = OpcodeCosts(f.read())
+    planner = BotPlanner(AppID, mix, rng)
+    results = BenchResults(config)
+    payer = getAccounts()[0] if feePayer else None
+    with SigningPool(swarm, processes) as pool, newPipelinedSubmitter() as submitter:
+        scheduler = TickScheduler(submitter, feePayer=payer, signer=pool if payer is None else None)
+        for _ in range(ticks):
+            monsterTable, players = world()
+            start = time.monotonic()
+            planned = planner.plan(swarm, players, monsterTable)
+            report = scheduler.run([a for _, a in planned])
+            results.record(planned, report, time.monotonic() - start, opcodes, len(monsterTable))
+            refill()
+    if follower is not None:
+        follower.stop()
+        results.config["followerDivergences"] = follower.divergences
+    out = results.toDict()
+    out["readCache"] = getReadCache().stats()
+    return out
+
+
+# throughput drops and latency rises beyond tolerance (a fraction) against an older run
+def compare(old, new, tolerance=0.1):
+    regressions = []
+    before, after = old["throughput"]["actionsPerSec"], new["throughput"]["actionsPerSec"]
+    if after < before * (1 - tolerance):
+        regressions.append(("actionsPerSec", before, after))
+    for p in ("p{}".format(p) for p in PERCENTILES):
+        before, after = old["latency"].get(p), new["latency"].get(p)
+        if before is not None and after is not None and after > before * (1 + tolerance):
+            regressions.append(("latency " + p, before, after))
+    return regressions
+
+
+def formatResults(results):
+    t, lat, rej = results["throughput"], results["latency"], results["rejections"]
+    lines = ["{} bots x {} ticks in {}s: {} actions/s, {} txns/s".format(
+                 results["config"]["bots"], results["config"]["ticks"], results["seconds"], t["actionsPerSec"], t["txnsPerSec"]),
+             "latency p50 {p50}s  p90 {p90}s  p99 {p99}s  max {max}s".format(**lat),
+             "rejected {} ({:.1%})".format(rej["total"], rej["rate"]),
+             "{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format("action", "issued", "rejected", "fee", "opcodes", "p50", "p99")]
+    for label, r in results["perAction"].items():
+        lines.append("{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            label, r["issued"], r["rejected"], str(r["meanFee"]), str(r["opcodes"] and r["opcodes"]["typical"]),
+            str(r["latency"]["p50"]), str(r["latency"]["p99"])))
+    for cause, count in rej["byCause"].items():
+        lines.append("  {:>5}  {}".format(count, cause))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bot-swarm load test of the Monster Arena contract")
+    parser.add_argument("--local", action="store_true", help="run against an in-process LocalNode")
+    parser.add_argument("--app", type=int, help="use this app instead of deploying a fresh one")
+    parser.add_argument("--bots", type=int, default=64)
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--mix", help="action weights, e.g. move=4,kill=3,steal=1,secure=2,exit=1,enter=1")
+    parser.add_argument("--monsters", type=int, default=100, help="live monsters kept on the map")
+    parser.add_argument("--processes", type=int, help="signing processes (default: one per cpu, 0 signs inline)")
+    parser.add_argument("--fee-payer", action="store_true", help="pool every group's fee on the first node account")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", default="bench.json", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="fail if throughput or latency regressed against this JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    localNode = None
+    if args.local:
+        from ArenaLocalNode import LocalNode
+        localNode = LocalNode().start()
+        useNode(localNode.algodAddress, localNode.indexerAddress, localNode.accounts)
+    try:
+        results = runBench(args.app, args.bots, args.ticks, parseMix(args.mix) if args.mix else None,
+                           args.monsters, args.processes, args.seed, args.fee_payer)
+    finally:
+        if localNode is not None:
+            localNode.stop()
+    print(formatResults(results))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for metric, before, after in regressions:
+            print("regression: {}: {} -> {}".format(metric, before, after))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+import argparse
+import importlib
+import json
+import random
+import subprocess
+import sys
+import time
+
+
+# Admin entry point for short-lived jobs (cron, CI): one subcommand per job.
+# Nothing heavier than the standard library is imported until a command runs,
+# and then only the modules that command lists in COMMAND_MODULES.
+#
+#   python ArenaCli.py deploy --arenas 4 --shards 2
+#   python ArenaCli.py spawn 1001 --count 50
+#   python ArenaCli.py state 1001 --json state.json
+#   python ArenaCli.py leaderboard 1001 -k 20 --checkpoint board.json
+#   python ArenaCli.py audit 1001 --json audit.json
+#   python ArenaCli.py replay world.snap --log world.log --round 5000
+#   python ArenaCli.py --local test
+#   python ArenaCli.py imports --budget 500
+
+# what a cold start of each command imports
+COMMAND_MODULES = {
+    "deploy": ("AppTestAndDeploy",),
+    "spawn": ("AppTestAndDeploy",),
+    "state": ("AppTestAndDeploy",),
+    "leaderboard": ("AppTestAndDeploy",),
+    "audit": ("AppTestAndDeploy",),
+    "replay": ("ArenaArchive",),
+    "test": ("AppTestAndDeploy",),
+}
+# --local also starts a LocalNode
+LOCAL_MODULES = ("ArenaLocalNode",)
+# milliseconds a command may spend importing before `imports` fails it
+COLD_START_BUDGET_MS = 500
+
+# Times every module an import pulls in, nested ones included, the way
+# python -X importtime does: each module's own time and its time with what it
+# imported, recorded as it finishes. Installed first on sys.meta_path, it finds
+# the spec through the finders behind it and wraps the loader's exec_module.
+# Built-in and frozen modules (loaded by class-level loaders) are left alone
+# and count towards whoever imported them.
+class ImportTimer:
+    def __init__(self):
+        self.times = []         # (depth, module, self ms, cumulative ms), in the order they finish
+        self._nested = []       # ms spent importing other modules, per module still executing
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            loader.exec_module = self._timed(name, loader)
+        return spec
+
+    def _timed(self, name, loader):
+        execModule = loader.exec_module
+
+        def run(module):
+            del loader.exec_module
+            self._nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                execModule(module)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                nested = self._nested.pop()
+                if self._nested:
+                    self._nested[-1] += ms
+                self.times.append((len(self._nested), name, ms - nested, ms))
+        return run
+
+
+_importTimer = None         # an ImportTimer while --import-times is on
+
+
+def _load(name):
+    module = sys.modules.get(name)
+    if module is None:
+        if _importTimer is not None:
+            sys.meta_path.insert(0, _importTimer)
+        try:
+            module = importlib.import_module(name)
+        finally:
+            if _importTimer is not None:
+                sys.meta_path.remove(_importTimer)
+    return module
+
+
+def _loadAll(names):
+    return [_load(n) for n in names]
+
+
+# one line per module as in -X importtime, indented under whoever imported it
+def formatImportTimes(times):
+    lines = ["{:>9} {:>11}  {}".format("self ms", "cumulative", "module")]
+    for depth, name, selfMs, ms in times:
+        lines.append("{:>9.1f} {:>11.1f}  {}{}".format(selfMs, ms, "  " * depth, name))
+    lines.append("{:>9} {:>11.1f}  total".format("", sum(ms for depth, _, _, ms in times if depth == 0)))
+    return "\n".join(lines)
+
+
+# commands
+
+def cmdDeploy(args):
+    app, = _loadAll(COMMAND_MODULES["deploy"])
+    if args.arenas == 1:
+        AppIDs = [app.DeployAndFundApp(args.shards)]
+    else:
+        AppIDs = app.deployArenas(args.arenas, args.funding or app.ARENA_FUNDING, args.shards)
+    for AppID in AppIDs:
+        print(AppID)
+    return 0
+
+
+def cmdSpawn(args):
+    app, = _loadAll(COMMAND_MODULES["spawn"])
+    rng = random.Random(args.seed)
+    positions = [(rng.randrange(args.area), rng.randrange(args.area)) for _ in range(args.count)]
+    asaIDs = app.addMonsters(args.app, positions)
+    print("spawned {} monsters in app {}".format(len(asaIDs), args.app))
+    return 0
+
+
+def cmdState(args):
+    app, = _loadAll(COMMAND_MODULES["state"])
+    state = {"appID": args.app}
+    if args.what in ("all", "monsters"):
+        state["monsterShards"] = app.getMonsterDirectory(args.app)
+        state["monsters"] = app.getMonsterTable(args.app).toDicts()
+    if args.what in ("all", "players"):
+        app.waitForIndexer()
+        state["activePlayers"] = app.LocalStateCrawler(app.getIndexerClient(), args.app).crawl().toDicts()
+        saved = app.PlayerBoxCrawler(app.getIndexerClient(), args.app).crawl().toDicts()
+        for player in saved:
+            player["ADDRESS"] = app.algosdk.encoding.encode_address(player["ADDRESS"])
+        state["savedPlayers"] = saved
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+    else:
+        json.dump(state, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+def cmdLeaderboard(args):
+    app, = _loadAll(COMMAND_MODULES["leaderboard"])
+    board = app.getLeaderboard(args.app, checkpointPath=args.checkpoint)
+    for rank, address, score in board.top(args.k):
+        print("{:>5}  {:>8}  {}".format(rank, score, address))
+    if args.checkpoint:
+        board.checkpoint()
+    return 0
+
+
+# exits 1 if any NFT is flagged
+def cmdAudit(args):
+    app, = _loadAll(COMMAND_MODULES["audit"])
+    audit = app.auditAssets(args.app)
+    problems = audit.problems()
+    report = {"appID": args.app, "round": audit.round, "assets": len(audit),
+              "counts": {k: v for k, v in audit.counts().items() if v}, "problems": problems}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print("{} NFTs audited at round {}, {} flagged".format(len(audit), audit.round, len(problems)))
+    for name, count in report["counts"].items():
+        print("{:>8}  {}".format(count, name))
+    return 1 if problems else 0
+
+
+# A snapshot file, rolled forward through a replay log if given; needs no node.
+def cmdReplay(args):
+    archive, = _loadAll(COMMAND_MODULES["replay"])
+    with archive.MappedWorld(args.snapshot) as snapshot:
+        world = snapshot.replay(args.log, args.round) if args.log else snapshot
+        players = world.localStates()
+        state = {"appID": snapshot.AppID, "round": world.round,
+                 "monsters": world.monsters().toDicts(), "activePlayers": players.toDicts()}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+    print("app {} at round {}: {} monsters, {} active players".format(
+        snapshot.AppID, world.round, len(state["monsters"]), len(players)))
+    return 0
+
+
+def cmdTest(args):
+    app, = _loadAll(COMMAND_MODULES["test"])
+    app.runAllTests()
+    return 0
+
+
+# Cold start of every command, each timed in a fresh interpreter (so nothing
+# is already imported). Fails if any of them goes over budget.
+def cmdImports(args):
+    over = []
+    for command, modules in sorted(COMMAND_MODULES.items()):
+        if args.local:
+            modules = modules + LOCAL_MODULES
+        script = ("import time, importlib; t = time.perf_counter()\n"
+                  "for m in {!r}: importlib.import_module(m)\n"
+                  "print((time.perf_counter() - t) * 1000)").format(modules)
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", script], capture_output=True, text=True, check=True)
+        ms = float(out.stdout.split()[-1])
+        print("{:>9.1f}  {}  ({})".format(ms, command, ", ".join(modules)))
+        if ms > args.budget:
+            over.append(command)
+    for command in over:
+        print("over budget: {} (> {} ms)".format(command, args.budget))
+    return 1 if over else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monster Arena admin commands")
+    parser.add_argument("--local", action="store_true", help="run against an in-process LocalNode")
+    parser.add_argument("--algod", help="algod address (default: the sandbox's)")
+    parser.add_argument("--indexer", help="indexer address (default: the sandbox's)")
+    parser.add_argument("--algod-token")
+    parser.add_argument("--indexer-token")
+    parser.add_argument("--trace", help="trace the arena helpers, writing one JSON line per action to this file")
+    parser.add_argument("--import-times", action="store_true", help="print what the command spent importing, module by module")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("deploy", help="deploy and fund fresh arenas, printing their app ids")
+    p.add_argument("--arenas", type=int, default=1)
+    p.add_argument("--shards", type=int, default=1, help="monster shards per arena")
+    p.add_argument("--funding", type=int, help="microalgos per arena")
+    p.set_defaults(run=cmdDeploy)
+
+    p = commands.add_parser("spawn", help="add monsters at random positions")
+    p.add_argument("app", type=int)
+    p.add_argument("--count", type=int, default=10)
+    p.add_argument("--area", type=int, default=100, help="positions are drawn from [0, area) on both axes")
+    p.add_argument("--seed", type=int)
+    p.set_defaults(run=cmdSpawn)
+
+    p = commands.add_parser("state", help="dump monsters, active players and save boxes as JSON")
+    p.add_argument("app", type=int)
+    p.add_argument("--what", choices=("all", "monsters", "players"), default="all")
+    p.add_argument("--json", help="write to this file instead of stdout")
+    p.set_defaults(run=cmdState)
+
+    p = commands.add_parser("leaderboard", help="print the top players")
+    p.add_argument("app", type=int)
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--checkpoint", help="leaderboard checkpoint to start from and save to")
+    p.set_defaults(run=cmdLeaderboard)
+
+    p = commands.add_parser("audit", help="check every NFT the app minted against monsters and players")
+    p.add_argument("app", type=int)
+    p.add_argument("--json", help="write the flagged NFTs to this file")
+    p.set_defaults(run=cmdAudit)
+
+    p = commands.add_parser("replay", help="load a world snapshot, replaying a log over it")
+    p.add_argument("snapshot")
+    p.add_argument("--log", help="replay log recorded from the snapshot's round")
+    p.add_argument("--round", type=int, help="replay up to this round (default: the whole log)")
+    p.add_argument("--json", help="write monsters and active players to this file")
+    p.set_defaults(run=cmdReplay)
+
+    p = commands.add_parser("test", help="deploy an arena and run the test suite against it")
+    p.set_defaults(run=cmdTest)
+
+    p = commands.add_parser("imports", help="time each command's cold start")
+    p.add_argument("--budget", type=float, default=COLD_START_BUDGET_MS, help="milliseconds")
+    p.set_defaults(run=cmdImports)
+
+    args = parser.parse_args(argv)
+    if args.command == "imports":
+        return args.run(args)
+    global _importTimer
+    if args.import_times:
+        _importTimer = ImportTimer()
+    localNode = None
+    # replay reads files only
+    if args.command != "replay":
+        clients, = _loadAll(("ArenaClients",))
+        if args.local:
+            localNode = _load("ArenaLocalNode").LocalNode().start()
+            clients.useNode(localNode.algodAddress, localNode.indexerAddress, localNode.accounts)
+        elif args.algod or args.indexer:
+            clients.useNode(args.algod, args.indexer, algodToken=args.algod_token, indexerToken=args.indexer_token)
+        if args.trace:
+            _load("ArenaTrace").enable(args.trace)
+
+    try:
+        return args.run(args)
+    finally:
+        if localNode is not None:
+            localNode.stop()
+        if args.import_times:
+            print(formatImportTimes(_importTimer.times), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,544 @@
+from algosdk import constants, error
+from algosdk.v2client.algod import AlgodClient, api_version_path_prefix as algod_prefix
+from algosdk.v2client.indexer import IndexerClient, api_version_path_prefix as indexer_prefix
+from ArenaSubmitter import PipelinedSubmitter
+from ArenaTrace import span
+from collections import OrderedDict
+from base64 import b64decode
+from urllib import parse
+import http.client
+import threading
+import hashlib
+import copy
+import json
+import time
+import os
+import re
+
+
+# Thread-local keep-alive connections to one host, instead of the fresh
+# urllib connection the sdk opens for every request.
+class KeepAlivePool:
+    def __init__(self, address, timeout=30):
+        url = parse.urlsplit(address)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.basePath = url.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        connType = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self._local.conn = connType(self.host, self.port, timeout=self.timeout)
+        return self._local.conn
+
+    def request(self, method, path, headers, data=None):
+        conn = getattr(self._local, "conn", None)
+        reused = conn is not None
+        if conn is None:
+            conn = self._connect()
+        try:
+            conn.request(method, self.basePath + path, body=data, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # the server closed an idle kept-alive connection, retry once on a new one
+            conn.close()
+            if not reused:
+                raise
+            conn = self._connect()
+            conn.request(method, self.basePath + path, body=data, headers=headers)
+            resp = conn.getresponse()
+        body = resp.read()
+        if resp.will_close:
+            conn.close()
+            self._local.conn = None
+        return resp.status, body
+
+
+def _buildPath(prefix, requrl, params):
+    if requrl not in constants.unversioned_paths:
+        requrl = prefix + requrl
+    if params:
+        requrl = requrl + "?" + parse.urlencode(params)
+    return requrl
+
+
+# Lookups worth caching, by request path: the tag our writes invalidate them by.
+# Boxes are tagged by app, since a call may write any box of its app.
+CACHED_READS = [
+    (re.compile(r"/applications/(\d+)/box"), lambda m: ("app", int(m[1]))),
+    (re.compile(r"/accounts/(\w+)/applications/(\d+)"), lambda m: ("local", m[1], int(m[2]))),
+    (re.compile(r"/assets/(\d+)(?:/balances)?"), lambda m: ("asset", int(m[1]))),
+]
+
+
+# Read-through cache of box, local state and asset lookups. Each response body
+# is kept with the round it is valid at (its own "round" / "current-round", or
+# the latest round we know of) and served again while no later round has been
+# observed (maxLag rounds of slack) and it is under maxAge seconds old. Our own
+# confirmed writes drop what they touch. Evicts least recently used entries
+# beyond maxEntries or maxBytes of bodies.
+class ReadCache:
+    def __init__(self, maxEntries=4096, maxBytes=8 << 20, maxLag=0, maxAge=3.0):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.maxLag = maxLag
+        self.maxAge = maxAge
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytesSaved = 0
+        self.byEndpoint = {}
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (body, round, fetchedAt, tag)
+        self._tagged = {}               # tag -> set of keys
+        self._bytes = 0
+        self._knownRound = 0
+
+    # (key, tag) of a cacheable request, or None
+    @staticmethod
+    def cacheable(source, requrl, params):
+        for pattern, tagOf in CACHED_READS:
+            m = pattern.fullmatch(requrl)
+            if m:
+                return (source, requrl, tuple(sorted((params or {}).items()))), tagOf(m)
+        return None
+
+    def observeRound(self, round):
+        with self._lock:
+            if round > self._knownRound:
+                self._knownRound = round
+
+    def _count(self, key, field):
+        endpoint = "{} {}".format(key[0], re.sub(r"/([A-Z2-7]{58}|\d+)(?=/|$)", "/*", key[1]))
+        row = self.byEndpoint.setdefault(endpoint, {"hits": 0, "misses": 0})
+        row[field] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                body, round, fetchedAt, tag = entry
+                if round + self.maxLag >= self._knownRound and time.monotonic() - fetchedAt <= self.maxAge:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.bytesSaved += len(body)
+                    self._count(key, "hits")
+                    return body
+                self._drop(key)
+            self.misses += 1
+            self._count(key, "misses")
+            return None
+
+    def put(self, key, tag, body, round=None):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # a response stamped with a later round than we knew of tells us for free
+            if round is None:
+                round = self._knownRound
+            self._knownRound = max(self._knownRound, round)
+            self._entries[key] = (body, round, time.monotonic(), tag)
+            self._tagged.setdefault(tag, set()).add(key)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.maxEntries or self._bytes > self.maxBytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        body, _, _, tag = self._entries.pop(key)
+        self._bytes -= len(body)
+        keys = self._tagged.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key in list(self._tagged.get(tag, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    # drops everything the txns can have written
+    def invalidateWrites(self, txns):
+        for txn in txns:
+            if txn.type == "appl" and txn.index:
+                self.invalidate(("app", txn.index))
+                for address in [txn.sender] + list(txn.accounts or []):
+                    self.invalidate(("local", address, txn.index))
+                for asaID in txn.foreign_assets or []:
+                    self.invalidate(("asset", asaID))
+            elif txn.type in ("axfer", "acfg") and txn.index:
+                self.invalidate(("asset", txn.index))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hitRate": round(self.hits / lookups, 4) if lookups else 0,
+                    "evictions": self.evictions, "invalidations": self.invalidations,
+                    "bytesSaved": self.bytesSaved, "entries": len(self._entries), "bytes": self._bytes,
+                    "byEndpoint": {k: dict(v) for k, v in sorted(self.byEndpoint.items())}}
+
+
+# GET through the cache: the parsed response, fetching (and caching) on a miss
+def _cachedGet(cache, source, requrl, params, fetch):
+    hit = ReadCache.cacheable(source, requrl, params) if cache is not None else None
+    if hit is None:
+        return None, fetch()
+    key, tag = hit
+    body = cache.get(key)
+    if body is not None:
+        return body, None
+    status, body = fetch()
+    if status == 200 and body:
+        parsed = json.loads(body)
+        cache.put(key, tag, body, parsed.get("round", parsed.get("current-round")))
+    return None, (status, body)
+
+
+class PooledAlgodClient(AlgodClient):
+    def __init__(self, algod_token, algod_address, headers=None, cache:ReadCache=None):
+        super().__init__(algod_token, algod_address, headers)
+        self.pool = KeepAlivePool(algod_address)
+        self.cache = cache
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json", timeout=30):
+        header = {"User-Agent": "py-algorand-sdk", "Connection": "keep-alive"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header.update({constants.algod_auth_header: self.algod_token})
+
+        path = _buildPath(algod_prefix, requrl, params)
+        if method == "GET" and response_format == "json":
+            cached, fetched = _cachedGet(self.cache, "algod", requrl, params,
+                                         lambda: self.pool.request(method, path, header, data))
+            if cached is not None:
+                return json.loads(cached)
+            status, body = fetched
+        else:
+            status, body = self.pool.request(method, path, header, data)
+        if status >= 400:
+            j = {}
+            m = body.decode("utf-8")
+            try:
+                j = json.loads(m)
+                m = j["message"]
+            except Exception:
+                pass
+            raise error.AlgodHTTPError(m, status, j.get("data"))
+
+        if response_format != "json":
+            return body
+        if status == 200 and len(body) == 0:
+            return {}
+        try:
+            return json.loads(body)
+        except Exception as e:
+            raise error.AlgodResponseError("Failed to parse JSON response from algod") from e
+
+
+class PooledIndexerClient(IndexerClient):
+    def __init__(self, indexer_token, indexer_address, headers=None, cache:ReadCache=None):
+        super().__init__(indexer_token, indexer_address, headers)
+        self.pool = KeepAlivePool(indexer_address)
+        self.cache = cache
+
+    def indexer_request(self, method, requrl, params=None, data=None, headers=None, timeout=30):
+        header = {"User-Agent": "py-algorand-sdk", "Connection": "keep-alive"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if (requrl not in constants.no_auth) and self.indexer_token:
+            header.update({constants.indexer_auth_header: self.indexer_token})
+
+        path = _buildPath(indexer_prefix, requrl, params)
+        if method == "GET":
+            cached, fetched = _cachedGet(self.cache, "indexer", requrl, params,
+                                         lambda: self.pool.request(method, path, header, data))
+            status, body = (200, cached) if cached is not None else fetched
+        else:
+            status, body = self.pool.request(method, path, header, data)
+        if status >= 400:
+            m = body.decode("utf-8")
+            try:
+                m = json.loads(m)["message"]
+            except Exception:
+                pass
+            raise error.IndexerHTTPError(m)
+
+        def recursively_sort_dict(dictionary):
+            return {k: recursively_sort_dict(v) if isinstance(v, dict) else v
+                    for k, v in sorted(dictionary.items())}
+
+        return recursively_sort_dict(json.loads(body.decode("utf-8")))
+
+
+# Suggested params are valid for a window of rounds, so one fetch can serve every
+# txn built until the chain moves on. observeRound() is fed the rounds we learn
+# about for free (confirmations, status_after_block) and marks the cache stale.
+class SuggestedParamsCache:
+    def __init__(self, client, minValidityLeft=10, maxAge=60):
+        self.client = client
+        self.minValidityLeft = minValidityLeft
+        self.maxAge = maxAge
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._params = None
+        self._fetchedAt = 0
+        self._knownRound = 0
+
+    def observeRound(self, round):
+        with self._lock:
+            if round > self._knownRound:
+                self._knownRound = round
+
+    # latest round we know the chain reached (0 before the first fetch)
+    def knownRound(self):
+        return self._knownRound
+
+    def invalidate(self):
+        with self._lock:
+            self._params = None
+
+    def _stale(self):
+        sp = self._params
+        if sp is None or time.monotonic() - self._fetchedAt > self.maxAge:
+            return True
+        return self._knownRound > sp.first or self._knownRound + self.minValidityLeft > sp.last
+
+    def get(self, fee=None):
+        with self._lock:
+            if self._stale():
+                self.misses += 1
+                self._params = self.client.suggested_params()
+                self._fetchedAt = time.monotonic()
+                self._knownRound = max(self._knownRound, self._params.first)
+            else:
+                self.hits += 1
+            sp = copy.copy(self._params)
+
+        # callers mutate fee / flat_fee, so they always get their own copy
+        if fee is not None:
+            sp.fee = fee
+            sp.flat_fee = True
+        return sp
+
+
+# The indexer trails algod by a few rounds. Writers record the round their txn
+# confirmed in, and indexer readers wait (with backoff) until /health reports
+# that round instead of sleeping a fixed amount.
+class IndexerSync:
+    def __init__(self, indexer, timeout=30, minDelay=0.02, maxDelay=1.0):
+        self.indexer = indexer
+        self.timeout = timeout
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+
+        self._lock = threading.Lock()
+        self._lastWrite = 0
+        self._indexedRound = 0
+        self._lastCatchUp = 0
+
+    def recordWrite(self, round):
+        with self._lock:
+            if round > self._lastWrite:
+                self._lastWrite = round
+
+    def lastWrite(self):
+        return self._lastWrite
+
+    def waitFor(self, round=None, timeout=None):
+        target = self._lastWrite if round is None else round
+        if target <= self._indexedRound:
+            return self._indexedRound
+
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        # start around half of what the last catch-up took, then back off
+        delay = min(max(self._lastCatchUp / 2, self.minDelay), self.maxDelay)
+        while True:
+            indexed = self.indexer.health()["round"]
+            with self._lock:
+                self._indexedRound = max(self._indexedRound, indexed)
+            if indexed >= target:
+                self._lastCatchUp = time.monotonic() - start
+                return indexed
+
+            elapsed = time.monotonic() - start
+            if elapsed >= timeout:
+                raise TimeoutError("indexer at round {} after {:.1f}s, waiting for round {}".format(indexed, elapsed, target))
+            time.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * 2, self.maxDelay)
+
+
+# Compiled programs on disk, content addressed: a file per hash of the network
+# (what a node's compile returns is only good on its own network, and LocalNode's
+# is a stand-in), the pragma version and the source. Unchanged contracts are
+# never sent to compile again, in this process or the next.
+class CompileCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memo = {}
+
+    @staticmethod
+    def key(source, network):
+        m = re.search(r"#pragma version (\d+)", source)
+        version = m[1] if m else "1"
+        return hashlib.sha256("\0".join((network, version, source)).encode()).hexdigest()
+
+    def compile(self, client, source, network):
+        key = self.key(source, network)
+        path = os.path.join(self.directory, key + ".bin")
+        with self._lock:
+            program = self._memo.get(key)
+        if program is None and os.path.exists(path):
+            with open(path, "rb") as f:
+                program = f.read()
+        if program is not None:
+            with self._lock:
+                self.hits += 1
+                self._memo[key] = program
+            return program
+
+        program = b64decode(client.compile(source)["result"])
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(program)
+        os.replace(tmp, path)
+        with self._lock:
+            self.misses += 1
+            self._memo[key] = program
+        return program
+
+
+_lock = threading.Lock()
+# the sandbox's defaults (as in beaker.sandbox.clients, which is slow to import)
+_algodAddress = "http://localhost:4001"
+_algodToken = "a" * 64
+_indexerAddress = "http://localhost:8980"
+_indexerToken = "a" * 64
+_algodClient = None
+_indexerClient = None
+_paramsCache = None
+_indexerSync = None
+_readCache = None
+_accounts = None
+
+
+def _sharedReadCache():
+    global _readCache
+    if _readCache is None:
+        _readCache = ReadCache()
+    return _readCache
+
+
+def getAlgodClient():
+    global _algodClient
+    with _lock:
+        if _algodClient is None:
+            _algodClient = PooledAlgodClient(_algodToken, _algodAddress, cache=_sharedReadCache())
+        return _algodClient
+
+
+def getIndexerClient():
+    global _indexerClient
+    with _lock:
+        if _indexerClient is None:
+            _indexerClient = PooledIndexerClient(_indexerToken, _indexerAddress, cache=_sharedReadCache())
+        return _indexerClient
+
+
+def getParamsCache():
+    global _paramsCache
+    client = getAlgodClient()
+    with _lock:
+        if _paramsCache is None:
+            _paramsCache = SuggestedParamsCache(client)
+        return _paramsCache
+
+
+def getSuggestedParams(fee=None):
+    with span("params"):
+        return getParamsCache().get(fee)
+
+
+def getReadCache():
+    with _lock:
+        return _sharedReadCache()
+
+
+def getIndexerSync():
+    global _indexerSync
+    indexer = getIndexerClient()
+    with _lock:
+        if _indexerSync is None:
+            _indexerSync = IndexerSync(indexer)
+        return _indexerSync
+
+
+def observeRound(round):
+    getParamsCache().observeRound(round)
+    getReadCache().observeRound(round)
+
+
+# called with the confirmed info of every write we make (and the signed txns
+# behind it, so cached reads they touched are dropped)
+def recordConfirmed(txnOut, signedTxns=()):
+    observeRound(txnOut["confirmed-round"])
+    getIndexerSync().recordWrite(txnOut["confirmed-round"])
+    getReadCache().invalidateWrites(t.transaction for t in signedTxns)
+
+
+def waitForIndexer(round=None, timeout=None):
+    with span("indexerWait"):
+        return getIndexerSync().waitFor(round, timeout)
+
+
+def newPipelinedSubmitter(maxInFlight=256):
+    return PipelinedSubmitter(getAlgodClient(), maxInFlight, onRound=observeRound, onConfirmed=recordConfirmed)
+
+
+# the kmd wallet doesn't change during a session, no need to list it per call
+def getAccounts():
+    global _accounts
+    with _lock:
+        if _accounts is None:
+            from beaker import sandbox
+            _accounts = sandbox.get_accounts()
+        return _accounts
+
+
+# points every shared client at another node (e.g. a LocalNode) and drops the
+# cached clients, params, reads and accounts; accounts=None lists them from kmd
+# again, and an address or token left None stays as it was
+def useNode(algodAddress, indexerAddress, accounts=None, algodToken=None, indexerToken=None):
+    global _algodAddress, _algodToken, _indexerAddress, _indexerToken
+    global _algodClient, _indexerClient, _paramsCache, _indexerSync, _readCache, _accounts
+    with _lock:
+        _algodAddress = algodAddress if algodAddress is not None else _algodAddress
+        _indexerAddress = indexerAddress if indexerAddress is not None else _indexerAddress
+        _algodToken = algodToken if algodToken is not None else _algodToken
+        _indexerToken = indexerToken if indexerToken is not None else _indexerToken
+        _algodClient = _indexerClient = _paramsCache = _indexerSync = _readCache = None
+        _accounts = list(accounts) if accounts is not None else None
@@ -0,0 +1,241 @@
+from array import array
+from base64 import b64encode
+from bisect import bisect_right
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# monster shard box: |uint64 len|POS_X|POS_Y|ASA_ID|POS_X|POS_Y|ASA_ID|...| (4096 bytes).
+# Shard 0 is MONSTERS, shard i > 0 is MONSTERS + uint64 i.
+MONSTER_BOX_NAME = b"MONSTERS"
+MONSTER_BOX_SIZE = 4096
+MONSTER_RECORD_SIZE = 24
+MONSTER_FIELDS = ("POS_X", "POS_Y", "ASA_ID")
+# per shard
+MAX_MONSTERS = (MONSTER_BOX_SIZE - 8) // MONSTER_RECORD_SIZE
+
+# MONSTERDIR box: |uint64 shard count|uint64 len of shard 0|len of shard 1|...|
+MONSTER_DIR_NAME = b"MONSTERDIR"
+MAX_MONSTER_SHARDS = 64
+MONSTER_DIR_SIZE = 8 + 8 * MAX_MONSTER_SHARDS
+# addMonsters mints one NFT per monster; 14 mints fit one app call's opcode budget
+MAX_MONSTERS_PER_CALL = 14
+
+# player save box, named by the player's 32-byte address: |POS_X|POS_Y|UNSECURED_ASSET|SCORE|
+PLAYER_RECORD_SIZE = 32
+PLAYER_FIELDS = ("POS_X", "POS_Y", "UNSECURED_ASSET", "SCORE")
+
+# local state holds the same four uint64s; algod and the indexer list them as
+# base64 keys, mapped straight to their column here
+LOCAL_KEY_COLUMNS = {b64encode(f.encode()).decode(): i for i, f in enumerate(PLAYER_FIELDS)}
+
+if np is not None:
+    MONSTER_DTYPE = np.dtype([(f, ">u8") for f in MONSTER_FIELDS])
+    PLAYER_DTYPE = np.dtype([(f, ">u8") for f in PLAYER_FIELDS])
+
+
+def monsterShardName(shard):
+    return MONSTER_BOX_NAME if shard == 0 else MONSTER_BOX_NAME + shard.to_bytes(8, "big")
+
+
+# the directory and shard boxes, as opposed to player save boxes
+def isMonsterBoxName(name):
+    return name == MONSTER_DIR_NAME or (name[:8] == MONSTER_BOX_NAME and len(name) in (8, 16))
+
+
+# live monsters of each shard, in shard order
+def decodeMonsterDirectory(dirData):
+    n = min(int.from_bytes(dirData[:8], "big"), MAX_MONSTER_SHARDS)
+    return [int.from_bytes(dirData[8 + 8 * i:16 + 8 * i], "big") for i in range(n)]
+
+
+# Columnar view of the live monsters. With numpy the columns of a single shard
+# are views straight into the box bytes (no copy); without it they're arrays of
+# native uint64. offsets[s] is where shard s's monsters start in the columns.
+class MonsterTable:
+    def __init__(self, x, y, asa, offsets=(0,)):
+        self.x = x
+        self.y = y
+        self.asa = asa
+        self.offsets = list(offsets)
+
+    def __len__(self):
+        return len(self.asa)
+
+    # (shard, slot) of a row
+    def shardSlot(self, index):
+        shard = bisect_right(self.offsets, index) - 1
+        return shard, index - self.offsets[shard]
+
+    # (shard, slot) of the monster holding asaID, or None
+    def locate(self, asaID):
+        i = self.indexOf(asaID)
+        return None if i < 0 else self.shardSlot(i)
+
+    def indexOf(self, asaID):
+        # slot of the monster holding asaID, or -1
+        if np is not None and isinstance(self.asa, np.ndarray):
+            hits = np.flatnonzero(self.asa == asaID)
+            return int(hits[0]) if len(hits) else -1
+        try:
+            return list(self.asa).index(asaID)
+        except ValueError:
+            return -1
+
+    def toTuples(self):
+        return list(zip(self.x.tolist(), self.y.tolist(), self.asa.tolist()))
+
+    def toDicts(self):
+        return [{"POS_X": x, "POS_Y": y, "ASA_ID": asa} for x, y, asa in self.toTuples()]
+
+
+def decodeMonsterBox(boxData) -> MonsterTable:
+    n = int.from_bytes(boxData[:8], "big")
+    n = min(n, (len(boxData) - 8) // MONSTER_RECORD_SIZE)
+
+    if np is not None:
+        records = np.frombuffer(boxData, dtype=MONSTER_DTYPE, count=n, offset=8)
+        return MonsterTable(records["POS_X"], records["POS_Y"], records["ASA_ID"])
+
+    words = array("Q")
+    words.frombytes(memoryview(boxData)[8:8 + n * MONSTER_RECORD_SIZE])
+    if sys.byteorder == "little":
+        words.byteswap()
+    return MonsterTable(words[0::3], words[1::3], words[2::3])
+
+
+# every shard's monsters as one table, shards in order
+def decodeMonsterShards(shardData) -> MonsterTable:
+    tables = [decodeMonsterBox(data) for data in shardData] or [decodeMonsterBox(bytes(8))]
+    if len(tables) == 1:
+        return tables[0]
+    offsets = [0]
+    for t in tables[:-1]:
+        offsets.append(offsets[-1] + len(t))
+    if np is not None:
+        columns = [np.concatenate([getattr(t, c) for t in tables]) for c in ("x", "y", "asa")]
+    else:
+        columns = [sum((getattr(t, c) for t in tables), array("Q")) for c in ("x", "y", "asa")]
+    return MonsterTable(*columns, offsets=offsets)
+
+
+# addMonsters' argument: |POS_X|POS_Y| per monster, uint64 big-endian
+def packMonsterPositions(positions):
+    return b"".join(x.to_bytes(8, "big") + y.to_bytes(8, "big") for x, y in positions)
+
+
+# playerMove's path argument: |direction byte U/D/L/R|uint64 steps| per segment
+MOVE_SEGMENT_SIZE = 9
+# segments one playerMove call's opcode budget covers
+MAX_PATH_SEGMENTS = 16
+MOVE_DIRECTIONS = {"U": (0, 1), "D": (0, -1), "L": (-1, 0), "R": (1, 0)}
+
+
+# segments are (direction, steps) pairs; a direction is "UP"/"U", "down"/"d", ...
+def encodePath(segments):
+    path = bytearray()
+    for direction, steps in segments:
+        d = direction[:1].upper()
+        if d not in MOVE_DIRECTIONS:
+            raise ValueError("unknown direction " + repr(direction))
+        path += d.encode() + steps.to_bytes(8, "big")
+    return bytes(path)
+
+
+# run-length segments of single moves, e.g. "UUURRL" or ["UP", "UP", "RIGHT"]
+def compressMoves(moves):
+    segments = []
+    for move in moves:
+        d = move[:1].upper()
+        if segments and segments[-1][0] == d:
+            segments[-1][1] += 1
+        else:
+            segments.append([d, 1])
+    return [tuple(s) for s in segments]
+
+
+# x first, then y; each leg is a single segment
+def pathTo(x, y, toX, toY):
+    segments = []
+    if toX != x:
+        segments.append(("R" if toX > x else "L", abs(toX - x)))
+    if toY != y:
+        segments.append(("U" if toY > y else "D", abs(toY - y)))
+    return segments
+
+
+# Columnar view of many player records; addresses[i] is the 32-byte box name.
+class PlayerTable:
+    def __init__(self, addresses, x, y, asset, score):
+        self.addresses = addresses
+        self.x = x
+        self.y = y
+        self.asset = asset
+        self.score = score
+        self._rows = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    # the record of one address as a dict, or None
+    def get(self, address):
+        if self._rows is None:
+            self._rows = {a: i for i, a in enumerate(self.addresses)}
+        i = self._rows.get(address)
+        if i is None:
+            return None
+        return {"POS_X": int(self.x[i]), "POS_Y": int(self.y[i]),
+                "UNSECURED_ASSET": int(self.asset[i]), "SCORE": int(self.score[i])}
+
+    def toDicts(self):
+        return [{"ADDRESS": addr, "POS_X": x, "POS_Y": y, "UNSECURED_ASSET": asset, "SCORE": score}
+                for addr, x, y, asset, score in zip(self.addresses, self.x.tolist(), self.y.tolist(),
+                                                    self.asset.tolist(), self.score.tolist())]
+
+
+# decodes every box in one pass over their concatenated contents
+def decodePlayerBoxes(names, values) -> PlayerTable:
+    names = list(names)
+    data = b"".join(values)
+    if len(data) != len(names) * PLAYER_RECORD_SIZE:
+        raise ValueError("player boxes must be {} bytes each".format(PLAYER_RECORD_SIZE))
+
+    if np is not None:
+        records = np.frombuffer(data, dtype=PLAYER_DTYPE)
+        return PlayerTable(names, records["POS_X"], records["POS_Y"], records["UNSECURED_ASSET"], records["SCORE"])
+
+    words = array("Q")
+    words.frombytes(data)
+    if sys.byteorder == "little":
+        words.byteswap()
+    return PlayerTable(names, words[0::4], words[1::4], words[2::4], words[3::4])
+
+
+# one account's local state key-value list -> [POS_X, POS_Y, UNSECURED_ASSET, SCORE];
+# keys never written (or deleted) read as 0, like app_local_get
+def decodeLocalState(keyValues):
+    row = [0, 0, 0, 0]
+    for kv in keyValues:
+        col = LOCAL_KEY_COLUMNS.get(kv["key"])
+        if col is not None:
+            row[col] = kv["value"].get("uint", 0)
+    return row
+
+
+# many accounts' local states (addresses[i] owns keyValueLists[i]) as one table
+def decodeLocalStates(addresses, keyValueLists) -> PlayerTable:
+    addresses = list(addresses)
+    columns = [[], [], [], []]
+    for keyValues in keyValueLists:
+        for col, v in zip(columns, decodeLocalState(keyValues)):
+            col.append(v)
+
+    if np is not None:
+        columns = [np.array(c, dtype=np.uint64) for c in columns]
+    else:
+        columns = [array("Q", c) for c in columns]
+    return PlayerTable(addresses, *columns)
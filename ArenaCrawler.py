@@ -0,0 +1,110 @@
+from algosdk import encoding
+from algosdk.error import IndexerHTTPError
+from concurrent.futures import ThreadPoolExecutor
+from base64 import b64decode
+from ArenaCodec import decodePlayerBoxes, decodeLocalStates, isMonsterBoxName, PlayerTable
+
+
+# only these calls write a player's save box (named by the sender's address)
+PLAYER_BOX_WRITERS = (b"enterPlayer", b"exitAndSavePlayer")
+
+
+# Reads every player save box of the app through the indexer: follows the
+# next-token pages of the box listing and fetches the contents on a bounded
+# thread pool while the listing is still being paged, then decodes them all
+# into one PlayerTable.
+class PlayerBoxCrawler:
+    def __init__(self, indexer, AppID, maxWorkers=16, pageSize=1000):
+        self.indexer = indexer
+        self.AppID = AppID
+        self.maxWorkers = maxWorkers
+        self.pageSize = pageSize
+        # highest round any response was served at; pass it as sinceRound next time
+        self.lastRound = 0
+
+    def _seenRound(self, response, key="round"):
+        self.lastRound = max(self.lastRound, response.get(key, 0))
+
+    def boxNamePages(self):
+        nextPage = None
+        while True:
+            page = self.indexer.application_boxes(self.AppID, limit=self.pageSize, next_page=nextPage)
+            names = [b64decode(b["name"]) for b in page["boxes"]]
+            yield [n for n in names if not isMonsterBoxName(n)]
+            nextPage = page.get("next-token")
+            if not nextPage or not page["boxes"]:
+                return
+
+    # names of the save boxes written by app calls confirmed at or after sinceRound
+    def changedSince(self, sinceRound):
+        changed = set()
+        nextPage = None
+        while True:
+            page = self.indexer.search_transactions(application_id=self.AppID, min_round=sinceRound,
+                                                    txn_type="appl", limit=self.pageSize, next_page=nextPage)
+            self._seenRound(page, "current-round")
+            for txn in page["transactions"]:
+                args = txn["application-transaction"].get("application-args", [])
+                if args and b64decode(args[0]) in PLAYER_BOX_WRITERS:
+                    changed.add(encoding.decode_address(txn["sender"]))
+            nextPage = page.get("next-token")
+            if not nextPage or not page["transactions"]:
+                return changed
+
+    def _fetchOne(self, name):
+        try:
+            box = self.indexer.application_box_by_name(self.AppID, name)
+        except IndexerHTTPError:
+            # box listed (or written) but gone by now
+            return None
+        self._seenRound(box)
+        return name, b64decode(box["value"])
+
+    def fetch(self, namePages) -> PlayerTable:
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            futures = []
+            for names in namePages:
+                futures.extend(pool.submit(self._fetchOne, n) for n in names)
+            boxes = [f.result() for f in futures]
+
+        boxes = [b for b in boxes if b is not None]
+        return decodePlayerBoxes([n for n, _ in boxes], [v for _, v in boxes])
+
+    # every player box, or with sinceRound only those written since that round
+    def crawl(self, sinceRound=None) -> PlayerTable:
+        if sinceRound is None:
+            return self.fetch(self.boxNamePages())
+        return self.fetch([sorted(self.changedSince(sinceRound))])
+
+
+# Reads the local state of every account opted in to the app from the indexer's
+# account search, a page of pageSize accounts per request, into one PlayerTable
+# keyed by address.
+class LocalStateCrawler:
+    def __init__(self, indexer, AppID, pageSize=1000):
+        self.indexer = indexer
+        self.AppID = AppID
+        self.pageSize = pageSize
+        self.lastRound = 0
+
+    def accountPages(self):
+        nextPage = None
+        while True:
+            page = self.indexer.accounts(application_id=self.AppID, limit=self.pageSize, next_page=nextPage)
+            self.lastRound = max(self.lastRound, page.get("current-round", 0))
+            yield page["accounts"]
+            nextPage = page.get("next-token")
+            if not nextPage or not page["accounts"]:
+                return
+
+    def crawl(self) -> PlayerTable:
+        addresses = []
+        keyValues = []
+        for accounts in self.accountPages():
+            for account in accounts:
+                # the creator is listed too, opted in or not
+                for local in account.get("apps-local-state", []):
+                    if local["id"] == self.AppID and not local.get("deleted"):
+                        addresses.append(account["address"])
+                        keyValues.append(local.get("key-value", []))
+        return decodeLocalStates(addresses, keyValues)
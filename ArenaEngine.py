@@ -0,0 +1,379 @@
+from base64 import b32decode
+import struct
+
+from ArenaCodec import MONSTER_BOX_NAME, MONSTER_BOX_SIZE, MONSTER_RECORD_SIZE, MAX_MONSTERS, MAX_MONSTERS_PER_CALL, PLAYER_RECORD_SIZE, \
+    MOVE_SEGMENT_SIZE, MOVE_DIRECTIONS, MONSTER_DIR_NAME, MONSTER_DIR_SIZE, MAX_MONSTER_SHARDS, monsterShardName
+
+
+UINT64_MAX = 2**64 - 1
+STEAL_RANGE_SQ = 10 * 10
+SAFE_ZONE = (0, 0, 10, 10)      # min_x, min_y, max_x, max_y, edges included
+MOVES = {b"UP": (0, 1), b"DOWN": (0, -1), b"LEFT": (-1, 0), b"RIGHT": (1, 0)}
+
+# local state slots
+POS_X, POS_Y, UNSECURED_ASSET, SCORE = range(4)
+LOCAL_KEYS = ("POS_X", "POS_Y", "UNSECURED_ASSET", "SCORE")
+
+_monster = struct.Struct(">QQQ")
+_player = struct.Struct(">QQQQ")
+_uint64 = struct.Struct(">Q")
+_position = struct.Struct(">QQ")
+_segment = struct.Struct(">cQ")
+_ZERO_MONSTER = bytes(MONSTER_RECORD_SIZE)
+_ZERO_PLAYER = bytes(PLAYER_RECORD_SIZE)
+
+
+class ArenaReject(Exception):
+    pass
+
+
+# 32-byte public key behind an algorand address (what player boxes are named by)
+def addressToKey(address):
+    return b32decode(address + "=" * (-len(address) % 8))[:32]
+
+
+# Same check, in the same uint64 arithmetic, as the contract's checkDistInRange:
+# ax^2 + ay^2 + bx^2 + by^2 <= r^2 + 2*ax*bx + 2*ay*by, where any intermediate
+# value above 2^64-1 panics the program (so the call is rejected). Every term is
+# non-negative, so no partial sum or product exceeds its side's final total.
+def checkDistInRange(ax, ay, bx, by, rSq):
+    lhs = by * by + bx * bx + ay * ay + ax * ax
+    rhs = rSq + 2 * by * ay + 2 * bx * ax
+    if lhs > UINT64_MAX or rhs > UINT64_MAX:
+        raise ArenaReject("uint64 overflow in distance check")
+    return lhs <= rhs
+
+
+def inSafeZone(x, y):
+    return SAFE_ZONE[0] <= x <= SAFE_ZONE[2] and SAFE_ZONE[1] <= y <= SAFE_ZONE[3]
+
+
+# In-process model of ApprovalProgram.teal (as specified in Readme.md): the same
+# global/local state, the same monster shard, directory and player box bytes, the same method
+# semantics. Players are identified by their 32-byte public key (see
+# addressToKey). A call the contract would reject raises ArenaReject and leaves
+# the state untouched. AppTestAndDeploy's test_EngineMatchesContract runs the two
+# side by side (the TEAL through TealEvaluator). Resource availability (foreign
+# accounts and assets, box references) and opcode budgets are the ledger's to
+# check, not the engine's.
+class ArenaEngine:
+    def __init__(self, admin, firstAssetID=1):
+        self.admin = admin
+        self.nextAssetID = firstAssetID
+
+        self.localState = {}        # player key -> [POS_X, POS_Y, UNSECURED_ASSET, SCORE]
+        self.boxes = {}             # box name -> bytearray
+        self.assetHolder = {}       # minted ASA id -> player key, or None for the app
+
+        self._monsterSlot = {}      # ASA id -> (shard, slot), kept in step with the shard boxes
+        self._shardLen = []         # live monsters per shard, as in MONSTERDIR
+
+    def copy(self):
+        other = ArenaEngine.__new__(ArenaEngine)
+        other.admin = self.admin
+        other.nextAssetID = self.nextAssetID
+        other.localState = {k: list(v) for k, v in self.localState.items()}
+        other.boxes = {k: bytearray(v) for k, v in self.boxes.items()}
+        other.assetHolder = dict(self.assetHolder)
+        other._monsterSlot = dict(self._monsterSlot)
+        other._shardLen = list(self._shardLen)
+        return other
+
+    # rebuilds an engine from its public state (a checkpoint, say); the monster
+    # index is recovered from the directory and shard boxes
+    @classmethod
+    def restore(cls, admin, localState, boxes, assetHolder=None, nextAssetID=1):
+        engine = cls(admin, nextAssetID)
+        engine.localState = {k: list(v) for k, v in localState.items()}
+        engine.boxes = {k: bytearray(v) for k, v in boxes.items()}
+        engine.assetHolder = dict(assetHolder or {})
+        directory = engine.boxes.get(MONSTER_DIR_NAME)
+        if directory is not None:
+            for shard in range(_uint64.unpack_from(directory, 0)[0]):
+                box = engine.boxes[monsterShardName(shard)]
+                engine._shardLen.append(_uint64.unpack_from(box, 0)[0])
+                for slot in range(engine._shardLen[shard]):
+                    asaID = _uint64.unpack_from(box, 8 + slot * MONSTER_RECORD_SIZE + 16)[0]
+                    engine._monsterSlot[asaID] = (shard, slot)
+        return engine
+
+
+    # read helpers
+
+    def monsterBox(self, shard=0):
+        return bytes(self.boxes[monsterShardName(shard)])
+
+    def monsterShards(self):
+        return [self.monsterBox(shard) for shard in range(len(self._shardLen))]
+
+    def monsterDirectory(self):
+        return bytes(self.boxes[MONSTER_DIR_NAME])
+
+    # the directory and every shard box, the boxes monster calls write to
+    def monsterBoxNames(self):
+        if MONSTER_DIR_NAME not in self.boxes:
+            return []
+        return [MONSTER_DIR_NAME] + [monsterShardName(shard) for shard in range(len(self._shardLen))]
+
+    def playerBox(self, player):
+        return bytes(self.boxes[player])
+
+    def localStateDict(self, player):
+        return dict(zip(LOCAL_KEYS, self.localState[player]))
+
+    def monsterCount(self):
+        return sum(self._shardLen)
+
+    def shardCounts(self):
+        return list(self._shardLen)
+
+    def _active(self, player):
+        local = self.localState.get(player)
+        if local is None:
+            raise ArenaReject("account not opted in")
+        if local[SCORE] == 0:
+            raise ArenaReject("player is not active")
+        return local
+
+
+    # on-completion paths
+
+    def optIn(self, player):
+        if player in self.localState:
+            raise ArenaReject("already opted in")
+        self.localState[player] = [0, 0, 0, 0]
+
+    def clearState(self, player):
+        self.localState.pop(player, None)
+
+
+    # methods
+
+    def setup(self, sender):
+        if sender != self.admin:
+            raise ArenaReject("only ADMIN can setup")
+        # box_create on an existing box of the same size is a no-op
+        if MONSTER_DIR_NAME not in self.boxes:
+            self.boxes[MONSTER_DIR_NAME] = bytearray(MONSTER_DIR_SIZE)
+            _uint64.pack_into(self.boxes[MONSTER_DIR_NAME], 0, 1)
+            self._shardLen = [0]
+        if MONSTER_BOX_NAME not in self.boxes:
+            self.boxes[MONSTER_BOX_NAME] = bytearray(MONSTER_BOX_SIZE)
+
+    def addMonsterShard(self, sender):
+        if sender != self.admin:
+            raise ArenaReject("only ADMIN can add shards")
+        directory = self._directory()
+        shard = len(self._shardLen)
+        if shard >= MAX_MONSTER_SHARDS:
+            raise ArenaReject("no more than {} shards".format(MAX_MONSTER_SHARDS))
+        if monsterShardName(shard) in self.boxes:
+            raise ArenaReject("shard box already exists")
+        self.boxes[monsterShardName(shard)] = bytearray(MONSTER_BOX_SIZE)
+        _uint64.pack_into(directory, 0, shard + 1)
+        self._shardLen.append(0)
+        return shard
+
+    def _directory(self):
+        directory = self.boxes.get(MONSTER_DIR_NAME)
+        if directory is None:
+            raise ArenaReject("MONSTERDIR box does not exist")
+        return directory
+
+    # the shard's box, rejecting a shard the directory doesn't list
+    def _shard(self, shard):
+        self._directory()
+        if shard >= len(self._shardLen):
+            raise ArenaReject("no monster shard {}".format(shard))
+        return self.boxes[monsterShardName(shard)]
+
+    def _setShardLen(self, shard, n):
+        _uint64.pack_into(self.boxes[monsterShardName(shard)], 0, n)
+        _uint64.pack_into(self.boxes[MONSTER_DIR_NAME], 8 + 8 * shard, n)
+        self._shardLen[shard] = n
+
+    def addMonster(self, sender, pos_x, pos_y, asaID=None, shard=0):
+        return self.addMonsters(sender, [(pos_x, pos_y)], asaID, shard)[0]
+
+    # One call's batch, into one shard: the NFTs are minted as one inner group,
+    # so their ids run consecutively from firstAssetID. Returns the ids in
+    # position order.
+    def addMonsters(self, sender, positions, firstAssetID=None, shard=0):
+        if sender != self.admin:
+            raise ArenaReject("only ADMIN can add monsters")
+        box = self._shard(shard)
+        k = len(positions)
+        if not 1 <= k <= MAX_MONSTERS_PER_CALL:
+            raise ArenaReject("a call adds 1 to {} monsters".format(MAX_MONSTERS_PER_CALL))
+        n = self._shardLen[shard]
+        if n + k > MAX_MONSTERS:
+            raise ArenaReject("monster shard {} is full".format(shard))
+        for pos_x, pos_y in positions:
+            if pos_x > UINT64_MAX or pos_y > UINT64_MAX:
+                raise ArenaReject("position is not a uint64")
+
+        # the inner asset-create ids; differential runs pass the chain's first id in
+        if firstAssetID is None:
+            firstAssetID = self.nextAssetID
+        self.nextAssetID = max(self.nextAssetID, firstAssetID + k)
+
+        asaIDs = []
+        for i, (pos_x, pos_y) in enumerate(positions):
+            asaID = firstAssetID + i
+            _monster.pack_into(box, 8 + (n + i) * MONSTER_RECORD_SIZE, pos_x, pos_y, asaID)
+            self._monsterSlot[asaID] = (shard, n + i)
+            self.assetHolder[asaID] = None
+            asaIDs.append(asaID)
+        self._setShardLen(shard, n + k)
+        return asaIDs
+
+    # As the contract does it: an existing save box is always reinstated (and
+    # zeroed), even an all-zero one (an active player's, or one whose owner
+    # cleared their local state while active), which leaves SCORE at 0; only
+    # without a box does a new game start. No check that the player is inactive.
+    def enterPlayer(self, sender):
+        local = self.localState.get(sender)
+        if local is None:
+            raise ArenaReject("account not opted in")
+
+        box = self.boxes.get(sender)
+        if box is None:
+            self.boxes[sender] = bytearray(PLAYER_RECORD_SIZE)
+            local[:] = [0, 0, 0, 1]
+            return
+
+        # Readme.md's layout: |POS_X|POS_Y|UNSECURED_ASSET|SCORE|
+        local[:] = _player.unpack(box)
+        box[:] = _ZERO_PLAYER
+
+    def exitAndSavePlayer(self, sender):
+        local = self._active(sender)
+        self.boxes[sender] = bytearray(_player.pack(*local))
+        local[:] = [0, 0, 0, 0]
+
+    # direction is one of MOVES for a single step, or a path of
+    # |direction byte U/D/L/R|uint64 steps| segments applied in order
+    def playerMove(self, sender, direction):
+        local = self._active(sender)
+        if direction in MOVES:
+            direction = direction[:1] + _uint64.pack(1)
+        if not direction or len(direction) % MOVE_SEGMENT_SIZE:
+            raise ArenaReject("unknown direction")
+
+        x, y = local[POS_X], local[POS_Y]
+        for d, steps in _segment.iter_unpack(direction):
+            step = MOVE_DIRECTIONS.get(d.decode("latin-1"))
+            if step is None:
+                raise ArenaReject("unknown direction")
+            x += step[0] * steps
+            y += step[1] * steps
+            if x < 0 or y < 0 or x > UINT64_MAX or y > UINT64_MAX:
+                raise ArenaReject("move out of uint64 bounds")
+        local[POS_X] = x
+        local[POS_Y] = y
+
+    # only the given shard is searched, so a monster of another shard is not found;
+    # a slot hint must name the monster's slot, the contract doesn't search past it
+    def playerKillMonster(self, sender, asaID, shard=0, hint=None):
+        local = self._active(sender)
+        if local[UNSECURED_ASSET] != 0:
+            raise ArenaReject("hands are busy")
+        box = self._shard(shard)
+        found = self._monsterSlot.get(asaID)
+        if hint is not None and found != (shard, hint):
+            raise ArenaReject("stale slot hint")
+        if found is None or found[0] != shard:
+            raise ArenaReject("monster not found")
+        slot = found[1]
+
+        # swap-remove: the last monster fills the slot, the last slot is zeroed
+        last = self._shardLen[shard] - 1
+        lastOffset = 8 + last * MONSTER_RECORD_SIZE
+        if slot != last:
+            offset = 8 + slot * MONSTER_RECORD_SIZE
+            box[offset:offset + MONSTER_RECORD_SIZE] = box[lastOffset:lastOffset + MONSTER_RECORD_SIZE]
+            self._monsterSlot[_uint64.unpack_from(box, offset + 16)[0]] = (shard, slot)
+        box[lastOffset:lastOffset + MONSTER_RECORD_SIZE] = _ZERO_MONSTER
+        self._setShardLen(shard, last)
+        del self._monsterSlot[asaID]
+
+        local[UNSECURED_ASSET] = asaID
+        local[SCORE] += 1
+        self.assetHolder[asaID] = sender
+
+    def pvpSteal(self, sender, victim):
+        local = self._active(sender)
+        if local[UNSECURED_ASSET] != 0:
+            raise ArenaReject("hands are busy")
+        victimLocal = self._active(victim)
+        asaID = victimLocal[UNSECURED_ASSET]
+        if asaID == 0:
+            raise ArenaReject("victim holds nothing")
+        if not checkDistInRange(local[POS_X], local[POS_Y], victimLocal[POS_X], victimLocal[POS_Y], STEAL_RANGE_SQ):
+            raise ArenaReject("victim out of range")
+
+        victimLocal[UNSECURED_ASSET] = 0
+        local[UNSECURED_ASSET] = asaID
+        self.assetHolder[asaID] = sender
+
+    def secureAsset(self, sender):
+        local = self._active(sender)
+        if local[UNSECURED_ASSET] == 0:
+            raise ArenaReject("nothing to secure")
+        if not inSafeZone(local[POS_X], local[POS_Y]):
+            raise ArenaReject("outside the safe zone")
+        local[UNSECURED_ASSET] = 0
+        local[SCORE] += 1
+
+
+    # Applies a NoOp call the way the contract sees it: raw application args
+    # (method name first, uint64 args as 8-byte big-endian) plus the Accounts
+    # and Assets arrays as player keys / ASA ids.
+    def call(self, sender, args, accounts=(), assets=()):
+        method = bytes(args[0])
+        if method == b"playerMove":
+            return self.playerMove(sender, bytes(args[1]))
+        if method == b"playerKillMonster":
+            hint = _btoi(args[1]) if len(args) > 1 else None
+            return self.playerKillMonster(sender, _first(assets, "asset"), _shardArg(args, 2), hint)
+        if method == b"pvpSteal":
+            return self.pvpSteal(sender, _first(accounts, "victim account"))
+        if method == b"secureAsset":
+            return self.secureAsset(sender)
+        if method == b"enterPlayer":
+            return self.enterPlayer(sender)
+        if method == b"exitAndSavePlayer":
+            return self.exitAndSavePlayer(sender)
+        if method == b"addMonster":
+            shard = _shardArg(args, 3)
+            return self.addMonster(sender, _btoi(args[1]), _btoi(args[2]), shard=shard)
+        if method == b"addMonsters":
+            shard = _shardArg(args, 2)
+            packed = bytes(args[1])
+            if len(packed) % 16:
+                raise ArenaReject("positions are 16 bytes per monster")
+            return self.addMonsters(sender, list(_position.iter_unpack(packed)), shard=shard)
+        if method == b"setup":
+            return self.setup(sender)
+        if method == b"addMonsterShard":
+            return self.addMonsterShard(sender)
+        if method == b"budget":
+            return
+        raise ArenaReject("unknown method")
+
+
+def _btoi(arg):
+    if len(arg) > 8:
+        raise ArenaReject("btoi of more than 8 bytes")
+    return int.from_bytes(arg, "big")
+
+
+def _first(refs, what):
+    if not refs:
+        raise ArenaReject("the call names no " + what)
+    return refs[0]
+
+
+# the shard a monster call names in args[i], shard 0 if it has no such arg
+def _shardArg(args, i):
+    return _btoi(args[i]) if len(args) > i else 0
@@ -0,0 +1,367 @@
+from algosdk import encoding
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from types import MappingProxyType
+from array import array
+import threading
+import msgpack
+import json
+import time
+import os
+
+from ArenaCodec import decodeMonsterDirectory, decodeMonsterShards, decodePlayerBoxes, isMonsterBoxName, monsterShardName, \
+    MonsterTable, PlayerTable, MONSTER_DIR_NAME
+from ArenaEngine import ArenaEngine, ArenaReject, addressToKey, LOCAL_KEYS
+
+
+# on-completion codes and local state delta actions, as they appear in blocks
+OC_OPT_IN, OC_CLOSE_OUT, OC_CLEAR_STATE = 1, 2, 3
+DELTA_SET_UINT = 2
+# the methods that write MONSTERDIR / the monster shards, with the index of
+# their shard arg (None: setup writes shard 0, addMonsterShard the new one)
+MONSTER_METHODS = {b"setup": None, b"addMonsterShard": None, b"addMonster": 3, b"addMonsters": 2,
+                   b"playerKillMonster": 2}
+# seconds between retries of a failed catch-up, doubling up to the max
+RETRY_DELAY, MAX_RETRY_DELAY = 0.1, 2.0
+
+
+# One confirmed call to the app, as much of its block entry as applying it
+# takes: raw args, Accounts / Assets arrays, the ids its inner txns minted and
+# its local state deltas as (index into [sender] + accounts, [(LOCAL_KEYS
+# index, new value)]). Plain bytes / ints / lists only, so it packs as is.
+AppCall = namedtuple("AppCall", "onComplete sender args accounts assets created localDeltas")
+
+
+def decodeAppCall(txn, dt):
+    localDeltas = []
+    for index, changes in dt.get("ld", {}).items():
+        columns = []
+        for key, delta in changes.items():
+            name = key.decode() if isinstance(key, bytes) else key
+            if name in LOCAL_KEYS:
+                columns.append((LOCAL_KEYS.index(name), delta.get("ui", 0) if delta.get("at") == DELTA_SET_UINT else 0))
+        localDeltas.append((index, columns))
+    return AppCall(txn.get("apan", 0), txn["snd"], list(txn.get("apaa", [])), list(txn.get("apat", [])),
+                   list(txn.get("apas", [])), [t["caid"] for t in dt.get("itx", []) if "caid" in t], localDeltas)
+
+
+# Applies a call through the engine, then the chain's local state deltas over
+# the result. False if the engine rejected a call the chain confirmed.
+def applyAppCall(engine, call):
+    ok = True
+    try:
+        if call.onComplete == OC_OPT_IN:
+            engine.optIn(call.sender)
+        elif call.onComplete in (OC_CLOSE_OUT, OC_CLEAR_STATE):
+            engine.clearState(call.sender)
+        else:
+            if call.created:
+                engine.nextAssetID = call.created[0]
+            engine.call(call.sender, call.args, call.accounts, call.assets)
+    except ArenaReject:
+        # confirmed on chain, so the model is the one that is wrong
+        ok = False
+
+    refs = [call.sender] + list(call.accounts)
+    for index, columns in call.localDeltas:
+        local = engine.localState.setdefault(refs[index], [0] * len(LOCAL_KEYS))
+        for column, value in columns:
+            local[column] = value
+    return ok
+
+
+# The arena as of one round: the boxes and every opted-in account's local state.
+# Never changes once published, so readers need no locking; lookups are dict
+# hits and the tables are decoded on first use.
+class WorldSnapshot:
+    def __init__(self, round, boxes, localState):
+        self.round = round
+        self._boxes = boxes             # box name -> bytes
+        self._local = localState        # player key -> (POS_X, POS_Y, UNSECURED_ASSET, SCORE)
+        self._monsters = None
+        self._playerBoxes = None
+        self._localStates = None
+
+    def monsterBox(self, shard=0):
+        return self._boxes.get(monsterShardName(shard))
+
+    # live monsters of each shard
+    def monsterDirectory(self):
+        return decodeMonsterDirectory(self._boxes.get(MONSTER_DIR_NAME, bytes(8)))
+
+    # every shard's monsters, merged
+    def monsters(self) -> MonsterTable:
+        if self._monsters is None:
+            shards = range(len(self.monsterDirectory()))
+            self._monsters = decodeMonsterShards([self._boxes[monsterShardName(s)] for s in shards])
+        return self._monsters
+
+    # raw bytes of a box by name, or None
+    def box(self, name):
+        return self._boxes.get(name)
+
+    # raw keys of the player save boxes (named by the player's 32-byte key)
+    def playerKeys(self):
+        return (n for n in self._boxes if len(n) == 32)
+
+    # read-only view of player key -> (POS_X, POS_Y, UNSECURED_ASSET, SCORE);
+    # snapshots share the tuples of players a block didn't touch
+    def localRows(self):
+        return MappingProxyType(self._local)
+
+    def playerBox(self, address):
+        data = self._boxes.get(addressToKey(address))
+        if data is None:
+            return None
+        return dict(zip(LOCAL_KEYS, (int.from_bytes(data[i:i + 8], "big") for i in range(0, 32, 8))))
+
+    def localState(self, address):
+        local = self._local.get(addressToKey(address))
+        return None if local is None else dict(zip(LOCAL_KEYS, local))
+
+    # every player save box, named by raw key like PlayerBoxCrawler's
+    def playerBoxes(self) -> PlayerTable:
+        if self._playerBoxes is None:
+            names = sorted(n for n in self._boxes if not isMonsterBoxName(n))
+            self._playerBoxes = decodePlayerBoxes(names, [self._boxes[n] for n in names])
+        return self._playerBoxes
+
+    # every opted-in account's local state, by address like LocalStateCrawler's
+    def localStates(self) -> PlayerTable:
+        if self._localStates is None:
+            keys = sorted(self._local)
+            columns = [array("Q", (self._local[k][i] for k in keys)) for i in range(len(LOCAL_KEYS))]
+            self._localStates = PlayerTable([encoding.encode_address(k) for k in keys], *columns)
+        return self._localStates
+
+
+# Mirrors one app's state by tailing confirmed blocks from startRound (the app's
+# creation round, or earlier) instead of re-reading boxes. Our app calls are
+# replayed through ArenaEngine, with the ids of assets minted by inner txns
+# taken from the block; the block's local state deltas are then applied over
+# the result, so the mirror's local state follows the chain even where the
+# model and the contract part ways (counted in divergences). After every block
+# a new WorldSnapshot is published; snapshot() is a plain attribute read.
+# With a checkpointPath the mirror is saved every checkpointEvery rounds (and
+# on stop) and a restart resumes from the saved round. Subscribers are called,
+# on the follower's thread, with every new snapshot and what its block touched;
+# call subscribers with the block's decoded AppCalls. If fetching or applying
+# a block fails, the follower thread keeps retrying it with backoff; the error
+# stays in error until a catch-up succeeds, and a waitFor that runs out of time
+# meanwhile raises it.
+class WorldFollower:
+    def __init__(self, algod, AppID, startRound=1, checkpointPath=None, checkpointEvery=100):
+        self.algod = algod
+        self.AppID = AppID
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        self.round = startRound - 1         # last round applied
+        self.engine = None                  # until the app's creation is seen
+        self.divergences = 0
+        self.callsApplied = 0
+        self.error = None                   # of the last failed catch-up, if it still fails
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._subscribers = []
+        self._callSubscribers = []
+        # held while a block is applied, see withEngine
+        self._applyLock = threading.RLock()
+        self._lastCheckpoint = self.round
+        if checkpointPath is not None and os.path.exists(checkpointPath):
+            self._loadCheckpoint()
+        self._snapshot = self._publish(self.round, set(), set(), None)
+
+    def snapshot(self) -> WorldSnapshot:
+        return self._snapshot
+
+    # fn(snapshot, touchedBoxes, touchedLocals) after each block; the sets hold
+    # box names and player keys
+    def subscribe(self, fn):
+        self._subscribers.append(fn)
+
+    # fn(round, calls) after each block, calls being its AppCalls in order
+    def subscribeCalls(self, fn):
+        self._callSubscribers.append(fn)
+
+    # fn(round, engine) between two blocks, so the engine is the mirror as of
+    # round; it must not be kept or changed
+    def withEngine(self, fn):
+        with self._applyLock:
+            return fn(self.round, self.engine)
+
+    def _fetchBlock(self, round):
+        raw = self.algod.block_info(round, response_format="msgpack")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)["block"]
+
+    # applies every block up to toRound (default: the node's last round)
+    def catchUp(self, toRound=None):
+        if toRound is None:
+            toRound = self.algod.status()["last-round"]
+        while self.round < toRound and not self._stopping:
+            self._applyBlock(self.round + 1, self._fetchBlock(self.round + 1))
+        return self.round
+
+    def _applyBlock(self, round, block):
+        with self._applyLock:
+            touchedBoxes = set()
+            touchedLocals = set()
+            calls = []
+            for stib in block.get("txns", []):
+                txn = stib["txn"]
+                if txn.get("type") != "appl":
+                    continue
+                if not txn.get("apid"):
+                    if stib.get("apid") == self.AppID:
+                        self.engine = ArenaEngine(txn["snd"])
+                    continue
+                if txn["apid"] != self.AppID or self.engine is None:
+                    continue
+                call = decodeAppCall(txn, stib.get("dt", {}))
+                self._applyCall(call, touchedBoxes, touchedLocals)
+                calls.append(call)
+
+            # the round only moves once its snapshot is out
+            self._snapshot = self._publish(round, touchedBoxes, touchedLocals, self._snapshot)
+            self.round = round
+            with self._cond:
+                self._cond.notify_all()
+            for fn in self._subscribers:
+                fn(self._snapshot, touchedBoxes, touchedLocals)
+            for fn in self._callSubscribers:
+                fn(round, calls)
+            if self.checkpointPath is not None and self.round - self._lastCheckpoint >= self.checkpointEvery:
+                self.checkpoint()
+
+    def _applyCall(self, call, touchedBoxes, touchedLocals):
+        if not applyAppCall(self.engine, call):
+            self.divergences += 1
+        self.callsApplied += 1
+        if call.onComplete == 0 and call.args and call.args[0] in MONSTER_METHODS:
+            touchedBoxes.update((MONSTER_DIR_NAME, monsterShardName(self._shardWritten(call))))
+        touchedBoxes.add(call.sender)
+        touchedLocals.add(call.sender)
+        touchedLocals.update(call.accounts)
+
+    # the shard a monster method's call writes, once the engine has applied it
+    def _shardWritten(self, call):
+        method = call.args[0]
+        if method == b"addMonsterShard":
+            return max(len(self.engine.shardCounts()) - 1, 0)
+        i = MONSTER_METHODS[method]
+        return int.from_bytes(call.args[i], "big") if i is not None and len(call.args) > i else 0
+
+    # copy-on-write: only what this block's calls touched is copied out of the engine
+    def _publish(self, round, touchedBoxes, touchedLocals, previous):
+        if previous is None:
+            if self.engine is None:
+                return WorldSnapshot(round, {}, {})
+            return WorldSnapshot(round, {k: bytes(v) for k, v in self.engine.boxes.items()},
+                                 {k: tuple(v) for k, v in self.engine.localState.items()})
+        if not touchedBoxes and not touchedLocals:
+            return WorldSnapshot(round, previous._boxes, previous._local)
+
+        boxes = dict(previous._boxes)
+        for name in touchedBoxes:
+            if name in self.engine.boxes:
+                boxes[name] = bytes(self.engine.boxes[name])
+            else:
+                boxes.pop(name, None)
+        local = dict(previous._local)
+        for key in touchedLocals:
+            if key in self.engine.localState:
+                local[key] = tuple(self.engine.localState[key])
+            else:
+                local.pop(key, None)
+        return WorldSnapshot(round, boxes, local)
+
+    # blocks until the mirror has applied round (catching up on this thread
+    # when no follower thread is running)
+    def waitFor(self, round, timeout=30):
+        if self._thread is None:
+            self.catchUp(round)
+            return self._snapshot
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.round >= round, timeout):
+                error = self.error
+                if error is not None:
+                    raise RuntimeError("follower stuck at round {}: {!r}".format(self.round, error)) from error
+                raise TimeoutError("follower at round {}, waiting for round {}".format(self.round, round))
+        return self._snapshot
+
+    def _followLoop(self):
+        delay = RETRY_DELAY
+        while not self._stopping:
+            try:
+                self.catchUp()
+                self.error = None
+                delay = RETRY_DELAY
+                if not self._stopping:
+                    self.algod.status_after_block(self.round)
+            except Exception as e:
+                self.error = e
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._followLoop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.checkpointPath is not None:
+            self.checkpoint()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    # checkpoints: JSON, written to a temporary file and renamed into place
+
+    # (under the apply lock, so the state is the one of its round even while
+    # the follower thread is still applying blocks, as after a stop() that
+    # timed out)
+    def checkpoint(self):
+        with self._applyLock:
+            engine = self.engine
+            round = self.round
+            state = {"appID": self.AppID, "round": round, "engine": None}
+            if engine is not None:
+                state["engine"] = {
+                    "admin": b64encode(engine.admin).decode(),
+                    "nextAssetID": engine.nextAssetID,
+                    "localState": {b64encode(k).decode(): v for k, v in engine.localState.items()},
+                    "boxes": {b64encode(k).decode(): b64encode(v).decode() for k, v in engine.boxes.items()},
+                    "assetHolder": {str(a): None if h is None else b64encode(h).decode() for a, h in engine.assetHolder.items()},
+                }
+            # the local state lists are the engine's own
+            data = json.dumps(state)
+        tmp = self.checkpointPath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.checkpointPath)
+        self._lastCheckpoint = round
+
+    def _loadCheckpoint(self):
+        with open(self.checkpointPath, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["appID"] != self.AppID:
+            raise ValueError("checkpoint {} is for app {}, not {}".format(self.checkpointPath, state["appID"], self.AppID))
+        self.round = self._lastCheckpoint = state["round"]
+        saved = state["engine"]
+        if saved is not None:
+            self.engine = ArenaEngine.restore(
+                b64decode(saved["admin"]),
+                {b64decode(k): v for k, v in saved["localState"].items()},
+                {b64decode(k): b64decode(v) for k, v in saved["boxes"].items()},
+                {int(a): None if h is None else b64decode(h) for a, h in saved["assetHolder"].items()},
+                saved["nextAssetID"])
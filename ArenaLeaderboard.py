@@ -0,0 +1,231 @@
+from algosdk import encoding
+import threading
+import json
+import os
+
+from ArenaCodec import PLAYER_RECORD_SIZE
+from ArenaEngine import SCORE
+
+
+# Counts of players per score in a Fenwick tree over the scores 0..capacity-1
+# (grown by doubling), with the players of each score kept alongside. How many
+# players score above s, and which score the j-th best player has, are both
+# O(log capacity).
+class ScoreIndex:
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._tree = [0] * (capacity + 1)
+        self._byScore = {}          # score -> {address: None}, in the order they got there
+        self._score = {}            # address -> score
+        self._total = 0
+
+    def __len__(self):
+        return self._total
+
+    def __contains__(self, address):
+        return address in self._score
+
+    def get(self, address):
+        return self._score.get(address)
+
+    def _add(self, score, delta):
+        i = score + 1
+        while i <= self.capacity:
+            self._tree[i] += delta
+            i += i & -i
+
+    # players scoring at most score
+    def _prefix(self, score):
+        i = min(score + 1, self.capacity)
+        n = 0
+        while i > 0:
+            n += self._tree[i]
+            i -= i & -i
+        return n
+
+    def _grow(self, score):
+        capacity = self.capacity
+        while capacity <= score:
+            capacity *= 2
+        self.capacity = capacity
+        self._tree = [0] * (capacity + 1)
+        for s, players in self._byScore.items():
+            self._add(s, len(players))
+
+    # a score of 0 (an inactive player with nothing saved) takes the player off the board
+    def set(self, address, score):
+        old = self._score.get(address)
+        if old == score:
+            return
+        if old is not None:
+            players = self._byScore[old]
+            del players[address]
+            if not players:
+                del self._byScore[old]
+            self._add(old, -1)
+            del self._score[address]
+            self._total -= 1
+        if score:
+            if score >= self.capacity:
+                self._grow(score)
+            self._byScore.setdefault(score, {})[address] = None
+            self._add(score, 1)
+            self._score[address] = score
+            self._total += 1
+
+    # players scoring strictly more than score
+    def above(self, score):
+        return self._total - self._prefix(score)
+
+    # 1 + the players with a higher score (ties share a rank), or None
+    def rank(self, address):
+        score = self._score.get(address)
+        return None if score is None else self.above(score) + 1
+
+    # score of the j-th best player (j from 1), by descending the tree
+    def _scoreAt(self, j):
+        # the (total - j + 1)-th lowest
+        target = self._total - j + 1
+        pos = 0
+        step = 1 << self.capacity.bit_length()
+        while step:
+            if pos + step <= self.capacity and self._tree[pos + step] < target:
+                pos += step
+                target -= self._tree[pos]
+            step >>= 1
+        return pos
+
+    # the k best as (rank, address, score); one tree descent per distinct score
+    def top(self, k):
+        out = []
+        while len(out) < min(k, self._total):
+            score = self._scoreAt(len(out) + 1)
+            rank = self.above(score) + 1
+            for address in self._byScore[score]:
+                if len(out) == k:
+                    break
+                out.append((rank, address, score))
+        return out
+
+    def scores(self):
+        return dict(self._score)
+
+
+# A player's standing: their local SCORE while active, else the SCORE saved in
+# their box by exitAndSavePlayer. Kept up to date from a WorldFollower's blocks
+# (attach), or from crawled tables (syncTables), and checkpointed to JSON so a
+# restart picks up from the saved round; only what changed since is re-read.
+class Leaderboard:
+    def __init__(self, AppID, checkpointPath=None, checkpointEvery=100):
+        self.AppID = AppID
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        self.round = 0
+        self.index = ScoreIndex()
+
+        self._lock = threading.Lock()
+        self._lastCheckpoint = 0
+        if checkpointPath is not None and os.path.exists(checkpointPath):
+            self._loadCheckpoint()
+
+    def top(self, k=10):
+        with self._lock:
+            return self.index.top(k)
+
+    def rank(self, address):
+        with self._lock:
+            return self.index.rank(address)
+
+    def score(self, address):
+        with self._lock:
+            return self.index.get(address) or 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self.index)
+
+
+    # feeds
+
+    # applies one player's score from a WorldSnapshot, by 32-byte player key
+    def _applyKey(self, snapshot, key):
+        local = snapshot.localRows().get(key)
+        if local is not None and local[SCORE] != 0:
+            score = local[SCORE]
+        else:
+            box = snapshot.box(key)
+            score = int.from_bytes(box[24:32], "big") if box is not None and len(box) == PLAYER_RECORD_SIZE else 0
+        self.index.set(encoding.encode_address(key), score)
+
+    # WorldFollower subscriber: only the players the block touched are re-scored
+    def onBlock(self, snapshot, touchedBoxes, touchedLocals):
+        with self._lock:
+            if snapshot.round <= self.round:
+                return
+            for key in touchedLocals | {k for k in touchedBoxes if len(k) == 32}:
+                self._applyKey(snapshot, key)
+            self.round = snapshot.round
+        if self.checkpointPath is not None and self.round - self._lastCheckpoint >= self.checkpointEvery:
+            self.checkpoint()
+
+    # re-scores everyone from a snapshot (scores that didn't change cost a dict lookup)
+    def reconcile(self, snapshot):
+        with self._lock:
+            self._reconcile(snapshot)
+
+    def _reconcile(self, snapshot):
+        keys = set(snapshot.localRows()) | set(snapshot.playerKeys())
+        known = {encoding.decode_address(a) for a in self.index.scores()}
+        for key in keys | known:
+            self._applyKey(snapshot, key)
+        self.round = snapshot.round
+
+    # Follows a WorldFollower from now on. Blocks the follower applied while we
+    # were not listening (say, since our checkpoint) are made up for with one
+    # reconcile against its current snapshot. We subscribe under the lock, so
+    # a block published meanwhile waits for the reconcile in onBlock (and is
+    # skipped if the reconcile already covered it) rather than moving round
+    # past the blocks still to be made up for.
+    def attach(self, follower):
+        with self._lock:
+            follower.subscribe(self.onBlock)
+            snapshot = follower.snapshot()
+            if snapshot.round != self.round:
+                self._reconcile(snapshot)
+        return self
+
+    # from LocalStateCrawler / PlayerBoxCrawler tables read at round
+    def syncTables(self, localStates, playerBoxes, round=0):
+        scores = {}
+        for address, score in zip(playerBoxes.addresses, playerBoxes.score.tolist()):
+            scores[encoding.encode_address(address) if isinstance(address, bytes) else address] = score
+        for address, score in zip(localStates.addresses, localStates.score.tolist()):
+            if score:
+                scores[address] = score
+        with self._lock:
+            for address in [a for a in self.index.scores() if a not in scores]:
+                self.index.set(address, 0)
+            for address, score in scores.items():
+                self.index.set(address, score)
+            self.round = max(self.round, round)
+
+
+    # checkpoints: JSON, written to a temporary file and renamed into place
+
+    def checkpoint(self):
+        with self._lock:
+            state = {"appID": self.AppID, "round": self.round, "scores": self.index.scores()}
+        tmp = self.checkpointPath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpointPath)
+        self._lastCheckpoint = state["round"]
+
+    def _loadCheckpoint(self):
+        with open(self.checkpointPath, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["appID"] != self.AppID:
+            raise ValueError("checkpoint {} is for app {}, not {}".format(self.checkpointPath, state["appID"], self.AppID))
+        for address, score in state["scores"].items():
+            self.index.set(address, score)
+        self.round = self._lastCheckpoint = state["round"]
@@ -0,0 +1,683 @@
+from algosdk import account, encoding, transaction
+from algosdk.logic import get_application_address
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from base64 import b64decode, b64encode
+from urllib import parse
+from nacl.signing import VerifyKey
+from nacl.exceptions import BadSignatureError
+import threading
+import copy
+import msgpack
+import hashlib
+import json
+import re
+
+from ArenaEngine import ArenaEngine, ArenaReject, LOCAL_KEYS
+from TealEvaluator import TealProgram, TealReject, ResourceReject, AppCall, BoxBudget
+from TealProfiler import APP_CALL_BUDGET
+
+
+GENESIS_ID = "arena-local-v1"
+GENESIS_HASH = b64encode(hashlib.sha256(GENESIS_ID.encode()).digest()).decode()
+MIN_FEE = 1000
+
+
+class LedgerReject(Exception):
+    pass
+
+
+# In-memory ledger behind LocalNode. Every accepted submission (a txn or an
+# atomic group) is confirmed immediately in a round of its own. Every app is
+# assumed to be the Monster Arena. Its approval program (the TEAL source, see
+# do_compile) is run by TealEvaluator, with the group's pooled opcode budget and
+# box references, and decides whether a call goes through; its state lives in an
+# ArenaEngine, which must agree with the program call by call (a call where the
+# two part ways is rejected with the difference). Not modelled: the clear state
+# program, minimum balances, and any opcode TealEvaluator doesn't know (such a
+# program can't be created).
+class LocalLedger:
+    def __init__(self, accounts=(), initialBalance=10**15):
+        self.round = 1
+        self.cond = threading.Condition()
+
+        self.balances = {addr: initialBalance for addr in accounts}
+        self.apps = {}              # app id -> ArenaEngine
+        self.programs = {}          # app id -> TealProgram
+        self.appAddresses = {}      # app address -> app id
+        self.assets = {}            # asa id -> params
+        self.holdings = {}          # asa id -> {address: amount}
+        self.frozen = {}            # asa id -> {address: is-frozen}, per holding
+        self.confirmed = {}         # txid -> pending transaction info
+        self.blocks = {}            # round -> [(signed txn, pending info)]
+        self.nextIndex = 1001
+
+        self._journal = None
+        self._group = None
+
+    def _set(self, d, k, v):
+        self._journal.append((d, k, d.get(k, _MISSING)))
+        d[k] = v
+
+    def _rollback(self):
+        for d, k, old in reversed(self._journal):
+            if old is _MISSING:
+                d.pop(k, None)
+            else:
+                d[k] = old
+
+    def _allocIndex(self):
+        idx = self.nextIndex
+        self.nextIndex += 1
+        return idx
+
+
+    def submit(self, stxns):
+        with self.cond:
+            self._journal = []
+            snapshots = {}
+            try:
+                self._checkGroup(stxns)
+                # the engine is only left untouched by a call it rejects itself;
+                # a later txn or the group's fee check can still reject the group,
+                # so every app called in it is snapshotted
+                for stxn in stxns:
+                    appID = getattr(stxn.transaction, "index", 0)
+                    if stxn.transaction.type == "appl" and appID in self.apps and appID not in snapshots:
+                        snapshots[appID] = self.apps[appID].copy()
+                self._group = _GroupBudget([stxn.transaction for stxn in stxns])
+                infos = [self._apply(stxn.transaction) for stxn in stxns]
+                # fees are pooled over the group, inner transactions included
+                needed = MIN_FEE * sum(1 + len(info.get("inner-txns", ())) for info in infos)
+                if sum(stxn.transaction.fee for stxn in stxns) < needed:
+                    raise LedgerReject("fee too small: group needs {}".format(needed))
+            except (LedgerReject, ArenaReject) as e:
+                self._rollback()
+                self.apps.update(snapshots)
+                raise LedgerReject(str(e))
+            finally:
+                self._journal = None
+                self._group = None
+
+            self.round += 1
+            for stxn, info in zip(stxns, infos):
+                info["confirmed-round"] = self.round
+                info["pool-error"] = ""
+                self.confirmed[stxn.get_txid()] = info
+            self.blocks[self.round] = list(zip(stxns, infos))
+            self.cond.notify_all()
+            return stxns[0].get_txid()
+
+    def _checkGroup(self, stxns):
+        gid = stxns[0].transaction.group
+        if len(stxns) > 1:
+            if gid is None or transaction.calculate_group_id([_ungrouped(s.transaction) for s in stxns]) != gid:
+                raise LedgerReject("incomplete or inconsistent group")
+        seen = set()
+        for stxn in stxns:
+            txn = stxn.transaction
+            txid = stxn.get_txid()
+            if txid in self.confirmed or txid in seen:
+                raise LedgerReject("transaction already in ledger: " + txid)
+            seen.add(txid)
+            if not (txn.first_valid_round <= self.round + 1 <= txn.last_valid_round):
+                raise LedgerReject("txn dead: round {} outside {}-{}".format(self.round + 1, txn.first_valid_round, txn.last_valid_round))
+            if len(stxns) == 1 and txn.group is not None:
+                raise LedgerReject("incomplete group")
+            if stxn.signature is None:
+                raise LedgerReject("only single-signature transactions are supported")
+            signer = stxn.authorizing_address or txn.sender
+            try:
+                message = b"TX" + b64decode(encoding.msgpack_encode(txn))
+                VerifyKey(encoding.decode_address(signer)).verify(message, b64decode(stxn.signature))
+            except BadSignatureError:
+                raise LedgerReject("invalid signature for " + txid)
+
+    def _pay(self, sender, receiver, amount, fee):
+        balance = self.balances.get(sender, 0)
+        if balance < amount + fee:
+            raise LedgerReject("overspend by " + sender)
+        self._set(self.balances, sender, balance - amount - fee)
+        self._set(self.balances, receiver, self.balances.get(receiver, 0) + amount)
+
+    def _apply(self, txn):
+        if txn.type == "pay":
+            self._pay(txn.sender, txn.receiver, txn.amt, txn.fee)
+            return {}
+        if txn.type == "axfer":
+            return self._applyAssetTransfer(txn)
+        if txn.type == "afrz":
+            return self._applyAssetFreeze(txn)
+        if txn.type == "appl":
+            return self._applyAppCall(txn)
+        raise LedgerReject("unsupported transaction type " + txn.type)
+
+    def _applyAssetTransfer(self, txn):
+        self._pay(txn.sender, txn.sender, 0, txn.fee)
+        holders = self.holdings.get(txn.index)
+        if holders is None:
+            raise LedgerReject("asset {} does not exist".format(txn.index))
+        if txn.amount == 0 and txn.receiver == txn.sender:
+            if txn.sender not in holders:
+                self._set(holders, txn.sender, 0)
+                self._set(self.frozen[txn.index], txn.sender, self.assets[txn.index]["default-frozen"])
+            return {}
+        # monster NFTs are frozen, only the app's clawback moves them
+        raise LedgerReject("asset {} is frozen".format(txn.index))
+
+    def _applyAssetFreeze(self, txn):
+        self._pay(txn.sender, txn.sender, 0, txn.fee)
+        params = self.assets.get(txn.index)
+        if params is None:
+            raise LedgerReject("asset {} does not exist".format(txn.index))
+        if txn.sender != params["freeze"]:
+            raise LedgerReject("{} is not the freeze address of asset {}".format(txn.sender, txn.index))
+        if txn.target not in self.holdings[txn.index]:
+            raise LedgerReject("{} not opted in to asset {}".format(txn.target, txn.index))
+        self._set(self.frozen[txn.index], txn.target, bool(txn.new_freeze_state))
+        return {}
+
+    def _applyAppCall(self, txn):
+        self._pay(txn.sender, txn.sender, 0, txn.fee)
+        sender = encoding.decode_address(txn.sender)
+
+        if not txn.index:
+            try:
+                program = TealProgram(txn.approval_program)
+            except (ValueError, UnicodeDecodeError) as e:
+                raise LedgerReject("approval program is not TEAL this node can evaluate: {}".format(e))
+            appID = self._allocIndex()
+            evaluation = self._evaluate(program, txn, _EngineState(None, get_application_address(appID)), 0)
+            self._set(self.apps, appID, ArenaEngine(sender))
+            self._set(self.programs, appID, program)
+            self._set(self.appAddresses, get_application_address(appID), appID)
+            if evaluation.globals != {b"ADMIN": sender}:
+                raise LedgerReject("ArenaEngine disagrees with the contract on create: globals {}".format(evaluation.globals))
+            return {"application-index": appID}
+
+        engine = self.apps.get(txn.index)
+        if engine is None:
+            raise LedgerReject("application {} does not exist".format(txn.index))
+        if txn.on_complete == transaction.OnComplete.ClearStateOC:
+            engine.clearState(sender)
+            return {}
+        if txn.on_complete not in (transaction.OnComplete.NoOpOC, transaction.OnComplete.OptInOC):
+            raise LedgerReject("unsupported on-completion")
+        if txn.on_complete == transaction.OnComplete.OptInOC and sender in engine.localState:
+            raise LedgerReject("{} has already opted in to app {}".format(txn.sender, txn.index))
+
+        appAddress = get_application_address(txn.index)
+        foreignAssets = list(txn.foreign_assets or [])
+        accounts = [encoding.decode_address(a) for a in (txn.accounts or [])]
+        refs = [txn.sender] + list(txn.accounts or [])
+        localBefore = {a: list(engine.localState.get(encoding.decode_address(a), ())) for a in refs}
+
+        # the program decides; the engine has to come to the same verdict and state
+        firstAssetID = self.nextIndex
+        try:
+            evaluation = self._evaluate(self.programs[txn.index], txn, _EngineState(engine, appAddress), firstAssetID)
+            contractError = None
+        except LedgerReject as e:
+            if isinstance(e.__cause__, ResourceReject):
+                raise
+            evaluation, contractError = None, e
+        engine.nextAssetID = firstAssetID
+        try:
+            if txn.on_complete == transaction.OnComplete.OptInOC:
+                engine.optIn(sender)
+            else:
+                engine.call(sender, txn.app_args or [], accounts, foreignAssets)
+        except ArenaReject as e:
+            if contractError is not None:
+                raise contractError
+            raise LedgerReject("ArenaEngine rejects a call the contract approves: {}".format(e))
+        if contractError is not None:
+            raise LedgerReject("ArenaEngine approves a call the contract rejects ({})".format(contractError))
+        _checkEngine(engine, evaluation, appAddress, firstAssetID)
+
+        inner = []
+        for t in evaluation.innerTxns:
+            if "CreatedAssetID" in t:
+                self._mint(self._allocIndex(), appAddress)
+                inner.append({"asset-index": t["CreatedAssetID"]})
+            else:
+                sender = encoding.encode_address(t["AssetSender"]) if "AssetSender" in t else appAddress
+                self._move(t["XferAsset"], sender, encoding.encode_address(t["AssetReceiver"]))
+                inner.append({})
+
+        info = {"inner-txns": inner} if inner else {}
+        deltas = []
+        for address, before in localBefore.items():
+            after = engine.localState.get(encoding.decode_address(address), ())
+            changed = [{"key": b64encode(k.encode()).decode(), "value": {"action": 2, "uint": v}}
+                       for k, old, v in zip(LOCAL_KEYS, before or [0] * len(LOCAL_KEYS), after) if old != v]
+            if changed:
+                deltas.append({"address": address, "delta": changed})
+        if deltas:
+            info["local-state-delta"] = deltas
+        return info
+
+    # runs the app's program for txn on what is left of the group's budget
+    def _evaluate(self, program, txn, state, firstAssetID):
+        call = AppCall(encoding.decode_address(txn.sender), txn.index, txn.app_args or [],
+                       [encoding.decode_address(a) for a in (txn.accounts or [])], txn.foreign_assets or [],
+                       int(txn.on_complete), firstAssetID, self._group.index(txn), self._group.size)
+        try:
+            evaluation = program.evaluate(call, state, self._group.budgetLeft, self._group.boxes)
+        except TealReject as e:
+            raise LedgerReject("logic eval error: {}".format(e)) from e
+        self._group.spend(evaluation.cost)
+        return evaluation
+
+    def _mint(self, asaID, appAddress):
+        self._set(self.assets, asaID, {"creator": appAddress, "manager": appAddress, "reserve": appAddress,
+                                       "freeze": appAddress, "clawback": appAddress, "total": 1,
+                                       "decimals": 0, "default-frozen": True})
+        self._set(self.holdings, asaID, {appAddress: 1})
+        # the creator's own holding is never frozen
+        self._set(self.frozen, asaID, {appAddress: False})
+
+    def _move(self, asaID, sender, receiver):
+        holders = self.holdings[asaID]
+        if receiver not in holders:
+            raise LedgerReject("receiver {} not opted in to asset {}".format(receiver, asaID))
+        self._set(holders, sender, holders.get(sender, 0) - 1)
+        self._set(holders, receiver, holders[receiver] + 1)
+
+
+    # views, shaped like the algod / indexer responses
+
+    def status(self):
+        return {"last-round": self.round, "time-since-last-round": 0, "catchup-time": 0,
+                "last-version": "future", "stopped-at-unsupported-round": False}
+
+    def waitForBlockAfter(self, round, timeout=60):
+        with self.cond:
+            self.cond.wait_for(lambda: self.round > round, timeout)
+            return self.status()
+
+    def suggestedParams(self):
+        return {"consensus-version": "future", "fee": 0, "genesis-hash": GENESIS_HASH,
+                "genesis-id": GENESIS_ID, "last-round": self.round, "min-fee": MIN_FEE}
+
+    # (the views below hold cond: they run on the HTTP handler threads, and
+    # a submission may be mutating, or about to roll back, the same dicts)
+
+    def box(self, appID, name):
+        with self.cond:
+            engine = self.apps.get(appID)
+            if engine is None or name not in engine.boxes:
+                return None
+            return {"name": b64encode(name).decode(), "round": self.round,
+                    "value": b64encode(bytes(engine.boxes[name])).decode()}
+
+    def boxNames(self, appID):
+        with self.cond:
+            engine = self.apps.get(appID)
+            return sorted(engine.boxes) if engine is not None else []
+
+    def localState(self, address, appID):
+        with self.cond:
+            engine = self.apps.get(appID)
+            local = engine.localState.get(encoding.decode_address(address)) if engine else None
+            if local is None:
+                return None
+            return {"app-local-state": _appLocalState(appID, local), "round": self.round}
+
+    def optedInAccounts(self, appID):
+        with self.cond:
+            engine = self.apps.get(appID)
+            if engine is None:
+                return []
+            return [{"address": encoding.encode_address(key), "apps-local-state": [_appLocalState(appID, local)]}
+                    for key, local in sorted(engine.localState.items())]
+
+    def assetInfo(self, asaID):
+        with self.cond:
+            params = self.assets.get(asaID)
+            return None if params is None else {"index": asaID, "params": dict(params)}
+
+    def createdAssets(self, creator):
+        with self.cond:
+            return [{"index": asaID, "params": dict(params), "deleted": False}
+                    for asaID, params in sorted(self.assets.items()) if params["creator"] == creator]
+
+    def accountAssets(self, address):
+        with self.cond:
+            return [{"asset-id": asaID, "amount": holders[address], "is-frozen": self.frozen[asaID][address],
+                     "deleted": False}
+                    for asaID, holders in sorted(self.holdings.items()) if address in holders]
+
+    def assetBalances(self, asaID):
+        with self.cond:
+            holders = self.holdings.get(asaID)
+            if holders is None:
+                return None
+            frozen = self.frozen[asaID]
+            return {"balances": [{"address": a, "amount": n, "is-frozen": frozen[a], "deleted": False}
+                                 for a, n in sorted(holders.items())],
+                    "current-round": self.round}
+
+
+_MISSING = object()
+
+
+def _ungrouped(txn):
+    txn = copy.copy(txn)
+    txn.group = None
+    return txn
+
+
+# The opcode budget and box references a group's app calls share: APP_CALL_BUDGET
+# per app call, spent in group order, and the box refs of every call in it, with
+# the app index resolved (0 is the called app, i is foreign_apps[i-1]).
+class _GroupBudget:
+    def __init__(self, txns):
+        self.txns = txns
+        self.size = len(txns)
+        calls = [t for t in txns if t.type == "appl"]
+        self.budgetLeft = APP_CALL_BUDGET * len(calls)
+        refs = []
+        for t in calls:
+            for ref in t.boxes or ():
+                if ref.app_index == 0:
+                    refs.append((t.index, ref.name))
+                elif ref.app_index <= len(t.foreign_apps or ()):
+                    refs.append((t.foreign_apps[ref.app_index - 1], ref.name))
+                else:
+                    raise LedgerReject("box reference names foreign app {} of {}".format(ref.app_index, len(t.foreign_apps or ())))
+        self.boxes = BoxBudget(refs)
+
+    def index(self, txn):
+        return next(i for i, t in enumerate(self.txns) if t is txn)
+
+    def spend(self, cost):
+        self.budgetLeft -= cost
+
+
+# An ArenaEngine's state, read the way TealEvaluator reads an app's (engine is
+# None while the app is being created).
+class _EngineState:
+    def __init__(self, engine, appAddress):
+        self.engine = engine
+        self.appAddress = encoding.decode_address(appAddress)
+
+    def globalGet(self, key):
+        return self.engine.admin if self.engine is not None and key == b"ADMIN" else None
+
+    def optedIn(self, account):
+        return self.engine is not None and account in self.engine.localState
+
+    def localGet(self, account, key):
+        keys = [k.encode() for k in LOCAL_KEYS]
+        return self.engine.localState[account][keys.index(key)] if key in keys else None
+
+    def box(self, name):
+        value = self.engine.boxes.get(name) if self.engine is not None else None
+        return None if value is None else bytes(value)
+
+
+# an approved call's writes and inner transactions, checked against what the
+# engine did with the same call
+def _checkEngine(engine, evaluation, appAddress, firstAssetID):
+    def diverges(what):
+        raise LedgerReject("ArenaEngine diverges from the contract: {}".format(what))
+
+    if evaluation.globals:
+        diverges("global writes {}".format(evaluation.globals))
+    for name, value in evaluation.boxes.items():
+        after = engine.boxes.get(name)
+        if (None if after is None else bytes(after)) != (None if value is None else bytes(value)):
+            diverges("box {!r}".format(name))
+    for account, writes in evaluation.local.items():
+        local = engine.localState.get(account)
+        for key, value in writes.items():
+            if local is None or local[LOCAL_KEYS.index(key.decode())] != value:
+                diverges("local {} of {}".format(key.decode(), encoding.encode_address(account)))
+    appKey = encoding.decode_address(appAddress)
+    created = 0
+    for t in evaluation.innerTxns:
+        if "CreatedAssetID" in t:
+            created += 1
+            if engine.assetHolder.get(t["CreatedAssetID"], _MISSING) is not None:
+                diverges("asset {} is not minted to the app".format(t["CreatedAssetID"]))
+        else:
+            receiver = None if t["AssetReceiver"] == appKey else t["AssetReceiver"]
+            if engine.assetHolder.get(t["XferAsset"], _MISSING) != receiver:
+                diverges("holder of asset {}".format(t["XferAsset"]))
+    if engine.nextAssetID != firstAssetID + created:
+        diverges("{} assets created, not {}".format(engine.nextAssetID - firstAssetID, created))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    ledger = None
+    indexer = False
+
+    routes = [
+        ("GET", r"/health", "health"),
+        ("GET", r"/v2/status", "status"),
+        ("GET", r"/v2/status/wait-for-block-after/(\d+)", "waitForBlock"),
+        ("GET", r"/v2/transactions/params", "params"),
+        ("POST", r"/v2/transactions", "sendTransactions"),
+        ("GET", r"/v2/transactions/pending/(\w+)", "pendingInfo"),
+        ("POST", r"/v2/teal/compile", "compile"),
+        ("GET", r"/v2/applications/(\d+)/box", "box"),
+        ("GET", r"/v2/applications/(\d+)/boxes", "boxes"),
+        ("GET", r"/v2/accounts/(\w+)/applications/(\d+)", "accountApplicationInfo"),
+        ("GET", r"/v2/blocks/(\d+)", "block"),
+        ("GET", r"/v2/accounts", "accounts"),
+        ("GET", r"/v2/assets/(\d+)/balances", "assetBalances"),
+        ("GET", r"/v2/assets/(\d+)", "assetInfo"),
+        ("GET", r"/v2/assets", "searchAssets"),
+        ("GET", r"/v2/accounts/(\w+)/assets", "accountAssets"),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, obj):
+        # bytes are an already encoded msgpack body
+        isRaw = isinstance(obj, bytes)
+        body = obj if isRaw else json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/msgpack" if isRaw else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        url = parse.urlsplit(self.path)
+        self.query = dict(parse.parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+        for m, pattern, name in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if m == method and match:
+                try:
+                    status, obj = getattr(self, "do_" + name)(*match.groups())
+                except LedgerReject as e:
+                    status, obj = 400, {"message": "TransactionPool.Remember: " + str(e)}
+                return self._reply(status, obj)
+        self._reply(404, {"message": "no such endpoint: " + url.path})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+    def do_health(self):
+        if self.indexer:
+            return 200, {"round": self.ledger.round, "db-available": True, "is-migrating": False,
+                         "message": str(self.ledger.round), "version": GENESIS_ID}
+        return 200, {}
+
+    def do_status(self):
+        return 200, self.ledger.status()
+
+    def do_waitForBlock(self, round):
+        return 200, self.ledger.waitForBlockAfter(int(round))
+
+    def do_params(self):
+        return 200, self.ledger.suggestedParams()
+
+    def do_sendTransactions(self):
+        stxns = [encoding.msgpack_decode(d) for d in _unpackAll(self.body)]
+        return 200, {"txId": self.ledger.submit(stxns)}
+
+    def do_pendingInfo(self, txid):
+        info = self.ledger.confirmed.get(txid)
+        if info is None:
+            return 404, {"message": "txn does not exist"}
+        return 200, info
+
+    def do_compile(self):
+        # no TEAL assembler here: the "program" is the source itself, which the
+        # ledger runs through TealEvaluator; a syntax error only shows when the
+        # app is created, and the bytecode size and encoding go unchecked
+        program = self.body
+        return 200, {"hash": encoding.encode_address(encoding.checksum(b"Program" + program)),
+                     "result": b64encode(program).decode()}
+
+    def do_box(self, appID):
+        name = self.query.get("name", "")
+        if name.startswith("b64:"):
+            name = b64decode(name[4:])
+        elif name.startswith("str:"):
+            name = name[4:].encode()
+        box = self.ledger.box(int(appID), name)
+        return (404, {"message": "box not found"}) if box is None else (200, box)
+
+    def do_boxes(self, appID):
+        names = self.ledger.boxNames(int(appID))
+        resp = {"application-id": int(appID)}
+        if self.indexer:
+            start = int(self.query.get("next", 0))
+            limit = int(self.query.get("limit", 0)) or len(names)
+            names, end = names[start:start + limit], start + limit
+            if end < len(self.ledger.boxNames(int(appID))):
+                resp["next-token"] = str(end)
+        resp["boxes"] = [{"name": b64encode(n).decode()} for n in names]
+        return 200, resp
+
+    def do_accountApplicationInfo(self, address, appID):
+        info = self.ledger.localState(address, int(appID))
+        return (404, {"message": "account application info not found"}) if info is None else (200, info)
+
+    # msgpack only, and only what a follower needs: the txns with their apply
+    # data (created app / asset ids, inner txns, local state deltas)
+    def do_block(self, round):
+        round = int(round)
+        if self.query.get("format") != "msgpack":
+            return 400, {"message": "only format=msgpack blocks are served"}
+        if round > self.ledger.round:
+            return 404, {"message": "failed to retrieve information from the ledger"}
+        entries = [_blockEntry(stxn, info) for stxn, info in self.ledger.blocks.get(round, [])]
+        return 200, msgpack.packb({"block": {"rnd": round, "gen": GENESIS_ID, "txns": entries}}, use_bin_type=True)
+
+    # indexer account search; only the application-id filter is supported
+    def do_accounts(self):
+        accounts = self.ledger.optedInAccounts(int(self.query.get("application-id", 0)))
+        start = int(self.query.get("next", 0))
+        limit = int(self.query.get("limit", 0)) or len(accounts)
+        resp = {"accounts": accounts[start:start + limit], "current-round": self.ledger.round}
+        if start + limit < len(accounts):
+            resp["next-token"] = str(start + limit)
+        return 200, resp
+
+    def do_assetInfo(self, asaID):
+        info = self.ledger.assetInfo(int(asaID))
+        return (404, {"message": "asset does not exist"}) if info is None else (200, info)
+
+    def do_assetBalances(self, asaID):
+        info = self.ledger.assetBalances(int(asaID))
+        return (404, {"message": "no assets found"}) if info is None else (200, info)
+
+    # indexer asset search; only the creator filter is supported
+    def do_searchAssets(self):
+        return self._page("assets", self.ledger.createdAssets(self.query.get("creator", "")))
+
+    def do_accountAssets(self, address):
+        return self._page("assets", self.ledger.accountAssets(address))
+
+    # indexer style next-token paging over a list
+    def _page(self, key, items):
+        start = int(self.query.get("next", 0))
+        limit = int(self.query.get("limit", 0)) or len(items)
+        resp = {key: items[start:start + limit], "current-round": self.ledger.round}
+        if start + limit < len(items):
+            resp["next-token"] = str(start + limit)
+        return 200, resp
+
+
+def _appLocalState(appID, local):
+    kv = [{"key": b64encode(k.encode()).decode(), "value": {"type": 2, "uint": v, "bytes": ""}}
+          for k, v in zip(LOCAL_KEYS, local)]
+    return {"id": appID, "key-value": kv, "deleted": False, "schema": {"num-uint": 4, "num-byte-slice": 0}}
+
+
+def _blockEntry(stxn, info):
+    txn = stxn.transaction
+    entry = {"txn": dict(txn.dictify()), "sig": b64decode(stxn.signature), "hgi": True}
+    if "application-index" in info:
+        entry["apid"] = info["application-index"]
+    dt = {}
+    if info.get("inner-txns"):
+        dt["itx"] = [{"txn": {"type": "acfg"}, "caid": t["asset-index"]} if "asset-index" in t else {"txn": {"type": "axfer"}}
+                     for t in info["inner-txns"]]
+    if info.get("local-state-delta"):
+        refs = [txn.sender] + list(getattr(txn, "accounts", None) or [])
+        dt["ld"] = {refs.index(d["address"]): {b64decode(kv["key"]): {"at": kv["value"]["action"], "ui": kv["value"]["uint"]}
+                                               for kv in d["delta"]}
+                    for d in info["local-state-delta"]}
+    if dt:
+        entry["dt"] = dt
+    return entry
+
+
+def _unpackAll(body):
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(body)
+    return list(unpacker)
+
+
+# A stand-in for the sandbox's algod + indexer, serving the endpoints the arena
+# scripts use from one LocalLedger with funded, freshly generated accounts. It
+# checks signatures, groups, fees, the opcode budget and box references, and runs
+# the contract's TEAL; see LocalLedger for what it doesn't model.
+class LocalNode:
+    def __init__(self, numAccounts=3, algodPort=0, indexerPort=0, host="127.0.0.1"):
+        from beaker import sandbox
+        self.accounts = []
+        for _ in range(numAccounts):
+            sk, addr = account.generate_account()
+            self.accounts.append(sandbox.SandboxAccount(address=addr, private_key=sk))
+        self.ledger = LocalLedger([a.address for a in self.accounts])
+
+        self._servers = [self._server(host, algodPort, False), self._server(host, indexerPort, True)]
+        self.algodAddress = "http://{}:{}".format(host, self._servers[0].server_port)
+        self.indexerAddress = "http://{}:{}".format(host, self._servers[1].server_port)
+
+    def _server(self, host, port, indexer):
+        handler = type("Handler", (_Handler,), {"ledger": self.ledger, "indexer": indexer})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        return server
+
+    def start(self):
+        for s in self._servers:
+            threading.Thread(target=s.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for s in self._servers:
+            s.shutdown()
+            s.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,288 @@
+from algosdk import constants, transaction
+from algosdk.error import AlgodHTTPError
+from algosdk.transaction import ApplicationCallTxn, PaymentTxn
+import math
+import os
+import time
+
+from ArenaSubmitter import TxnRejectedError
+
+
+BOX_IO_BYTES = 1024             # box bytes each box reference lets the group read/write
+MAX_TXN_REFERENCES = 8          # accounts + assets + apps + boxes on one app call
+MAX_TXN_ACCOUNTS = 4
+
+
+# One player action: its txns (unsigned and ungrouped; the packer sets group,
+# fees and box references), the boxes it may touch as (app id, name, size),
+# and the accounts whose state it reads or writes. Actions sharing an account
+# are applied in queue order; actions sharing a conflict key (say, the monster
+# two players try to kill) are never packed into the same group.
+class Action:
+    def __init__(self, sender, txns, innerTxns=0, boxes=(), touches=(), conflicts=(), label=None):
+        self.sender = sender
+        self.txns = list(txns)
+        self.innerTxns = innerTxns
+        self.boxes = list(boxes)
+        self.touches = {sender.address, *touches}
+        self.conflicts = set(conflicts)
+        self.label = label or "action"
+        # the foreign apps each call came with; packing adds those its box
+        # references need, and a repack starts over from these
+        self.foreignApps = {}
+
+        for t in self.txns:
+            if isinstance(t, ApplicationCallTxn):
+                if len(t.accounts or []) > MAX_TXN_ACCOUNTS or _references(t) > MAX_TXN_REFERENCES:
+                    raise ValueError("{}: too many foreign references on one app call".format(self.label))
+                self.foreignApps[id(t)] = list(t.foreign_apps or [])
+
+    def feeUnits(self):
+        return len(self.txns) + self.innerTxns
+
+
+def _references(txn):
+    return len(txn.accounts or []) + len(txn.foreign_assets or []) + len(txn.foreign_apps or [])
+
+
+# box references the group must carry: each named box once, and enough of them
+# (named or empty) to cover the I/O of every distinct box touched
+def _boxRefsNeeded(actions):
+    named = {}
+    for a in actions:
+        for appID, name, size in a.boxes:
+            named[(appID, name)] = size
+    return named, max(len(named), math.ceil(sum(named.values()) / BOX_IO_BYTES))
+
+
+def _appCalls(actions):
+    return [t for a in actions for t in a.txns if isinstance(t, ApplicationCallTxn)]
+
+
+# The group's box references spread over the free reference slots of its app
+# calls, named ones first, then empty ones until the I/O quota is covered. A box
+# of an app other than the call's own goes through the call's foreign apps,
+# taking a slot for the app too unless it's there already. Returns the refs and
+# foreign apps of each call (by id) and how many refs found no slot.
+def _placeBoxRefs(actions):
+    named, needed = _boxRefsNeeded(actions)
+    pending = [(appID, name) for appID, name in named] + [(0, b"")] * (needed - len(named))
+    placed = {}
+    for a in actions:
+        for t in a.txns:
+            if not isinstance(t, ApplicationCallTxn):
+                continue
+            refs, apps = [], list(a.foreignApps[id(t)])
+            while pending:
+                appID, name = pending[0]
+                own = appID in (0, t.index)
+                used = len(t.accounts or []) + len(t.foreign_assets or []) + len(apps) + len(refs)
+                if used + 1 + (not own and appID not in apps) > MAX_TXN_REFERENCES:
+                    break
+                if not own and appID not in apps:
+                    apps.append(appID)
+                refs.append((0 if own else appID, name))
+                pending.pop(0)
+            placed[id(t)] = (refs, apps)
+    return placed, len(pending)
+
+
+class PackedGroup:
+    def __init__(self, actions, txns, boxRefs, fee):
+        self.actions = actions
+        self.txns = txns
+        self.boxRefs = boxRefs
+        self.fee = fee
+        self.touches = set().union(*(a.touches for a in actions))
+        self.keys = self.touches.union(*(a.conflicts for a in actions))
+
+    def fill(self):
+        return len(self.txns) / constants.TX_GROUP_LIMIT
+
+    def sign(self, keys):
+        return [t.sign(keys[t.sender]) for t in self.txns]
+
+
+# Packs actions, in queue order, into as few atomic groups as the limits allow:
+# maxGroupSize txns, the box references the group needs spread over free
+# reference slots of its app calls, and no conflict key twice. Fees are pooled:
+# with a feePayer the whole group's fee (inner txns included) rides on one of
+# its txns, otherwise each action pays for its own txns and inner txns.
+def packActions(actions, maxGroupSize=constants.TX_GROUP_LIMIT, feePayer=None, sp=None):
+    groups = []
+    current = []
+    for action in actions:
+        if not _fits([action], maxGroupSize, feePayer):
+            raise ValueError("{} does not fit in a group on its own".format(action.label))
+        if current and not _fits(current + [action], maxGroupSize, feePayer):
+            groups.append(_seal(current, feePayer, sp))
+            current = []
+        current.append(action)
+    if current:
+        groups.append(_seal(current, feePayer, sp))
+    return groups
+
+
+def _fits(actions, maxGroupSize, feePayer):
+    size = sum(len(a.txns) for a in actions)
+    if feePayer is not None and not any(a.sender.address == feePayer.address for a in actions):
+        size += 1
+    if size > maxGroupSize:
+        return False
+
+    seen = set()
+    for a in actions:
+        if a.conflicts & seen:
+            return False
+        seen |= a.conflicts
+
+    return _placeBoxRefs(actions)[1] == 0
+
+
+# params for the fee payer's txn, valid over the same rounds as the group's
+def _paramsOf(txn):
+    return transaction.SuggestedParams(0, txn.first_valid_round, txn.last_valid_round, txn.genesis_hash,
+                                       txn.genesis_id, flat_fee=True)
+
+
+def _seal(actions, feePayer, sp):
+    txns = [t for a in actions for t in a.txns]
+    for t in txns:
+        t.group = None
+        # identical calls in one group (two "UP" moves) would share a txid
+        if not t.note:
+            t.note = os.urandom(8)
+
+    named, needed = _boxRefsNeeded(actions)
+    placed, unplaced = _placeBoxRefs(actions)
+    for t in _appCalls(actions):
+        refs, apps = placed[id(t)]
+        t.foreign_apps = apps or None
+        t.boxes = transaction.BoxReference.translate_box_references(refs, apps, t.index) or None
+
+    minFee = constants.MIN_TXN_FEE
+    total = minFee * (len(txns) + sum(a.innerTxns for a in actions))
+    if feePayer is not None:
+        payerTxns = [t for t in txns if t.sender == feePayer.address]
+        if payerTxns:
+            payer = payerTxns[0]
+        else:
+            payer = PaymentTxn(feePayer.address, sp or _paramsOf(txns[0]), feePayer.address, 0, note=os.urandom(8))
+            txns.insert(0, payer)
+            total += minFee
+        for t in txns:
+            t.fee = 0
+        payer.fee = total
+    else:
+        for a in actions:
+            for t in a.txns:
+                t.fee = minFee
+            a.txns[-1].fee += minFee * a.innerTxns
+
+    if len(txns) > 1:
+        gid = transaction.calculate_group_id(txns)
+        for t in txns:
+            t.group = gid
+    return PackedGroup(actions, txns, needed, total)
+
+
+# Per-group outcome of a tick, for tuning the tick length: how full each group
+# was, in which wave and round it landed, and which ones were rejected.
+class TickReport:
+    def __init__(self):
+        self.groups = []
+        self.waves = 0
+        self.splits = 0
+
+    def record(self, group, wave, confirmedRound=None, reason=None, latency=None):
+        units = sum(a.feeUnits() for a in group.actions)
+        self.groups.append({
+            "wave": wave, "actions": len(group.actions), "txns": len(group.txns),
+            "fill": round(group.fill(), 3), "boxRefs": group.boxRefs, "fee": group.fee,
+            "labels": [a.label for a in group.actions],
+            # the group's fee split by fee units, whoever's txn carried it
+            "actionFees": [group.fee * a.feeUnits() // units for a in group.actions],
+            "confirmedRound": confirmedRound, "rejected": reason,
+            "latency": None if latency is None else round(latency, 4)})
+
+    def summary(self):
+        landed = [g for g in self.groups if g["rejected"] is None]
+        return {
+            "groups": len(self.groups),
+            "actions": sum(g["actions"] for g in self.groups),
+            "confirmedActions": sum(g["actions"] for g in landed),
+            "rejectedActions": sum(g["actions"] for g in self.groups) - sum(g["actions"] for g in landed),
+            "meanFill": round(sum(g["fill"] for g in self.groups) / len(self.groups), 3) if self.groups else 0,
+            "waves": self.waves,
+            "splits": self.splits,
+            "rounds": len({g["confirmedRound"] for g in landed}),
+            "fees": sum(g["fee"] for g in landed),
+        }
+
+    def toDict(self):
+        return {"summary": self.summary(), "groups": self.groups}
+
+
+# Runs a tick's worth of queued actions through a PipelinedSubmitter. Groups go
+# out in waves: a group waits while an earlier group still in the queue shares
+# an account or conflict key with it, so one account's actions land in order,
+# and everything else of a wave is in flight together. A rejected group takes
+# every action in it down, so it is split in half and the halves retried in
+# later waves until the failing action is alone. A group the node refuses on
+# submission counts as rejected the same as one that expires.
+class TickScheduler:
+    def __init__(self, submitter, maxGroupSize=constants.TX_GROUP_LIMIT, feePayer=None, signer=None):
+        self.submitter = submitter
+        self.maxGroupSize = maxGroupSize
+        self.feePayer = feePayer
+        # an ArenaSigner.SigningPool signs each wave in one go; without one,
+        # groups are signed inline
+        self.signer = signer
+
+    def _pack(self, actions):
+        return packActions(actions, self.maxGroupSize, self.feePayer)
+
+    def run(self, actions) -> TickReport:
+        keys = {a.sender.address: a.sender.private_key for a in actions}
+        if self.feePayer is not None:
+            keys[self.feePayer.address] = self.feePayer.private_key
+
+        report = TickReport()
+        queue = self._pack(actions)
+        while queue:
+            wave = []
+            blocked = set()
+            for group in queue:
+                if not group.keys & blocked:
+                    wave.append(group)
+                blocked |= group.keys
+
+            report.waves += 1
+            if self.signer is not None:
+                signed = self.signer.signMany([group.txns for group in wave])
+            else:
+                signed = [group.sign(keys) for group in wave]
+            futures = [(group, self.submitter.submit(stxns)) for group, stxns in zip(wave, signed)]
+            # submit to confirmation (or rejection), stamped as each future settles
+            submittedAt = time.monotonic()
+            settledAt = {}
+            for group, future in futures:
+                future.add_done_callback(lambda f: settledAt.setdefault(id(f), time.monotonic()))
+            retries = {}
+            for group, future in futures:
+                try:
+                    info = future.result()
+                    report.record(group, report.waves, confirmedRound=info["confirmed-round"],
+                                  latency=settledAt.get(id(future), time.monotonic()) - submittedAt)
+                except (AlgodHTTPError, TxnRejectedError) as e:
+                    if len(group.actions) > 1:
+                        half = len(group.actions) // 2
+                        retries[id(group)] = self._pack(group.actions[:half]) + self._pack(group.actions[half:])
+                        report.splits += 1
+                    else:
+                        report.record(group, report.waves, reason=getattr(e, "reason", str(e)),
+                                      latency=settledAt.get(id(future), time.monotonic()) - submittedAt)
+
+            inWave = {id(g) for g in wave}
+            queue = [g for group in queue for g in (retries.get(id(group), []) if id(group) in inWave else [group])]
+        return report
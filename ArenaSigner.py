@@ -0,0 +1,121 @@
+from algosdk import encoding
+from concurrent.futures import ProcessPoolExecutor
+from base64 import b64decode, b32encode
+from nacl.signing import SigningKey
+import multiprocessing
+import os
+
+
+# Signed transaction as the node wants it: canonical msgpack {"sig", "txn"}.
+# Quacks like a SignedTransaction as far as the submitters are concerned.
+class SignedBlob:
+    def __init__(self, transaction, txid, blob):
+        self.transaction = transaction
+        self.txid = txid
+        self.blob = blob
+
+    def get_txid(self):
+        return self.txid
+
+
+# worker side only: the keys of this worker's shard, loaded once per process
+# by the pool's initializer (an inline pool keeps its keys on the instance)
+_keys = {}
+
+
+def _signingKeys(keys):
+    return {address: SigningKey(b64decode(privateKey)[:32]) for address, privateKey in keys}
+
+
+def _loadKeys(keys):
+    _keys.update(_signingKeys(keys))
+
+
+# (sender, msgpack txn bytes) pairs -> (txid, signed blob) pairs, signed with
+# keys (default: the worker's). The blob is spliced together by hand: a
+# two-entry map, "sig" then "txn" (already sorted).
+def _signEncoded(batch, keys=None):
+    keys = _keys if keys is None else keys
+    out = []
+    for sender, txnBytes in batch:
+        message = b"TX" + txnBytes
+        sig = keys[sender].sign(message).signature
+        txid = b32encode(encoding.checksum(message)).decode().strip("=")
+        out.append((txid, b"\x82\xa3sig\xc4\x40" + sig + b"\xa3txn" + txnBytes))
+    return out
+
+
+# Signs batches of unsigned transactions (groups included, senders mixed) on a
+# pool of worker processes. Accounts are sharded over the workers, so each one
+# only holds its own accounts' keys and a sender's txns always land on the same
+# process. Txns cross the process boundary as msgpack bytes, not pickled
+# objects, and come back as ready-to-send blobs in the order they went in.
+# processes=0 signs inline, on the calling thread.
+class SigningPool:
+    def __init__(self, accounts, processes=None, chunkSize=256):
+        self.processes = os.cpu_count() if processes is None else processes
+        self.chunkSize = chunkSize
+        self._shardOf = {}
+        shards = [[] for _ in range(max(1, self.processes))]
+        for i, acc in enumerate(accounts):
+            self._shardOf[acc.address] = i % len(shards)
+            shards[i % len(shards)].append((acc.address, acc.private_key))
+
+        self._executors = []
+        self._keys = {}
+        if self.processes == 0:
+            self._keys = _signingKeys(shards[0])
+            return
+        # spawn, not fork: the submitters' threads may be running when the pool starts
+        ctx = multiprocessing.get_context("spawn")
+        for keys in shards:
+            self._executors.append(ProcessPoolExecutor(1, mp_context=ctx, initializer=_loadKeys, initargs=(keys,)))
+
+    def sign(self, txns):
+        return self.signMany([txns])[0]
+
+    def signMany(self, batches):
+        batches = [list(b) for b in batches]
+        flat = [t for b in batches for t in b]
+        encoded = [b64decode(encoding.msgpack_encode(t)) for t in flat]
+
+        byShard = {}
+        for i, t in enumerate(flat):
+            shard = self._shardOf.get(t.sender)
+            if shard is None:
+                raise KeyError("no key for sender " + t.sender)
+            byShard.setdefault(shard, []).append(i)
+
+        signed = [None] * len(flat)
+        if not self._executors:
+            for i, (txid, blob) in enumerate(_signEncoded([(t.sender, e) for t, e in zip(flat, encoded)], self._keys)):
+                signed[i] = SignedBlob(flat[i], txid, blob)
+        else:
+            jobs = []
+            for shard, indices in byShard.items():
+                for c in range(0, len(indices), self.chunkSize):
+                    chunk = indices[c:c + self.chunkSize]
+                    future = self._executors[shard].submit(_signEncoded, [(flat[i].sender, encoded[i]) for i in chunk])
+                    jobs.append((chunk, future))
+            for chunk, future in jobs:
+                for i, (txid, blob) in zip(chunk, future.result()):
+                    signed[i] = SignedBlob(flat[i], txid, blob)
+
+        out = []
+        start = 0
+        for b in batches:
+            out.append(signed[start:start + len(b)])
+            start += len(b)
+        return out
+
+    def close(self):
+        for ex in self._executors:
+            ex.shutdown()
+        self._executors = []
+        self._keys = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
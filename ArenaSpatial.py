@@ -0,0 +1,182 @@
+from algosdk import encoding
+from math import isqrt
+
+from ArenaEngine import ArenaReject, checkDistInRange, STEAL_RANGE_SQ, SAFE_ZONE
+
+
+# one cell spans the steal radius, so a steal query looks at 3x3 cells
+GRID_CELL = isqrt(STEAL_RANGE_SQ)
+
+
+# Uniform grid over the active players (SCORE != 0), for the questions the
+# client would otherwise answer by comparing every pair of players: who can I
+# rob, who is nearest, who is in the safe zone. Players holding an
+# UNSECURED_ASSET are also kept in a grid of their own, so steal queries only
+# look at those. Updates move a player between cells in place; radius checks
+# go through checkDistInRange, so a player returned is one the contract would
+# let you reach (overflows included).
+class PlayerGrid:
+    def __init__(self, cellSize=GRID_CELL):
+        self.cellSize = cellSize
+        self._players = {}          # address -> (POS_X, POS_Y, UNSECURED_ASSET)
+        self._cells = {}            # (cx, cy) -> set of addresses
+        self._holderCells = {}      # the same, for players holding an asset
+        self._synced = {}           # player key -> local state tuple, see sync
+
+    @classmethod
+    def fromTable(cls, players, cellSize=GRID_CELL):
+        grid = cls(cellSize)
+        grid.syncTable(players)
+        return grid
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, address):
+        return address in self._players
+
+    def get(self, address):
+        return self._players.get(address)
+
+    def _cell(self, x, y):
+        return x // self.cellSize, y // self.cellSize
+
+    def _unlink(self, address, player):
+        cell = self._cell(player[0], player[1])
+        for cells in (self._cells, self._holderCells) if player[2] else (self._cells,):
+            members = cells[cell]
+            members.discard(address)
+            if not members:
+                del cells[cell]
+
+
+    # updates
+
+    # an inactive player (score 0) is dropped
+    def update(self, address, x, y, asset, score):
+        old = self._players.get(address)
+        if score == 0:
+            if old is not None:
+                self.remove(address)
+            return
+        new = (x, y, asset)
+        if old == new:
+            return
+        if old is not None:
+            self._unlink(address, old)
+        self._players[address] = new
+        cell = self._cell(x, y)
+        self._cells.setdefault(cell, set()).add(address)
+        if asset:
+            self._holderCells.setdefault(cell, set()).add(address)
+
+    def move(self, address, x, y):
+        _, _, asset = self._players[address]
+        self.update(address, x, y, asset, 1)
+
+    def remove(self, address):
+        old = self._players.pop(address, None)
+        if old is not None:
+            self._unlink(address, old)
+
+    # brings the grid in line with a PlayerTable (LocalStateCrawler's, say):
+    # only rows that changed are touched, players missing from it are dropped
+    def syncTable(self, players):
+        seen = set()
+        for addr, x, y, asset, score in zip(players.addresses, players.x.tolist(), players.y.tolist(),
+                                            players.asset.tolist(), players.score.tolist()):
+            seen.add(addr)
+            self.update(addr, x, y, asset, score)
+        for addr in [a for a in self._players if a not in seen]:
+            self.remove(addr)
+
+    # brings the grid in line with a WorldSnapshot. Snapshots share the local
+    # state tuples of players a block didn't touch, so only new tuples are looked at.
+    def sync(self, snapshot):
+        local = snapshot.localRows()
+        for key, row in local.items():
+            if self._synced.get(key) is not row:
+                self._synced[key] = row
+                x, y, asset, score = row
+                self.update(encoding.encode_address(key), x, y, asset, score)
+        for key in [k for k in self._synced if k not in local]:
+            del self._synced[key]
+            self.remove(encoding.encode_address(key))
+
+
+    # queries
+
+    # addresses in cells that overlap the rectangle (edges included)
+    def _candidates(self, cells, minX, minY, maxX, maxY):
+        (cx0, cy0), (cx1, cy1) = self._cell(minX, minY), self._cell(maxX, maxY)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            return [a for (cx, cy), members in cells.items()
+                    if cx0 <= cx <= cx1 and cy0 <= cy <= cy1 for a in members]
+        return [a for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1) for a in cells.get((cx, cy), ())]
+
+    # (address, squared distance) of active players within rSq of (x, y) by the
+    # contract's check, nearest first
+    def within(self, x, y, rSq, holdingOnly=False, exclude=None):
+        r = isqrt(rSq)
+        found = []
+        for addr in self._candidates(self._holderCells if holdingOnly else self._cells,
+                                     max(x - r, 0), max(y - r, 0), x + r, y + r):
+            if addr == exclude:
+                continue
+            px, py, _ = self._players[addr]
+            try:
+                if checkDistInRange(x, y, px, py, rSq):
+                    found.append((addr, (px - x) ** 2 + (py - y) ** 2))
+            except ArenaReject:
+                pass
+        found.sort(key=lambda f: f[1])
+        return found
+
+    # players a thief at (x, y) can rob right now: active, holding an asset and
+    # in steal range, nearest first
+    def stealTargets(self, x, y, exclude=None):
+        return [addr for addr, _ in self.within(x, y, STEAL_RANGE_SQ, holdingOnly=True, exclude=exclude)]
+
+    # the k active players nearest to (x, y) as (address, squared distance),
+    # searched ring by ring of cells outward; once a ring has more cells than
+    # are occupied, the rest are simply all looked at
+    def nearest(self, x, y, k, holdingOnly=False, exclude=None):
+        cells = self._holderCells if holdingOnly else self._cells
+        total = sum(len(m) for m in cells.values())
+        cx, cy = self._cell(x, y)
+        found = []
+        seen = 0
+        ring = 0
+        while seen < total:
+            if 8 * ring > len(cells):
+                found = [(a, (self._players[a][0] - x) ** 2 + (self._players[a][1] - y) ** 2)
+                         for members in cells.values() for a in members if a != exclude]
+                found.sort(key=lambda f: f[1])
+                break
+            if ring == 0:
+                ringCells = [(cx, cy)]
+            else:
+                ringCells = [(cx + dx, cy + dy) for dx in range(-ring, ring + 1) for dy in (-ring, ring)] + \
+                            [(cx + dx, cy + dy) for dx in (-ring, ring) for dy in range(-ring + 1, ring)]
+            for cell in ringCells:
+                for addr in cells.get(cell, ()):
+                    seen += 1
+                    if addr != exclude:
+                        px, py, _ = self._players[addr]
+                        found.append((addr, (px - x) ** 2 + (py - y) ** 2))
+            # anything beyond this ring is more than ring cells away
+            found.sort(key=lambda f: f[1])
+            if len(found) >= k and found[k - 1][1] <= (ring * self.cellSize) ** 2:
+                break
+            ring += 1
+        return found[:k]
+
+    # active players inside the rectangle, edges included
+    def inRect(self, minX, minY, maxX, maxY, holdingOnly=False):
+        cells = self._holderCells if holdingOnly else self._cells
+        return [a for a in self._candidates(cells, minX, minY, maxX, maxY)
+                if minX <= self._players[a][0] <= maxX and minY <= self._players[a][1] <= maxY]
+
+    # active players standing in the safe zone (where secureAsset is allowed)
+    def inSafeZone(self, holdingOnly=False):
+        return self.inRect(*SAFE_ZONE, holdingOnly=holdingOnly)
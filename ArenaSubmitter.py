@@ -0,0 +1,214 @@
+from concurrent.futures import Future
+from collections import deque
+from base64 import b64encode
+import threading
+import time
+
+
+# seconds between retries of a failed status call, doubling up to the max; past
+# MAX_CONFIRM_RETRIES failures in a row the submitter gives up
+RETRY_DELAY, MAX_RETRY_DELAY = 0.1, 2.0
+MAX_CONFIRM_RETRIES = 8
+
+
+class TxnRejectedError(Exception):
+    def __init__(self, txid, reason):
+        super().__init__("transaction {} rejected: {}".format(txid, reason))
+        self.txid = txid
+        self.reason = reason
+
+
+# Sends one txn or group. Pre-encoded blobs (ArenaSigner.SignedBlob) go out as
+# raw bytes, without re-encoding.
+def sendToNode(client, signedTxns):
+    blobs = [getattr(t, "blob", None) for t in signedTxns]
+    if None not in blobs:
+        return client.send_raw_transaction(b64encode(b"".join(blobs)))
+    if len(signedTxns) == 1:
+        return client.send_transaction(signedTxns[0])
+    return client.send_transactions(signedTxns)
+
+
+class _PendingSubmission:
+    def __init__(self, signedTxns, future):
+        self.signedTxns = signedTxns
+        self.future = future
+        self.txids = [t.get_txid() for t in signedTxns]
+        self.lastValid = max(t.transaction.last_valid_round for t in signedTxns)
+
+
+class PipelinedSubmitter:
+    # Sends signed transactions / groups without blocking on confirmation.
+    # submit() returns a Future that resolves to the pending transaction info of
+    # the last transaction in the submission (what the blocking helpers return),
+    # or fails with TxnRejectedError / the algod error that rejected the send.
+    # onRound, if given, is called with every new round the confirmer sees, and
+    # onConfirmed with the confirmed info and the signed txns of every
+    # submission that lands. If algod stays unreachable for the confirmer, every
+    # pending Future fails with its error and the submitter closes.
+    def __init__(self, client, maxInFlight=256, onRound=None, onConfirmed=None):
+        self.client = client
+        self.maxInFlight = maxInFlight
+        self.onRound = onRound
+        self.onConfirmed = onConfirmed
+
+        self._lock = threading.Condition()
+        self._queue = deque()
+        self._inFlight = []
+        self._sending = 0
+        self._closed = False
+        self._error = None
+
+        self._sender = threading.Thread(target=self._sendLoop, daemon=True)
+        self._confirmer = threading.Thread(target=self._confirmLoop, daemon=True)
+        self._sender.start()
+        self._confirmer.start()
+
+    def submit(self, signedTxns):
+        if not isinstance(signedTxns, (list, tuple)):
+            signedTxns = [signedTxns]
+        future = Future()
+        sub = _PendingSubmission(list(signedTxns), future)
+        future.txids = sub.txids
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("submitter is closed") from self._error
+            self._queue.append(sub)
+            self._lock.notify_all()
+        return future
+
+    def submitMany(self, submissions):
+        return [self.submit(s) for s in submissions]
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue) + self._sending + len(self._inFlight)
+
+    def _idle(self):
+        return not self._queue and not self._sending and not self._inFlight
+
+    def drain(self, timeout=None):
+        with self._lock:
+            return self._lock.wait_for(self._idle, timeout)
+
+    def close(self, timeout=None):
+        self.drain(timeout)
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._sender.join(timeout)
+        self._confirmer.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _sendLoop(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._closed or (self._queue and len(self._inFlight) < self.maxInFlight))
+                if self._closed and not self._queue:
+                    return
+                batch = []
+                while self._queue and len(self._inFlight) + len(batch) < self.maxInFlight:
+                    batch.append(self._queue.popleft())
+                self._sending += len(batch)
+
+            for sub in batch:
+                try:
+                    sendToNode(self.client, sub.signedTxns)
+                except Exception as e:
+                    sub.future.set_exception(e)
+                    with self._lock:
+                        self._sending -= 1
+                        self._lock.notify_all()
+                    continue
+                with self._lock:
+                    self._sending -= 1
+                    # sent after the confirmer gave up: nothing would ever poll it
+                    if self._error is not None:
+                        sub.future.set_exception(self._error)
+                    else:
+                        self._inFlight.append(sub)
+                    self._lock.notify_all()
+
+    def _confirmLoop(self):
+        lastRound = None
+        failures = 0
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._inFlight or (self._closed and self._idle()))
+                if self._closed and self._idle():
+                    return
+                inFlight = list(self._inFlight)
+
+            try:
+                if lastRound is None:
+                    lastRound = self.client.status()["last-round"]
+                lastRound = self._confirmRound(inFlight, lastRound)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures > MAX_CONFIRM_RETRIES:
+                    self._fail(e)
+                    return
+                time.sleep(min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY))
+
+    # polls the in-flight submissions once, then waits for the next round if any
+    # are left; returns the last round seen
+    def _confirmRound(self, inFlight, lastRound):
+        done = []
+        for sub in inFlight:
+            try:
+                if self._poll(sub, lastRound):
+                    done.append(sub)
+            except Exception as e:
+                sub.future.set_exception(e)
+                done.append(sub)
+
+        with self._lock:
+            for sub in done:
+                self._inFlight.remove(sub)
+            self._lock.notify_all()
+            stillWaiting = bool(self._inFlight)
+
+        if stillWaiting:
+            lastRound = self.client.status_after_block(lastRound)["last-round"]
+            if self.onRound is not None:
+                self.onRound(lastRound)
+        return lastRound
+
+    # fails everything queued or in flight with error and closes the submitter
+    def _fail(self, error):
+        with self._lock:
+            self._error = error
+            self._closed = True
+            failed = list(self._queue) + self._inFlight
+            self._queue.clear()
+            self._inFlight = []
+            self._lock.notify_all()
+        for sub in failed:
+            sub.future.set_exception(error)
+
+    def _poll(self, sub, lastRound):
+        # the group confirms atomically, so the last txn is enough for success;
+        # a pool error on any member rejects the whole submission
+        info = self.client.pending_transaction_info(sub.txids[-1])
+        if info.get("confirmed-round", 0) > 0:
+            if self.onConfirmed is not None:
+                self.onConfirmed(info, sub.signedTxns)
+            sub.future.set_result(info)
+            return True
+        for txid in sub.txids:
+            if txid != sub.txids[-1]:
+                info = self.client.pending_transaction_info(txid)
+            if info.get("pool-error"):
+                sub.future.set_exception(TxnRejectedError(txid, info["pool-error"]))
+                return True
+        if lastRound > sub.lastValid:
+            sub.future.set_exception(TxnRejectedError(sub.txids[-1], "expired at round {}".format(sub.lastValid)))
+            return True
+        return False
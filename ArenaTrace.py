@@ -0,0 +1,304 @@
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+import time
+
+
+# upper bounds of the histogram buckets (Prometheus "le"); +Inf is implied
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROUNDS_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20)
+
+_enabled = False
+_local = threading.local()
+
+
+# Tracing of the AppTestAndDeploy helpers. An action (one helper call, see
+# traced) is timed as a whole and split into spans: params fetch, sign,
+# submit, confirmation wait, reads. Durations go into per-(action, span)
+# histograms along with the rounds each confirmation took, the fees paid and
+# the inner txns run. Finished actions are optionally written as JSON lines,
+# and the histograms can be served as Prometheus text. While tracing is off
+# every hook is a flag check returning a shared do-nothing span.
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket the q-th observation falls in
+        if not self.count:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+    def toDict(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}             # (action, span) -> Histogram of seconds
+        self.rounds = {}            # action -> Histogram of rounds to confirmation
+        self.actions = {}           # (action, outcome) -> count
+        self.fees = {}              # action -> microalgos paid
+        self.innerTxns = {}         # action -> inner txns run
+
+    def observeSpan(self, action, span, seconds):
+        with self._lock:
+            h = self.spans.get((action, span))
+            if h is None:
+                h = self.spans[(action, span)] = Histogram(SECONDS_BUCKETS)
+            h.observe(seconds)
+
+    def observeConfirmed(self, action, rounds, fee, innerTxns):
+        with self._lock:
+            h = self.rounds.get(action)
+            if h is None:
+                h = self.rounds[action] = Histogram(ROUNDS_BUCKETS)
+            if rounds is not None:
+                h.observe(rounds)
+            self.fees[action] = self.fees.get(action, 0) + fee
+            self.innerTxns[action] = self.innerTxns.get(action, 0) + innerTxns
+
+    def countAction(self, action, outcome):
+        with self._lock:
+            self.actions[(action, outcome)] = self.actions.get((action, outcome), 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.rounds.clear()
+            self.actions.clear()
+            self.fees.clear()
+            self.innerTxns.clear()
+
+    # one dict per histogram / counter, e.g. for a JSON lines dump
+    def records(self):
+        with self._lock:
+            out = [{"metric": "span_seconds", "action": a, "span": s, **h.toDict()} for (a, s), h in sorted(self.spans.items())]
+            out += [{"metric": "confirm_rounds", "action": a, **h.toDict()} for a, h in sorted(self.rounds.items())]
+            out += [{"metric": "actions", "action": a, "outcome": o, "count": n} for (a, o), n in sorted(self.actions.items())]
+            out += [{"metric": "fees_microalgos", "action": a, "total": n} for a, n in sorted(self.fees.items())]
+            out += [{"metric": "inner_txns", "action": a, "total": n} for a, n in sorted(self.innerTxns.items())]
+            return out
+
+    def prometheusText(self):
+        lines = []
+        with self._lock:
+            lines += ["# HELP arena_span_seconds Time spent per action step",
+                      "# TYPE arena_span_seconds histogram"]
+            for (a, s), h in sorted(self.spans.items()):
+                lines += _histogramLines("arena_span_seconds", 'action="{}",span="{}"'.format(a, s), h)
+            lines += ["# HELP arena_confirm_rounds Rounds from submission to confirmation",
+                      "# TYPE arena_confirm_rounds histogram"]
+            for a, h in sorted(self.rounds.items()):
+                lines += _histogramLines("arena_confirm_rounds", 'action="{}"'.format(a), h)
+            lines += ["# HELP arena_actions_total Actions run, by outcome", "# TYPE arena_actions_total counter"]
+            lines += ['arena_actions_total{{action="{}",outcome="{}"}} {}'.format(a, o, n) for (a, o), n in sorted(self.actions.items())]
+            lines += ["# HELP arena_fees_microalgos_total Fees paid by confirmed actions", "# TYPE arena_fees_microalgos_total counter"]
+            lines += ['arena_fees_microalgos_total{{action="{}"}} {}'.format(a, n) for a, n in sorted(self.fees.items())]
+            lines += ["# HELP arena_inner_txns_total Inner txns run by confirmed actions", "# TYPE arena_inner_txns_total counter"]
+            lines += ['arena_inner_txns_total{{action="{}"}} {}'.format(a, n) for a, n in sorted(self.innerTxns.items())]
+        return "\n".join(lines) + "\n"
+
+
+def _histogramLines(name, labels, h):
+    lines = []
+    cumulative = 0
+    for bound, n in zip([str(b) for b in h.buckets] + ["+Inf"], h.counts):
+        cumulative += n
+        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+    lines.append("{}_sum{{{}}} {}".format(name, labels, round(h.sum, 6)))
+    lines.append("{}_count{{{}}} {}".format(name, labels, h.count))
+    return lines
+
+
+metrics = Metrics()
+_sink = None
+_sinkLock = threading.Lock()
+
+
+def enable(jsonlPath=None):
+    global _enabled, _sink
+    with _sinkLock:
+        if _sink is not None:
+            _sink.close()
+        _sink = open(jsonlPath, "a", encoding="utf-8") if jsonlPath else None
+    _enabled = True
+
+
+def disable():
+    global _enabled, _sink
+    _enabled = False
+    with _sinkLock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+def enabled():
+    return _enabled
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        record = getattr(_local, "action", None)
+        if record is not None:
+            record.spans[self.name] = record.spans.get(self.name, 0) + seconds
+        metrics.observeSpan(record.name if record is not None else "-", self.name, seconds)
+        return False
+
+
+def span(name):
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+class _ActionRecord:
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}
+        self.rounds = None
+        self.fee = 0
+        self.innerTxns = 0
+
+
+def _cost(txnOut, signedTxns, submittedRound):
+    rounds = txnOut["confirmed-round"] - submittedRound if submittedRound else None
+    return rounds, sum(t.transaction.fee for t in signedTxns), len(txnOut.get("inner-txns", []))
+
+
+# What a confirmation cost the current action: rounds since submittedRound (the
+# latest round known when it was sent, 0 if none was), fees, inner txns.
+def confirmed(txnOut, signedTxns, submittedRound):
+    if not _enabled:
+        return
+    rounds, fee, innerTxns = _cost(txnOut, signedTxns, submittedRound)
+    record = getattr(_local, "action", None)
+    if record is not None:
+        record.rounds = (record.rounds or 0) + (rounds or 0)
+        record.fee += fee
+        record.innerTxns += innerTxns
+    metrics.observeConfirmed(record.name if record is not None else "-", rounds, fee, innerTxns)
+
+
+# A pipelined submission is confirmed after its action has returned, so its
+# wait and cost are put down to that action when the future settles.
+def confirmedLater(future, signedTxns, submittedRound):
+    if not _enabled:
+        return
+    record = getattr(_local, "action", None)
+    name = record.name if record is not None else "-"
+    start = time.perf_counter()
+
+    def done(f):
+        if f.exception() is not None:
+            metrics.countAction(name, "rejected")
+            return
+        metrics.observeSpan(name, "confirm", time.perf_counter() - start)
+        metrics.observeConfirmed(name, *_cost(f.result(), signedTxns, submittedRound))
+    future.add_done_callback(done)
+
+
+# Runs fn as one traced action; nested helpers count towards the outer action.
+def traced(name):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled or getattr(_local, "action", None) is not None:
+                return fn(*args, **kwargs)
+            record = _local.action = _ActionRecord(name)
+            startedAt = time.time()
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                _local.action = None
+                seconds = time.perf_counter() - start
+                metrics.observeSpan(name, "total", seconds)
+                metrics.countAction(name, outcome)
+                if _sink is not None:
+                    _write({"action": name, "at": round(startedAt, 6), "outcome": outcome, "ms": round(seconds * 1000, 3),
+                            "spans": {k: round(v * 1000, 3) for k, v in record.spans.items()},
+                            "rounds": record.rounds, "fee": record.fee, "innerTxns": record.innerTxns})
+        return wrapper
+    return decorate
+
+
+def _write(line):
+    with _sinkLock:
+        if _sink is not None:
+            _sink.write(json.dumps(line) + "\n")
+            _sink.flush()
+
+
+# every histogram and counter, one JSON object per line
+def writeMetrics(path):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in metrics.records():
+            f.write(json.dumps(record) + "\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheusText().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Prometheus scrape endpoint at http://host:port/metrics, on a daemon thread
+def serveMetrics(port=9464, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
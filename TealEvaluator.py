@@ -0,0 +1,763 @@
+from base64 import b32decode
+
+from TealProfiler import parseTeal, APP_CALL_BUDGET, MAX_GROUP_SIZE
+
+
+UINT64_MAX = 2**64 - 1
+MAX_STACK_DEPTH = 1000
+MAX_BYTES_LENGTH = 4096
+MAX_BOX_NAME = 64
+# bytes of box I/O each box reference of a group buys
+BOX_REF_QUOTA = 1024
+
+TYPE_ENUMS = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+ON_COMPLETIONS = {"NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3, "UpdateApplication": 4, "DeleteApplication": 5}
+OC_OPT_IN = ON_COMPLETIONS["OptIn"]
+MIN_TXN_FEE = 1000
+
+_BINARY = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a // b,
+    "%": lambda a, b: a % b,
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "&&": lambda a, b: int(bool(a and b)),
+    "||": lambda a, b: int(bool(a or b)),
+    "&": lambda a, b: a & b,
+    "|": lambda a, b: a | b,
+    "^": lambda a, b: a ^ b,
+}
+
+
+# what an opcode returns to end the program
+_HALT = object()
+
+
+class TealReject(Exception):
+    def __init__(self, message, lineNo=None):
+        super().__init__(message if lineNo is None else "line {}: {}".format(lineNo, message))
+        self.lineNo = lineNo
+
+
+# rejected for what the call was given rather than for the program's logic: the
+# opcode budget, box references and quota, unavailable accounts or assets
+class ResourceReject(TealReject):
+    pass
+
+
+# The fields of one app call the program can read. Accounts are 32-byte public
+# keys, the sender is Accounts 0 as in the AVM; inner asset creates get ids
+# from firstAssetID on, the way the ledger numbers them.
+class AppCall:
+    def __init__(self, sender, appID, args=(), accounts=(), assets=(), onComplete=0, firstAssetID=1,
+                 groupIndex=0, groupSize=1):
+        self.sender = sender
+        self.appID = appID
+        self.args = [_toBytes(a) for a in args]
+        self.accounts = [sender] + list(accounts)
+        self.assets = list(assets)
+        self.onComplete = onComplete
+        self.firstAssetID = firstAssetID
+        self.groupIndex = groupIndex
+        self.groupSize = groupSize
+
+
+# The box references of one group, as (app id, name) pairs with the app index
+# resolved: which boxes its calls may touch, and the BOX_REF_QUOTA bytes of box
+# I/O each reference buys (empty ones included). A box is paid for once per
+# group, at its size when first touched.
+class BoxBudget:
+    def __init__(self, refs):
+        refs = list(refs)
+        self.names = set(refs)
+        self.quota = BOX_REF_QUOTA * len(refs)
+        self.used = 0
+        self._touched = set()
+
+    def touch(self, appID, name, size):
+        if (appID, name) not in self.names:
+            raise ResourceReject("box {!r} is not referenced by the group".format(name))
+        if (appID, name) not in self._touched:
+            self._touched.add((appID, name))
+            self.used += size
+            if self.used > self.quota:
+                raise ResourceReject("box read budget ({}) exceeded".format(self.quota))
+
+
+# What an approved call did: its cost, the global / local / box writes (a box
+# written as None was deleted) and the inner transactions, as field dicts with
+# "CreatedAssetID" added to asset creates.
+class Evaluation:
+    def __init__(self):
+        self.cost = 0
+        self.globals = {}
+        self.local = {}
+        self.boxes = {}
+        self.innerTxns = []
+
+
+# An app's state as plain dicts: global key -> value, account -> {key: value},
+# box name -> bytes. Any object with the same read methods can stand in for it
+# (LocalNode reads an ArenaEngine's state this way).
+class AppState:
+    def __init__(self, appID, appAddress, globals=None, local=None, boxes=None):
+        self.appID = appID
+        self.appAddress = appAddress
+        self.globals = dict(globals or {})
+        self.local = {k: dict(v) for k, v in (local or {}).items()}
+        self.boxes = {k: bytes(v) for k, v in (boxes or {}).items()}
+
+    def globalGet(self, key):
+        return self.globals.get(key)
+
+    def optedIn(self, account):
+        return account in self.local
+
+    def localGet(self, account, key):
+        return self.local[account].get(key)
+
+    def box(self, name):
+        return self.boxes.get(name)
+
+    def apply(self, evaluation):
+        self.globals.update(evaluation.globals)
+        for account, writes in evaluation.local.items():
+            local = self.local.setdefault(account, {})
+            for key, value in writes.items():
+                if value is None:
+                    local.pop(key, None)
+                else:
+                    local[key] = value
+        for name, value in evaluation.boxes.items():
+            if value is None:
+                self.boxes.pop(name, None)
+            else:
+                self.boxes[name] = bytes(value)
+
+
+# A parsed approval program. Every opcode is checked against the ones this
+# evaluator knows when the program is loaded, so an unsupported one fails there
+# and not half way through a call.
+class TealProgram:
+    def __init__(self, source):
+        if isinstance(source, bytes):
+            source = source.decode("utf-8")
+        self.version, self.labels, self.instrs = parseTeal(source)
+        # (op, args, line, cost, name) per instruction, with constants parsed and
+        # branch targets resolved
+        self.code = []
+        for ins in self.instrs:
+            if ins.op not in _OPS:
+                raise ValueError("line {}: opcode {} is not supported by TealEvaluator".format(ins.lineNo, ins.op))
+            args = ins.args
+            if ins.op in ("int", "pushint"):
+                args = [_parseInt(args[0])]
+            elif ins.op in ("byte", "pushbytes"):
+                args = [_parseBytes(args)]
+            elif ins.op in ("b", "bz", "bnz", "callsub"):
+                if args[0] not in self.labels:
+                    raise ValueError("line {}: unknown label {}".format(ins.lineNo, args[0]))
+                args = [self.labels[args[0]]]
+            self.code.append((_OPS[ins.op], args, ins.lineNo, ins.cost(), ins.op))
+
+    # Runs the program for call against state within budget (the app's share of
+    # a group's pooled budget), charging box access to boxBudget if given.
+    # Returns the Evaluation of an approved call, raises TealReject otherwise.
+    def evaluate(self, call, state, budget=APP_CALL_BUDGET, boxBudget=None):
+        return _Machine(self, call, state, budget, boxBudget).run()
+
+
+class _Machine:
+    def __init__(self, program, call, state, budget, boxBudget):
+        self.program = program
+        self.call = call
+        self.state = state
+        self.budget = budget
+        self.boxBudget = boxBudget
+
+        self.result = Evaluation()
+        self.stack = []
+        self.scratch = [0] * 256
+        self.frames = []
+        self.pc = 0
+        self.inner = None           # the inner group being built
+        self.nextAssetID = call.firstAssetID
+        self.boxCache = {}          # box name -> bytearray, or None for no box
+        self.line = None
+        # opting in allocates the sender's local state before the program runs
+        if call.onComplete == OC_OPT_IN:
+            self.result.local[call.sender] = {}
+
+    def run(self):
+        code = self.program.code
+        try:
+            while True:
+                if self.pc >= len(code):
+                    self._finish()
+                    break
+                op, args, self.line, cost, name = code[self.pc]
+                self.pc += 1
+                self.result.cost += cost
+                if self.result.cost > self.budget:
+                    raise ResourceReject("dynamic cost budget ({}) exceeded, executing {}".format(self.budget, name))
+                if op(self, args) is _HALT:
+                    break
+                if len(self.stack) > MAX_STACK_DEPTH:
+                    raise TealReject("stack overflow")
+        except TealReject as e:
+            if e.lineNo is None:
+                raise type(e)(str(e), self.line) from None
+            raise
+        self.result.boxes = {k: None if v is None else bytes(v) for k, v in self.result.boxes.items()}
+        return self.result
+
+    # the program ran off its end: a single non-zero uint64 left approves
+    def _finish(self):
+        if len(self.stack) != 1:
+            raise TealReject("stack len is {} instead of 1".format(len(self.stack)))
+        self._approve(self.pop())
+
+    def _approve(self, value):
+        if not isinstance(value, int):
+            raise TealReject("program returned bytes")
+        if value == 0:
+            raise TealReject("rejected by logic")
+
+
+    # stack
+
+    def pop(self):
+        if not self.stack:
+            raise TealReject("stack underflow")
+        return self.stack.pop()
+
+    def popInt(self):
+        value = self.pop()
+        if not isinstance(value, int):
+            raise TealReject("uint64 expected, got bytes")
+        return value
+
+    def popBytes(self):
+        value = self.pop()
+        if not isinstance(value, bytes):
+            raise TealReject("bytes expected, got uint64")
+        return value
+
+    def push(self, value):
+        if isinstance(value, int):
+            if not 0 <= value <= UINT64_MAX:
+                raise TealReject("uint64 {}".format("underflow" if value < 0 else "overflow"))
+        elif len(value) > MAX_BYTES_LENGTH:
+            raise TealReject("byte string longer than {}".format(MAX_BYTES_LENGTH))
+        self.stack.append(value)
+
+
+    # references
+
+    # an account by Accounts index or by address; either way it must be
+    # available to the call (the sender, Accounts, or the app itself)
+    def account(self, ref):
+        accounts = self.call.accounts
+        if isinstance(ref, int):
+            if ref >= len(accounts):
+                raise ResourceReject("invalid Accounts index {}".format(ref))
+            return accounts[ref]
+        if ref not in accounts and ref != self.state.appAddress:
+            raise ResourceReject("unavailable Account")
+        return ref
+
+    def asset(self, asaID):
+        if asaID not in self.call.assets and not self.call.firstAssetID <= asaID < self.nextAssetID:
+            raise ResourceReject("unavailable Asset {}".format(asaID))
+        return asaID
+
+    def localValue(self, account, key):
+        writes = self.result.local.get(account, {})
+        if key in writes:
+            return writes[key]
+        if not self._optedIn(account):
+            raise TealReject("account has not opted in to app {}".format(self.call.appID))
+        return self.state.localGet(account, key) if self.state.optedIn(account) else None
+
+    def _optedIn(self, account):
+        return account in self.result.local or self.state.optedIn(account) or \
+            (account == self.call.sender and self.call.onComplete == OC_OPT_IN)
+
+    def globalValue(self, key):
+        if key in self.result.globals:
+            return self.result.globals[key]
+        return self.state.globalGet(key)
+
+    # the current contents of a box, None if it doesn't exist; touching it
+    # charges the group's box budget. Writers mutate it and then setBox().
+    def box(self, name, createSize=None):
+        if not 1 <= len(name) <= MAX_BOX_NAME:
+            raise TealReject("box names are 1 to {} bytes".format(MAX_BOX_NAME))
+        if name not in self.boxCache:
+            value = self.state.box(name)
+            self.boxCache[name] = None if value is None else bytearray(value)
+        value = self.boxCache[name]
+        if self.boxBudget is not None:
+            self.boxBudget.touch(self.call.appID, name, len(value) if value is not None else createSize or 0)
+        return value
+
+    def setBox(self, name, value):
+        self.boxCache[name] = value
+        self.result.boxes[name] = value
+
+
+    # inner transactions
+
+    def submitInner(self):
+        if not self.inner:
+            raise TealReject("itxn_submit without itxn_begin")
+        if len(self.inner) > MAX_GROUP_SIZE:
+            raise TealReject("too many inner transactions in one group")
+        for fields in self.inner:
+            kind = fields.get("TypeEnum")
+            if kind == TYPE_ENUMS["acfg"]:
+                if "ConfigAsset" in fields:
+                    raise TealReject("only asset creates are supported")
+                fields["CreatedAssetID"] = self.nextAssetID
+                self.nextAssetID += 1
+            elif kind == TYPE_ENUMS["axfer"]:
+                self.asset(fields.get("XferAsset", 0))
+                for f in ("AssetSender", "AssetReceiver"):
+                    if f in fields:
+                        self.account(fields[f])
+            else:
+                raise TealReject("inner transaction type {} is not supported".format(kind))
+            self.result.innerTxns.append(fields)
+        self.inner = None
+
+
+def _toBytes(arg):
+    if isinstance(arg, int):
+        return arg.to_bytes(8, "big")
+    if isinstance(arg, str):
+        return arg.encode()
+    return bytes(arg)
+
+
+def _parseInt(token):
+    if token in TYPE_ENUMS:
+        return TYPE_ENUMS[token]
+    if token in ON_COMPLETIONS:
+        return ON_COMPLETIONS[token]
+    return int(token, 0)
+
+
+# "string" (with \n \t \\ \" \xNN escapes), 0x hex, or base32 / base64 forms
+def _parseBytes(args):
+    token = args[0]
+    if token.startswith('"'):
+        out = bytearray()
+        body = token[1:-1].encode("utf-8")
+        i = 0
+        while i < len(body):
+            c = body[i]
+            if c == 0x5c:
+                nxt = chr(body[i + 1])
+                if nxt == "x":
+                    out.append(int(body[i + 2:i + 4], 16))
+                    i += 4
+                    continue
+                out += {"n": b"\n", "r": b"\r", "t": b"\t", "\\": b"\\", '"': b'"'}[nxt]
+                i += 2
+                continue
+            out.append(c)
+            i += 1
+        return bytes(out)
+    if token.startswith("0x"):
+        return bytes.fromhex(token[2:])
+    if token in ("base32", "b32"):
+        return b32decode(args[1] + "=" * (-len(args[1]) % 8))
+    raise ValueError("unsupported byte constant " + " ".join(args))
+
+
+def _txnField(m, field):
+    call = m.call
+    fields = {
+        "Sender": lambda: call.sender,
+        "ApplicationID": lambda: call.appID,
+        "OnCompletion": lambda: call.onComplete,
+        "NumAppArgs": lambda: len(call.args),
+        "NumAccounts": lambda: len(call.accounts) - 1,
+        "NumAssets": lambda: len(call.assets),
+        "GroupIndex": lambda: call.groupIndex,
+        "TypeEnum": lambda: TYPE_ENUMS["appl"],
+    }
+    if field not in fields:
+        raise TealReject("txn field {} is not supported".format(field))
+    return fields[field]()
+
+
+def _txnArray(m, field, i):
+    arrays = {"ApplicationArgs": m.call.args, "Accounts": m.call.accounts, "Assets": m.call.assets}
+    if field not in arrays:
+        raise TealReject("txn array {} is not supported".format(field))
+    array = arrays[field]
+    if i >= len(array):
+        err = TealReject if field == "ApplicationArgs" else ResourceReject
+        raise err("invalid {} index {}".format(field, i))
+    return array[i]
+
+
+def _global(m, field):
+    fields = {
+        "CurrentApplicationID": lambda: m.call.appID,
+        "CurrentApplicationAddress": lambda: m.state.appAddress,
+        "ZeroAddress": lambda: bytes(32),
+        "GroupSize": lambda: m.call.groupSize,
+        "MinTxnFee": lambda: MIN_TXN_FEE,
+    }
+    if field not in fields:
+        raise TealReject("global {} is not supported".format(field))
+    return fields[field]()
+
+
+def _binary(op):
+    f = _BINARY[op]
+
+    def run(m, args):
+        b = m.popInt()
+        a = m.popInt()
+        if op in ("/", "%") and b == 0:
+            raise TealReject("{} by zero".format(op))
+        m.push(f(a, b))
+    return run
+
+
+def _equals(negate):
+    def run(m, args):
+        b = m.pop()
+        a = m.pop()
+        if type(a) is not type(b):
+            raise TealReject("cannot compare uint64 to bytes")
+        m.push(int((a == b) != negate))
+    return run
+
+
+def _branch(op):
+    def run(m, args):
+        if op == "b" or (m.popInt() == 0) == (op == "bz"):
+            m.pc = args[0]
+    return run
+
+
+def _btoi(m, args):
+    value = m.popBytes()
+    if len(value) > 8:
+        raise TealReject("btoi arg too long, got {} bytes".format(len(value)))
+    m.push(int.from_bytes(value, "big"))
+
+
+def _extract(value, start, length):
+    if start + length > len(value):
+        raise TealReject("extraction end {} is beyond length {}".format(start + length, len(value)))
+    return value[start:start + length]
+
+
+def _extractConst(m, args):
+    value = m.popBytes()
+    start, length = int(args[0]), int(args[1])
+    if length == 0:
+        if start > len(value):
+            raise TealReject("extraction start {} is beyond length {}".format(start, len(value)))
+        length = len(value) - start
+    m.push(_extract(value, start, length))
+
+
+def _extract3(m, args):
+    length = m.popInt()
+    start = m.popInt()
+    m.push(_extract(m.popBytes(), start, length))
+
+
+def _extractUint64(m, args):
+    start = m.popInt()
+    m.push(int.from_bytes(_extract(m.popBytes(), start, 8), "big"))
+
+
+def _getbyte(m, args):
+    i = m.popInt()
+    value = m.popBytes()
+    if i >= len(value):
+        raise TealReject("getbyte index {} beyond length {}".format(i, len(value)))
+    m.push(value[i])
+
+
+def _dig(m, args):
+    n = int(args[0])
+    if n >= len(m.stack):
+        raise TealReject("dig {} with stack len {}".format(n, len(m.stack)))
+    m.push(m.stack[-1 - n])
+
+
+def _cover(m, args):
+    n = int(args[0])
+    if n >= len(m.stack):
+        raise TealReject("cover {} with stack len {}".format(n, len(m.stack)))
+    m.stack.insert(len(m.stack) - 1 - n, m.stack.pop())
+
+
+def _uncover(m, args):
+    n = int(args[0])
+    if n >= len(m.stack):
+        raise TealReject("uncover {} with stack len {}".format(n, len(m.stack)))
+    m.stack.append(m.stack.pop(-1 - n))
+
+
+def _popn(m, args):
+    for _ in range(int(args[0])):
+        m.pop()
+
+
+def _swap(m, args):
+    b = m.pop()
+    a = m.pop()
+    m.stack += [b, a]
+
+
+def _dup(m, args):
+    value = m.pop()
+    m.stack += [value, value]
+
+
+def _dup2(m, args):
+    b = m.pop()
+    a = m.pop()
+    m.stack += [a, b, a, b]
+
+
+def _store(m, args):
+    m.scratch[int(args[0])] = m.pop()
+
+
+def _callsub(m, args):
+    m.frames.append(m.pc)
+    m.pc = args[0]
+
+
+def _retsub(m, args):
+    if not m.frames:
+        raise TealReject("retsub with empty callstack")
+    m.pc = m.frames.pop()
+
+
+def _return(m, args):
+    m._approve(m.popInt())
+    return _HALT
+
+
+def _err(m, args):
+    raise TealReject("err opcode executed")
+
+
+def _assert(m, args):
+    if m.popInt() == 0:
+        raise TealReject("assert failed")
+
+
+def _appGlobalGet(m, args):
+    value = m.globalValue(m.popBytes())
+    m.push(0 if value is None else value)
+
+
+def _appGlobalPut(m, args):
+    value = m.pop()
+    m.result.globals[m.popBytes()] = value
+
+
+def _appLocalGet(m, args):
+    key = m.popBytes()
+    value = m.localValue(m.account(m.pop()), key)
+    m.push(0 if value is None else value)
+
+
+def _appLocalPut(m, args):
+    value = m.pop()
+    key = m.popBytes()
+    account = m.account(m.pop())
+    if not m._optedIn(account):
+        raise TealReject("account has not opted in to app {}".format(m.call.appID))
+    m.result.local.setdefault(account, {})[key] = value
+
+
+def _appLocalDel(m, args):
+    key = m.popBytes()
+    account = m.account(m.pop())
+    if not m._optedIn(account):
+        raise TealReject("account has not opted in to app {}".format(m.call.appID))
+    m.result.local.setdefault(account, {})[key] = None
+
+
+def _appOptedIn(m, args):
+    app = m.popInt()
+    account = m.account(m.pop())
+    if app not in (0, m.call.appID):
+        raise TealReject("only the current app's opt-ins are modelled")
+    m.push(int(m._optedIn(account)))
+
+
+def _boxCreate(m, args):
+    size = m.popInt()
+    name = m.popBytes()
+    if size > 32768:
+        raise TealReject("box size {} too large".format(size))
+    box = m.box(name, size)
+    if box is not None:
+        if len(box) != size:
+            raise TealReject("box size mismatch {} {}".format(len(box), size))
+        m.push(0)
+        return
+    m.setBox(name, bytearray(size))
+    m.push(1)
+
+
+def _boxGet(m, args):
+    box = m.box(m.popBytes())
+    if box is None:
+        m.stack += [b"", 0]
+    else:
+        m.push(bytes(box))
+        m.push(1)
+
+
+def _boxLen(m, args):
+    box = m.box(m.popBytes())
+    m.stack += [0, 0] if box is None else [len(box), 1]
+
+
+def _boxPut(m, args):
+    value = m.popBytes()
+    name = m.popBytes()
+    box = m.box(name, len(value))
+    if box is not None and len(box) != len(value):
+        raise TealReject("box_put wrong size {} != {}".format(len(value), len(box)))
+    m.setBox(name, bytearray(value))
+
+
+def _boxDel(m, args):
+    name = m.popBytes()
+    existed = m.box(name) is not None
+    m.setBox(name, None)
+    m.push(int(existed))
+
+
+def _existingBox(m, name):
+    box = m.box(name)
+    if box is None:
+        raise TealReject("no such box")
+    return box
+
+
+def _boxExtract(m, args):
+    length = m.popInt()
+    start = m.popInt()
+    box = _existingBox(m, m.popBytes())
+    m.push(bytes(_extract(box, start, length)))
+
+
+def _boxReplace(m, args):
+    value = m.popBytes()
+    start = m.popInt()
+    name = m.popBytes()
+    box = _existingBox(m, name)
+    if start + len(value) > len(box):
+        raise TealReject("replacement end {} beyond length {}".format(start + len(value), len(box)))
+    box[start:start + len(value)] = value
+    m.setBox(name, box)
+
+
+def _itxnBegin(m, args):
+    if m.inner is not None:
+        raise TealReject("itxn_begin without itxn_submit")
+    m.inner = [{}]
+
+
+def _itxnNext(m, args):
+    if m.inner is None:
+        raise TealReject("itxn_next without itxn_begin")
+    m.inner.append({})
+
+
+def _itxnField(m, args):
+    if m.inner is None:
+        raise TealReject("itxn_field without itxn_begin")
+    m.inner[-1][args[0]] = m.pop()
+
+
+def _itxn(m, args):
+    if not m.result.innerTxns:
+        raise TealReject("no inner transaction submitted")
+    fields = m.result.innerTxns[-1]
+    if args[0] not in fields:
+        raise TealReject("inner transaction field {} is not supported".format(args[0]))
+    m.push(fields[args[0]])
+
+
+_OPS = {
+    "int": lambda m, a: m.push(a[0]),
+    "pushint": lambda m, a: m.push(a[0]),
+    "byte": lambda m, a: m.push(a[0]),
+    "pushbytes": lambda m, a: m.push(a[0]),
+    "txn": lambda m, a: m.push(_txnField(m, a[0])),
+    "txna": lambda m, a: m.push(_txnArray(m, a[0], int(a[1]))),
+    "txnas": lambda m, a: m.push(_txnArray(m, a[0], m.popInt())),
+    "global": lambda m, a: m.push(_global(m, a[0])),
+    "==": _equals(False),
+    "!=": _equals(True),
+    "!": lambda m, a: m.push(int(m.popInt() == 0)),
+    "~": lambda m, a: m.push(UINT64_MAX ^ m.popInt()),
+    "btoi": _btoi,
+    "itob": lambda m, a: m.push(m.popInt().to_bytes(8, "big")),
+    "len": lambda m, a: m.push(len(m.popBytes())),
+    "concat": lambda m, a: m.push(b"".join(reversed([m.popBytes(), m.popBytes()]))),
+    "bzero": lambda m, a: m.push(bytes(m.popInt())),
+    "extract": _extractConst,
+    "extract3": _extract3,
+    "extract_uint64": _extractUint64,
+    "getbyte": _getbyte,
+    "dup": _dup,
+    "dup2": _dup2,
+    "dig": _dig,
+    "swap": _swap,
+    "pop": lambda m, a: m.pop(),
+    "popn": _popn,
+    "cover": _cover,
+    "uncover": _uncover,
+    "load": lambda m, a: m.push(m.scratch[int(a[0])]),
+    "store": _store,
+    "b": _branch("b"),
+    "bz": _branch("bz"),
+    "bnz": _branch("bnz"),
+    "callsub": _callsub,
+    "retsub": _retsub,
+    "return": _return,
+    "err": _err,
+    "assert": _assert,
+    "app_global_get": _appGlobalGet,
+    "app_global_put": _appGlobalPut,
+    "app_local_get": _appLocalGet,
+    "app_local_put": _appLocalPut,
+    "app_local_del": _appLocalDel,
+    "app_opted_in": _appOptedIn,
+    "box_create": _boxCreate,
+    "box_get": _boxGet,
+    "box_len": _boxLen,
+    "box_put": _boxPut,
+    "box_del": _boxDel,
+    "box_extract": _boxExtract,
+    "box_replace": _boxReplace,
+    "itxn_begin": _itxnBegin,
+    "itxn_next": _itxnNext,
+    "itxn_field": _itxnField,
+    "itxn_submit": lambda m, a: m.submitInner(),
+    "itxn": _itxn,
+}
+_OPS.update({op: _binary(op) for op in _BINARY})
@@ -0,0 +1,414 @@
+import argparse
+import json
+import math
+import re
+import sys
+
+from ArenaCodec import MAX_MONSTERS_PER_CALL
+
+
+APPROVAL_SRC = "contracts/ApprovalProgram.teal"
+
+# opcode budget of one app call; app calls in the same group pool theirs
+APP_CALL_BUDGET = 700
+MAX_GROUP_SIZE = 16
+
+# AVM opcode costs that differ from 1 (v8)
+OPCODE_COSTS = {
+    "sha256": 35, "keccak256": 130, "sha512_256": 45, "sha3_256": 130,
+    "ed25519verify": 1900, "ed25519verify_bare": 1900,
+    "ecdsa_verify": 1700, "ecdsa_pk_decompress": 650, "ecdsa_pk_recover": 2000,
+    "vrf_verify": 5700, "sqrt": 4, "bsqrt": 40, "divmodw": 20, "expw": 10,
+    "b+": 10, "b-": 10, "b*": 20, "b/": 20, "b%": 20,
+    "b|": 6, "b&": 6, "b^": 6, "b~": 4,
+}
+
+# Iterations (taken back edges) of the contract's loops, keyed by the loop
+# header label, as (worst, typical) expressions of the live monster count n of
+# the shard the call works on (at most 170 per shard).
+# findMonsterIndex scans slot by slot: the last slot takes n-1 back edges.
+# playerKillMonster only scans without a slot hint (its :scan row below).
+DEFAULT_LOOP_BOUNDS = {
+    "monsterSearchLoop": ("n - 1", "(n - 1) / 2"),
+    # appendMonsters runs once per monster of the batch, whatever n is; a full
+    # batch unless the method says otherwise (METHOD_LOOP_BOUNDS)
+    "mintLoop": (str(MAX_MONSTERS_PER_CALL - 1), str(MAX_MONSTERS_PER_CALL - 1)),
+    "recordLoop": (str(MAX_MONSTERS_PER_CALL - 1), str(MAX_MONSTERS_PER_CALL - 1)),
+    # playerMove runs once per path segment (at most 16); most paths are one leg
+    "moveLoop": ("15", "0"),
+}
+
+# Per method overrides of DEFAULT_LOOP_BOUNDS, for loops whose trip count
+# depends on the method that reaches them. addMonster appends exactly one
+# monster; addMonsters callers (AppTestAndDeploy.addMonsters) fill whole
+# batches, so a full one is typical too.
+METHOD_LOOP_BOUNDS = {
+    "addMonster": {"mintLoop": ("0", "0"), "recordLoop": ("0", "0")},
+    "addMonsters": {"mintLoop": (str(MAX_MONSTERS_PER_CALL - 1), str(MAX_MONSTERS_PER_CALL - 1)),
+                    "recordLoop": (str(MAX_MONSTERS_PER_CALL - 1), str(MAX_MONSTERS_PER_CALL - 1))},
+}
+
+# Methods priced as more than one row, one per way through them: row name ->
+# labels that way never reaches. A hinted kill finds its monster at the slot
+# or fails; only a kill without a hint scans the shard.
+METHOD_VARIANTS = {
+    "playerKillMonster": {"playerKillMonster": ("killScan",), "playerKillMonster:scan": ("killHinted",)},
+}
+
+DEFAULT_MONSTER_COUNTS = (0, 1, 10, 50, 100, 170)
+
+# subroutines reported on their own even while no method calls them yet
+DEFAULT_SUBROUTINES = ("getMonsterLen", "appendMonsters", "findMonsterIndex", "checkDistInRange")
+
+BRANCHES = {"b", "bz", "bnz"}
+TERMINATORS = {"b", "return", "err", "retsub"}
+
+
+class Instr:
+    def __init__(self, lineNo, op, args):
+        self.lineNo = lineNo
+        self.op = op
+        self.args = args
+
+    def cost(self):
+        return OPCODE_COSTS.get(self.op, 1)
+
+
+class Block:
+    def __init__(self, index, labels):
+        self.index = index
+        self.labels = labels
+        self.instrs = []
+        self.succs = []
+        self.callee = None
+
+    def cost(self):
+        return sum(i.cost() for i in self.instrs)
+
+    @property
+    def last(self):
+        return self.instrs[-1] if self.instrs else None
+
+    # empty labels fall through, so the last label names the code that follows
+    def name(self):
+        return self.labels[-1] if self.labels else "@{}".format(self.instrs[0].lineNo if self.instrs else self.index)
+
+
+def _stripComment(line):
+    inString = False
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c == '"' and (i == 0 or line[i - 1] != "\\"):
+            inString = not inString
+        elif not inString and line.startswith("//", i):
+            return line[:i]
+        i += 1
+    return line
+
+
+def parseTeal(source):
+    version = None
+    labels = {}
+    instrs = []
+    for lineNo, raw in enumerate(source.splitlines(), 1):
+        line = _stripComment(raw).strip()
+        if not line:
+            continue
+        if line.startswith("#pragma"):
+            parts = line.split()
+            if len(parts) >= 3 and parts[1] == "version":
+                version = int(parts[2])
+            continue
+        label = re.match(r"^(\S+):$", line)
+        if label:
+            labels[label.group(1)] = len(instrs)
+            continue
+        parts = re.findall(r'"(?:\\.|[^"\\])*"|\S+', line)
+        instrs.append(Instr(lineNo, parts[0], parts[1:]))
+    return version, labels, instrs
+
+
+# basic blocks over the instruction list, with branch / fallthrough edges
+class Program:
+    def __init__(self, source):
+        self.version, self.labelIndex, self.instrs = parseTeal(source)
+
+        leaders = {0} | set(self.labelIndex.values())
+        for i, ins in enumerate(self.instrs):
+            if ins.op in BRANCHES or ins.op in TERMINATORS or ins.op in ("callsub", "switch", "match"):
+                leaders.add(i + 1)
+        leaders = sorted(l for l in leaders if l <= len(self.instrs))
+
+        labelsAt = {}
+        for name, idx in self.labelIndex.items():
+            labelsAt.setdefault(idx, []).append(name)
+
+        self.blocks = []
+        self.blockAt = {}
+        for n, start in enumerate(leaders):
+            end = leaders[n + 1] if n + 1 < len(leaders) else len(self.instrs)
+            if start == end and start not in labelsAt:
+                continue
+            block = Block(len(self.blocks), labelsAt.get(start, []))
+            block.instrs = self.instrs[start:end]
+            self.blockAt[start] = block
+            self.blocks.append(block)
+        self.byLabel = {name: self.blockAt[idx] for name, idx in self.labelIndex.items()}
+
+        for n, block in enumerate(self.blocks):
+            nxt = self.blocks[n + 1] if n + 1 < len(self.blocks) else None
+            last = block.last
+            op = last.op if last else None
+            if op in ("b", "bz", "bnz"):
+                block.succs.append(self._target(last, last.args[0]))
+            elif op in ("switch", "match"):
+                block.succs.extend(self._target(last, a) for a in last.args)
+            elif op == "callsub":
+                block.callee = self._target(last, last.args[0])
+            # running off the end of the program just fails the call
+            if op not in TERMINATORS and nxt is not None:
+                block.succs.append(nxt)
+
+    def subroutines(self, extra=()):
+        labels = [b.callee.name() for b in self.blocks if b.callee is not None]
+        labels += [l for l in extra if l in self.byLabel]
+        return [self.byLabel[l] for l in dict.fromkeys(labels)]
+
+    def _target(self, ins, label):
+        if label not in self.byLabel:
+            raise ValueError("line {}: unknown label {}".format(ins.lineNo, label))
+        return self.byLabel[label]
+
+    # dispatched methods: pushbytes "m" / txna ApplicationArgs 0 / == / bnz label
+    def entryPoints(self):
+        entries = []
+        for block in self.blocks:
+            ins = block.instrs
+            if len(ins) >= 4 and ins[-1].op == "bnz" and ins[-2].op == "==" and \
+                    ins[-3].op == "txna" and ins[-3].args == ["ApplicationArgs", "0"] and \
+                    ins[-4].op in ("pushbytes", "byte") and ins[-4].args[0].startswith('"'):
+                entries.append((ins[-4].args[0].strip('"'), block, self.byLabel[ins[-1].args[0]]))
+        return entries
+
+
+def _evalBound(expr, n):
+    return max(0, math.ceil(eval(expr, {"__builtins__": {}}, {"n": n})))
+
+
+# Longest (most expensive) path through the CFG from a block. Loops add
+# bound * (cost of one trip round the loop) at their header; subroutine calls
+# add the callee's own worst case. Blocks labelled in avoid are never entered.
+class CostModel:
+    def __init__(self, program, n, mode, loopBounds, defaultBound="n", avoid=()):
+        self.program = program
+        self.n = n
+        self.mode = 0 if mode == "worst" else 1
+        self.loopBounds = loopBounds
+        self.defaultBound = defaultBound
+        self.avoid = set(avoid)
+        self.unboundedLoops = set()
+        self.strayRetsubs = set()
+        self._regions = {}
+        self._subCosts = {}
+
+    def _region(self, root, inSub):
+        key = (root.index, inSub)
+        if key not in self._regions:
+            # back edges of a DFS from the root; their targets are loop headers
+            back = set()
+            state = {root.index: 1}
+            stack = [(root, iter(root.succs))]
+            while stack:
+                block, it = stack[-1]
+                nxt = next(it, None)
+                if nxt is None:
+                    state[block.index] = 2
+                    stack.pop()
+                elif state.get(nxt.index) == 1:
+                    back.add((block.index, nxt.index))
+                elif nxt.index not in state:
+                    state[nxt.index] = 1
+                    stack.append((nxt, iter(nxt.succs)))
+            headers = {}
+            for src, dst in back:
+                headers.setdefault(dst, []).append(src)
+            self._regions[key] = (back, headers, inSub, {})
+        return self._regions[key]
+
+    def _loopBound(self, header):
+        for label in header.labels:
+            if label in self.loopBounds:
+                return _evalBound(self.loopBounds[label][self.mode], self.n)
+        self.unboundedLoops.add(header.name())
+        return _evalBound(self.defaultBound, self.n)
+
+    def subroutineCost(self, block):
+        if block.index not in self._subCosts:
+            self._subCosts[block.index] = 0     # recursion guard
+            self._subCosts[block.index] = self.cost(block, inSub=True)
+        return self._subCosts[block.index]
+
+    def _blockCost(self, block, inSub):
+        c = block.cost()
+        if block.callee is not None:
+            c += self.subroutineCost(block.callee)
+        if block.last is not None and block.last.op == "retsub" and not inSub:
+            self.strayRetsubs.add(block.name())
+        return c
+
+    # worst cost from root to any exit, or to the end of block sink
+    def cost(self, root, inSub=False, sink=None):
+        region = self._region(root, inSub)
+        result = self._longest(region, root, None if sink is None else sink.index, None)
+        return result or 0
+
+    def _longest(self, region, block, sink, skipLoopAt):
+        back, headers, inSub, memo = region
+        key = (block.index, sink, skipLoopAt)
+        if key in memo:
+            return memo[key]
+
+        total = self._blockCost(block, inSub)
+        if block.index in headers and block.index != skipLoopAt:
+            # one trip round the loop: header back to the source of a back edge
+            trips = [self._longest(region, block, src, block.index) for src in headers[block.index]]
+            total += self._loopBound(block) * max((t for t in trips if t is not None), default=0)
+
+        if sink == block.index:
+            result = total
+        else:
+            subs = [self._longest(region, nxt, sink, skipLoopAt)
+                    for nxt in block.succs if (block.index, nxt.index) not in back and not self.avoid & set(nxt.labels)]
+            if sink is None:
+                result = total + max(subs, default=0)
+            else:
+                subs = [c for c in subs if c is not None]
+                result = total + max(subs) if subs else None
+        memo[key] = result
+        return result
+
+
+# loopBounds (e.g. from --loop) win over the defaults, per method ones included
+def profile(source, monsterCounts=DEFAULT_MONSTER_COUNTS, loopBounds=None, subroutines=DEFAULT_SUBROUTINES):
+    program = Program(source)
+    bounds = dict(DEFAULT_LOOP_BOUNDS)
+    bounds.update(loopBounds or {})
+
+    report = {"version": program.version, "budget": APP_CALL_BUDGET, "entries": {}, "subroutines": {}, "warnings": []}
+    for sub in program.subroutines(subroutines):
+        report["subroutines"][sub.name()] = {
+            mode: {str(n): CostModel(program, n, mode, bounds).subroutineCost(sub) for n in monsterCounts}
+            for mode in ("worst", "typical")}
+
+    start = program.blocks[0]
+    for method, dispatchBlock, target in program.entryPoints():
+        methodBounds = dict(DEFAULT_LOOP_BOUNDS)
+        methodBounds.update(METHOD_LOOP_BOUNDS.get(method, {}))
+        methodBounds.update(loopBounds or {})
+        for rowName, avoid in METHOD_VARIANTS.get(method, {method: ()}).items():
+            for label in avoid:
+                if label not in program.byLabel:
+                    _warn(report, "{}: no label {} to price the row without".format(rowName, label))
+            row = {"worst": {}, "typical": {}}
+            for mode in ("worst", "typical"):
+                for n in monsterCounts:
+                    # the walk to the dispatch block also visits other methods' branches;
+                    # only what the method itself reaches is worth a warning
+                    row["dispatch"] = CostModel(program, n, mode, bounds).cost(start, sink=dispatchBlock)
+                    model = CostModel(program, n, mode, methodBounds, avoid=avoid)
+                    row[mode][str(n)] = row["dispatch"] + model.cost(target)
+                    for name in sorted(model.unboundedLoops):
+                        _warn(report, "{}: loop at {} has no bound, assumed n iterations".format(rowName, name))
+                    for name in sorted(model.strayRetsubs):
+                        _warn(report, "{}: reaches retsub in {} outside a subroutine call".format(rowName, name))
+            worst = max(row["worst"].values())
+            row["appCallsNeeded"] = max(1, math.ceil(worst / APP_CALL_BUDGET))
+            row["needsPooling"] = worst > APP_CALL_BUDGET
+            if row["appCallsNeeded"] > MAX_GROUP_SIZE:
+                _warn(report, "{}: needs {} app calls of budget, more than a group holds".format(rowName, row["appCallsNeeded"]))
+            report["entries"][rowName] = row
+    return report
+
+
+def _warn(report, msg):
+    if msg not in report["warnings"]:
+        report["warnings"].append(msg)
+
+
+def compare(old, new, tolerance=0):
+    regressions = []
+    for section in ("entries", "subroutines"):
+        for name, row in new.get(section, {}).items():
+            before = old.get(section, {}).get(name)
+            if before is None:
+                continue
+            for mode in ("worst", "typical"):
+                for n, cost in row[mode].items():
+                    prev = before[mode].get(n)
+                    if prev is not None and cost > prev + tolerance:
+                        regressions.append((name, mode, int(n), prev, cost))
+    return regressions
+
+
+def formatReport(report):
+    rows = list(report["entries"].values()) + list(report.get("subroutines", {}).values())
+    counts = rows[0]["worst"].keys() if rows else []
+    header = "{:<24}{:>9}".format("method", "dispatch") + "".join("{:>9}".format("n=" + n) for n in counts) + "  calls"
+    lines = ["TEAL v{}, budget {} per app call (worst case / typical)".format(report["version"], report["budget"]), header]
+    for method, row in report["entries"].items():
+        for mode in ("worst", "typical"):
+            name = method if mode == "worst" else ""
+            line = "{:<24}{:>9}".format(name, row["dispatch"] if mode == "worst" else "")
+            line += "".join("{:>9}".format(row[mode][n]) for n in counts)
+            if mode == "worst":
+                line += "  {}{}".format(row["appCallsNeeded"], "  POOL" if row["needsPooling"] else "")
+            lines.append(line)
+    for name, row in report.get("subroutines", {}).items():
+        for mode in ("worst", "typical"):
+            line = "{:<24}{:>9}".format(name + "()" if mode == "worst" else "", "")
+            lines.append(line + "".join("{:>9}".format(row[mode][n]) for n in counts))
+    for w in report["warnings"]:
+        lines.append("warning: " + w)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Static opcode-cost profile of a TEAL approval program")
+    parser.add_argument("source", nargs="?", default=APPROVAL_SRC)
+    parser.add_argument("--monsters", default=",".join(map(str, DEFAULT_MONSTER_COUNTS)),
+                        help="comma separated live monster counts to evaluate")
+    parser.add_argument("--loop", action="append", default=[],
+                        help="loop bound as LABEL=WORST[;TYPICAL], expressions of n")
+    parser.add_argument("--sub", action="append", default=list(DEFAULT_SUBROUTINES),
+                        help="also report this subroutine label")
+    parser.add_argument("--json", help="write the report as JSON to this file")
+    parser.add_argument("--compare", help="fail if any cost grew against this JSON report")
+    parser.add_argument("--tolerance", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    bounds = {}
+    for spec in args.loop:
+        label, exprs = spec.split("=", 1)
+        worst, _, typical = exprs.partition(";")
+        bounds[label] = (worst, typical or worst)
+
+    with open(args.source, "r", encoding="utf-8") as f:
+        report = profile(f.read(), [int(n) for n in args.monsters.split(",")], bounds, args.sub)
+    print(formatReport(report))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for method, mode, n, prev, cost in regressions:
+            print("regression: {} {} at n={}: {} -> {}".format(method, mode, n, prev, cost))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())